@@ -0,0 +1,139 @@
+import json
+import os
+from typing import Any, Callable, Dict, Generic, List, TypeVar
+
+from RAG.config import get_float_env
+from RAG.hnsw import get_embed_dim
+
+# Registries of the model backends VectorDB runs on, selected by EMBED_BACKEND, RERANK_BACKEND and
+# LLM_BACKEND. Besides the production models there are deterministic offline stand-ins (RAG/stubs.py)
+# for benchmarks, profiling and CI; RAG_STUB_BACKENDS=true makes them the default for all three.
+# Model libraries are imported by the factory that needs them, so the stubs run without them.
+
+T = TypeVar("T")
+
+EMBED_INSTRUCTION = "Given a Discord search query, retrieve relevant passages that answer the query"
+RERANK_TOP_N = 5
+
+
+def stub_backends_enabled() -> bool:
+    return os.getenv("RAG_STUB_BACKENDS", "false").lower() in ("1", "true", "yes")
+
+
+class BackendRegistry(Generic[T]):
+    """Named factories for one kind of backend; `build` picks one from an env var"""
+
+    def __init__(self, kind: str, env_var: str, default: Callable[[], str]):
+        self.kind = kind
+        self.env_var = env_var
+        self._default = default
+        self._factories: Dict[str, Callable[[], T]] = {}
+
+    def register(self, name: str) -> Callable[[Callable[[], T]], Callable[[], T]]:
+        def decorator(factory: Callable[[], T]) -> Callable[[], T]:
+            self._factories[name] = factory
+            return factory
+        return decorator
+
+    def names(self) -> List[str]:
+        return list(self._factories)
+
+    def selected(self) -> str:
+        name = (os.getenv(self.env_var) or self._default()).lower()
+        if name not in self._factories:
+            raise ValueError(f"Unknown {self.env_var} '{name}'. Choose one of: {', '.join(self.names())}")
+        return name
+
+    def build(self) -> T:
+        name = self.selected()
+        print(f"Using {name} {self.kind} backend")
+        return self._factories[name]()
+
+
+EMBED_BACKENDS: BackendRegistry[Any] = BackendRegistry(
+    "embedding", "EMBED_BACKEND", lambda: "hash" if stub_backends_enabled() else "huggingface"
+)
+RERANK_BACKENDS: BackendRegistry[Any] = BackendRegistry(
+    "reranking", "RERANK_BACKEND", lambda: "lexical" if stub_backends_enabled() else "sentence_transformer"
+)
+# LLM factories return (llm, model name shown in the agent prompt)
+LLM_BACKENDS: BackendRegistry[tuple[Any, str]] = BackendRegistry(
+    "LLM", "LLM_BACKEND", lambda: "scripted" if stub_backends_enabled() else ("openai" if os.getenv("OPENAI_API_KEY") else "ollama")
+)
+
+
+@EMBED_BACKENDS.register("huggingface")
+def _huggingface_embedding():
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name="Qwen/Qwen3-Embedding-0.6B", query_instruction=EMBED_INSTRUCTION)
+
+
+@EMBED_BACKENDS.register("hash")
+def _hash_embedding():
+    from RAG.stubs import HashEmbedding
+    return HashEmbedding(dim=get_embed_dim(), latency_ms=get_float_env("STUB_EMBED_LATENCY_MS", 0.0))
+
+
+@RERANK_BACKENDS.register("sentence_transformer")
+def _sentence_transformer_rerank():
+    from llama_index.core.postprocessor import SentenceTransformerRerank
+    return SentenceTransformerRerank(model="BAAI/bge-reranker-v2-m3", top_n=RERANK_TOP_N)
+
+
+@RERANK_BACKENDS.register("lexical")
+def _lexical_rerank():
+    from RAG.stubs import LexicalRerank
+    return LexicalRerank(top_n=RERANK_TOP_N, latency_ms=get_float_env("STUB_RERANK_LATENCY_MS", 0.0))
+
+
+@RERANK_BACKENDS.register("none")
+def _no_rerank():
+    # llm_response passes retrieved nodes through unchanged
+    return None
+
+
+@LLM_BACKENDS.register("openai")
+def _openai_llm():
+    from llama_index.llms.openai import OpenAI
+    model = os.getenv("OPENAI_MODEL", "gpt-5-mini")
+    llm = OpenAI(
+        model=model,
+        api_base=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_retries=3,
+        request_timeout=60.0,
+    )
+    return llm, model
+
+
+@LLM_BACKENDS.register("ollama")
+def _ollama_llm():
+    from llama_index.llms.ollama import Ollama
+    model = os.getenv("OLLAMA_MODEL", "gpt-oss:20b")
+    llm = Ollama(
+        model=model,
+        base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+        request_timeout=60.0,
+    )
+    return llm, model
+
+
+def load_llm_script() -> List[dict]:
+    """Steps for the scripted LLM from STUB_LLM_SCRIPT: a JSON list, or the path of a file holding one"""
+    raw_value = os.getenv("STUB_LLM_SCRIPT", "")
+    if not raw_value:
+        return []
+    if os.path.isfile(raw_value):
+        with open(raw_value, "r") as f:
+            raw_value = f.read()
+
+    script = json.loads(raw_value)
+    if not isinstance(script, list):
+        raise ValueError("STUB_LLM_SCRIPT must be a JSON list of steps")
+    return script
+
+
+@LLM_BACKENDS.register("scripted")
+def _scripted_llm():
+    from RAG.stubs import ScriptedLLM
+    return ScriptedLLM(script=load_llm_script(), latency_ms=get_float_env("STUB_LLM_LATENCY_MS", 0.0)), "scripted"
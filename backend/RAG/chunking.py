@@ -0,0 +1,189 @@
+import os
+import re
+from typing import Any, Callable, Iterable, Iterator, List, Sequence
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser, SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.utils import get_tokenizer, get_tqdm_iterable
+
+# Structure-aware chunking of the markdown rendered by NotionPageExporter.
+# Blocks are packed into chunks up to a token budget; headings start a new chunk, and tables and
+# code fences stay whole unless a single one is over budget, in which case it is split by rows or
+# lines with the table header / fence repeated. Every chunk is prefixed with the page title,
+# author and heading path, so a chunk read on its own still says where it came from.
+
+HEADING_PATTERN = re.compile(r"^(#{1,6}) +(.*)$")
+TABLE_SEPARATOR_PATTERN = re.compile(r"^\|(\s*:?-+:?\s*\|)+$")
+PAGE_TEXT_PATTERN = re.compile(r"^Title: (.*)\nAuthor: (.*)\nContent: ", re.DOTALL)
+
+MIN_BODY_TOKENS = 32
+
+
+def get_notion_chunk_tokens() -> int:
+    """Return the token budget of a Notion chunk, prefix included (NOTION_CHUNK_TOKENS, default 512)"""
+    raw_value = os.getenv("NOTION_CHUNK_TOKENS")
+    if raw_value is None or raw_value == "":
+        return 512
+
+    try:
+        return max(int(raw_value), MIN_BODY_TOKENS * 2)
+    except ValueError:
+        print(f"Invalid NOTION_CHUNK_TOKENS value '{raw_value}'. Falling back to 512.")
+        return 512
+
+
+def split_markdown_blocks(text: str) -> Iterator[str]:
+    """Split rendered markdown on blank lines, keeping fenced code blocks whole"""
+    pending: List[str] = []
+    open_fences = 0
+    for part in text.split("\n\n"):
+        pending.append(part)
+        open_fences += sum(1 for line in part.split("\n") if line.lstrip().startswith("```"))
+        # an odd number of fence lines means the code block continues past this blank line
+        if open_fences % 2 == 0:
+            yield "\n\n".join(pending)
+            pending = []
+            open_fences = 0
+    if pending:
+        yield "\n\n".join(pending)
+
+
+def parse_page_text(text: str) -> tuple[str, str, str]:
+    """Split the `Title/Author/Content` text of a Notion document into its parts"""
+    match = PAGE_TEXT_PATTERN.match(text)
+    if match is None:
+        return "", "", text
+    return match.group(1), match.group(2), text[match.end():]
+
+
+class NotionMarkdownChunker:
+    """Streams chunks out of Notion page sections (see NotionPageExporter.iter_page_sections)"""
+
+    def __init__(self, chunk_size: int = 512, metadata_str: str = "", tokenizer: Callable[[str], list] | None = None):
+        self.chunk_size = chunk_size
+        self.tokenizer = tokenizer or get_tokenizer()
+        # metadata is prepended to every chunk at embedding time
+        self.metadata_tokens = self.count(metadata_str) if metadata_str else 0
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    @staticmethod
+    def prefix(title: str, author: str, heading_path: List[str]) -> str:
+        lines = [f"Title: {title}", f"Author: {author}"]
+        if heading_path:
+            lines.append(f"Section: {' > '.join(heading_path)}")
+        return "\n".join(lines) + "\nContent: "
+
+    def iter_chunks(self, title: str, author: str, sections: Iterable[str]) -> Iterator[str]:
+        """Yield chunks as sections arrive; only the chunk being filled is buffered"""
+        headings: List[tuple[int, str]] = []
+        prefix = self.prefix(title, author, [])
+        budget = self._body_budget(prefix)
+        body: List[str] = []
+        body_tokens = 0
+
+        for section in sections:
+            for block in split_markdown_blocks(section):
+                if not block.strip():
+                    continue
+
+                heading = HEADING_PATTERN.match(block)
+                if heading is not None and "\n" not in block:
+                    if body:
+                        yield prefix + "\n\n".join(body)
+                        body, body_tokens = [], 0
+                    level = len(heading.group(1))
+                    headings = [(depth, name) for depth, name in headings if depth < level]
+                    headings.append((level, heading.group(2).strip()))
+                    # the heading path is in the prefix, so the heading line itself is not repeated
+                    prefix = self.prefix(title, author, [name for _, name in headings])
+                    budget = self._body_budget(prefix)
+                    continue
+
+                tokens = self.count(block)
+                if body and body_tokens + tokens + 1 > budget:
+                    yield prefix + "\n\n".join(body)
+                    body, body_tokens = [], 0
+
+                if tokens <= budget:
+                    body.append(block)
+                    body_tokens += tokens + (1 if len(body) > 1 else 0)
+                else:
+                    for piece in self._split_oversized(block, budget):
+                        yield prefix + piece
+
+        if body:
+            yield prefix + "\n\n".join(body)
+
+    def _body_budget(self, prefix: str) -> int:
+        return max(self.chunk_size - self.count(prefix) - self.metadata_tokens, MIN_BODY_TOKENS)
+
+    def _split_oversized(self, block: str, budget: int) -> List[str]:
+        lines = block.split("\n")
+        if lines[0].lstrip().startswith("```") and len(lines) > 2 and lines[-1].strip() == "```":
+            # re-open the fence in every piece so each one is valid markdown
+            return self._pack_lines(lines[1:-1], budget, head=[lines[0]], tail=["```"])
+        if all(line.lstrip().startswith("|") for line in lines):
+            # repeat the header row and separator in every piece
+            header = lines[:2] if len(lines) > 2 and TABLE_SEPARATOR_PATTERN.match(lines[1].strip()) else []
+            return self._pack_lines(lines[len(header):], budget, head=header)
+        return self._split_text(block, budget)
+
+    def _pack_lines(self, lines: List[str], budget: int, head: Sequence[str] = (), tail: Sequence[str] = ()) -> List[str]:
+        head, tail = list(head), list(tail)
+        frame_tokens = self.count("\n".join(head + tail)) + 2
+        line_budget = max(budget - frame_tokens, MIN_BODY_TOKENS)
+        pieces: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+
+        def emit() -> None:
+            if current:
+                pieces.append("\n".join(head + current + tail))
+
+        for line in lines:
+            tokens = self.count(line) + 1
+            if tokens > line_budget:
+                # a single row / line over budget is split as plain text
+                emit()
+                current, current_tokens = [], 0
+                pieces.extend("\n".join(head + [part] + tail) for part in self._split_text(line, line_budget))
+                continue
+            if current and current_tokens + tokens > line_budget:
+                emit()
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += tokens
+        emit()
+        return pieces
+
+    def _split_text(self, text: str, budget: int) -> List[str]:
+        splitter = SentenceSplitter(
+            chunk_size=budget,
+            chunk_overlap=min(20, budget // 5),
+            tokenizer=self.tokenizer,
+        )
+        return splitter.split_text(text)
+
+
+class NotionNodeParser(NodeParser):
+    """Node parser for Notion documents built by VectorDB.build_notion_page"""
+
+    chunk_size: int = Field(default=512, description="Token budget per chunk, including the title/section prefix.")
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        all_nodes: List[BaseNode] = []
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing Notion pages"):
+            title, author, content = parse_page_text(node.get_content(metadata_mode=MetadataMode.NONE))
+            metadata_str = max(
+                node.get_metadata_str(mode=MetadataMode.EMBED),
+                node.get_metadata_str(mode=MetadataMode.LLM),
+                key=len
+            )
+            chunker = NotionMarkdownChunker(self.chunk_size, metadata_str=metadata_str)
+            splits = list(chunker.iter_chunks(title, author, [content]))
+            all_nodes.extend(build_nodes_from_splits(splits, node, id_func=self.id_func))
+        return all_nodes
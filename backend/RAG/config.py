@@ -0,0 +1,29 @@
+import os
+
+# Numeric settings read from the environment. An unset or empty variable gives the default, and an
+# unparsable one is reported and also falls back to the default, so a typo in .env never stops the
+# backend from starting.
+
+
+def get_int_env(name: str, default: int) -> int:
+    raw_value = os.getenv(name)
+    if raw_value is None or raw_value == "":
+        return default
+
+    try:
+        return int(raw_value)
+    except ValueError:
+        print(f"Invalid {name} value '{raw_value}'. Falling back to {default}.")
+        return default
+
+
+def get_float_env(name: str, default: float) -> float:
+    raw_value = os.getenv(name)
+    if raw_value is None or raw_value == "":
+        return default
+
+    try:
+        return float(raw_value)
+    except ValueError:
+        print(f"Invalid {name} value '{raw_value}'. Falling back to {default}.")
+        return default
@@ -0,0 +1,156 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from RAG.sync_state import lock_notion_pages
+
+# Diff the Discord vector table against discord_text by message id.
+# Every check is a single set operation (EXCEPT / GROUP BY) so it stays one scan per table
+# no matter how far the two stores have drifted.
+
+DISCORD_VECTOR_TABLE = "data_discord_embeddings"
+
+# message ids covered by embedding rows: single-message rows carry messageId, conversation-window
+# rows (DISCORD_INDEX_MODE=window) list their members in messageIds
+EMBEDDED_MESSAGE_IDS_SQL = f"""
+    SELECT metadata_ ->> 'messageId' FROM {DISCORD_VECTOR_TABLE} WHERE metadata_ ->> 'messageId' IS NOT NULL
+    UNION ALL
+    SELECT jsonb_array_elements_text(metadata_ -> 'messageIds') FROM {DISCORD_VECTOR_TABLE} WHERE metadata_ -> 'messageIds' IS NOT NULL
+"""
+
+# messages stored in discord_text without any embedding row (the pre-embedding filter's rejects have none on purpose)
+MISSING_VECTORS_SQL = f"""
+    SELECT message_id FROM discord_text WHERE filter_reason IS NULL
+    EXCEPT
+    {EMBEDDED_MESSAGE_IDS_SQL}
+"""
+
+# embedding rows whose message is not in discord_text
+ORPHAN_VECTORS_SQL = f"""
+    {EMBEDDED_MESSAGE_IDS_SQL}
+    EXCEPT
+    SELECT message_id FROM discord_text
+"""
+
+# messages embedded more than once (a long message split into chunks shares one ref_doc_id)
+DUPLICATE_VECTORS_SQL = f"""
+    SELECT metadata_ ->> 'messageId'
+    FROM {DISCORD_VECTOR_TABLE}
+    WHERE metadata_ ->> 'messageId' IS NOT NULL
+    GROUP BY metadata_ ->> 'messageId'
+    HAVING COUNT(DISTINCT metadata_ ->> 'ref_doc_id') > 1
+"""
+
+
+def _summarize(conn, diff_sql: str, sample_size: int) -> dict[str, int | list[str]]:
+    row = conn.execute(
+        text(f"SELECT COUNT(*) AS total, (ARRAY_AGG(message_id))[1:CAST(:sample_size AS INT)] AS sample FROM ({diff_sql}) AS diff (message_id)"),
+        {"sample_size": sample_size}
+    ).one()
+    return {"count": int(row.total), "sample": list(row.sample or [])}
+
+
+def diff_discord_stores(engine: Engine, sample_size: int = 20) -> dict[str, dict[str, int | list[str]]]:
+    """Return counts (and a sample of message ids) of missing, orphaned and duplicated embeddings.
+
+    All three checks read one REPEATABLE READ snapshot so concurrent writes cannot skew the report.
+    """
+    with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn, conn.begin():
+        return {
+            "missing_vectors": _summarize(conn, MISSING_VECTORS_SQL, sample_size),
+            "orphan_vectors": _summarize(conn, ORPHAN_VECTORS_SQL, sample_size),
+            "duplicate_vectors": _summarize(conn, DUPLICATE_VECTORS_SQL, sample_size),
+        }
+
+
+def delete_orphan_vectors(engine: Engine) -> int:
+    """Delete embedding rows of messages that are no longer in discord_text.
+
+    A window row listing an orphan is deleted as a whole; its remaining members then show up as
+    missing and the repair embeds their window again.
+    """
+    with engine.begin() as conn:
+        result = conn.execute(text(f"""
+            DELETE FROM {DISCORD_VECTOR_TABLE}
+            WHERE metadata_ ->> 'messageId' IN ({ORPHAN_VECTORS_SQL})
+               OR EXISTS (
+                   SELECT 1 FROM jsonb_array_elements_text(metadata_ -> 'messageIds') AS member (message_id)
+                   WHERE member.message_id IN ({ORPHAN_VECTORS_SQL})
+               )
+        """))
+    return result.rowcount
+
+
+def delete_duplicate_vectors(engine: Engine) -> int:
+    """Keep only the most recently inserted document of each message and delete older copies"""
+    with engine.begin() as conn:
+        result = conn.execute(text(f"""
+            DELETE FROM {DISCORD_VECTOR_TABLE} AS vectors
+            USING (
+                SELECT DISTINCT ON (metadata_ ->> 'messageId')
+                    metadata_ ->> 'messageId' AS message_id,
+                    metadata_ ->> 'ref_doc_id' AS ref_doc_id
+                FROM {DISCORD_VECTOR_TABLE}
+                WHERE metadata_ ->> 'messageId' IN ({DUPLICATE_VECTORS_SQL})
+                ORDER BY metadata_ ->> 'messageId', id DESC
+            ) AS latest
+            WHERE vectors.metadata_ ->> 'messageId' = latest.message_id
+              AND vectors.metadata_ ->> 'ref_doc_id' IS DISTINCT FROM latest.ref_doc_id
+        """))
+    return result.rowcount
+
+
+def fetch_messages_missing_vectors(engine: Engine, limit: int | None = None) -> list:
+    """Return discord_text rows that have no embedding rows (for re-embedding)"""
+    query = f"""
+        SELECT
+            message_id, channel_id, server_id, sender_id,
+            sender_username, sender_nickname, channel_name,
+            content, created_at, window_id
+        FROM discord_text
+        WHERE message_id IN ({MISSING_VECTORS_SQL})
+        ORDER BY created_at
+    """
+    params = {}
+    if limit is not None:
+        query += " LIMIT :limit"
+        params["limit"] = limit
+
+    with engine.connect() as conn:
+        return conn.execute(text(query), params).fetchall()
+
+
+# Notion pages are only ever added or replaced by the importer; pages deleted or archived in Notion
+# are found by diffing the stored page ids against a full workspace listing.
+
+NOTION_VECTOR_TABLE = "data_notion_embeddings"
+
+# stored page ids that are not in the live listing (served by the pageId expression index)
+STALE_NOTION_PAGES_SQL = f"""
+    SELECT metadata_ ->> 'pageId' FROM {NOTION_VECTOR_TABLE} WHERE metadata_ ->> 'pageId' IS NOT NULL
+    EXCEPT
+    SELECT UNNEST(CAST(:live_page_ids AS TEXT[]))
+"""
+
+
+def find_stale_notion_pages(engine: Engine, live_page_ids: set[str]) -> list[str]:
+    """Return stored Notion page ids that are missing from `live_page_ids`"""
+    with engine.connect() as conn:
+        return list(conn.execute(text(STALE_NOTION_PAGES_SQL), {"live_page_ids": sorted(live_page_ids)}).scalars())
+
+
+def delete_notion_pages(engine: Engine, page_ids: list[str], batch_size: int = 500) -> int:
+    """Delete every embedding row (and the sync state) of `page_ids`, one transaction per batch"""
+    deleted = 0
+    for start in range(0, len(page_ids), batch_size):
+        batch = {"page_ids": page_ids[start:start + batch_size]}
+        with engine.begin() as conn:
+            # waits for an index of the same page to commit, so its rows are deleted too
+            lock_notion_pages(conn, batch["page_ids"])
+            result = conn.execute(
+                text(f"DELETE FROM {NOTION_VECTOR_TABLE} WHERE metadata_ ->> 'pageId' = ANY(:page_ids)"),
+                batch
+            )
+            # a restored page must be exported again even if its edit time did not move
+            conn.execute(text("DELETE FROM notion_sync_state WHERE page_id = ANY(:page_ids)"), batch)
+        deleted += result.rowcount
+    return deleted
@@ -0,0 +1,184 @@
+import re
+from typing import Callable, List, Sequence
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore
+
+from RAG.config import get_float_env, get_int_env
+from RAG.minhash import MinHasher
+
+# Assembles the "Context from knowledge base" of the agent prompt from the reranked nodes, in rank
+# order: near-duplicate passages (MinHash similarity of their content >= CONTEXT_DUPLICATE_THRESHOLD,
+# e.g. a Discord message uploaded twice or overlapping Notion chunks) are dropped, passages longer
+# than CONTEXT_PASSAGE_TOKENS are cut to their span sharing the most words with the query, and
+# passages stop once CONTEXT_MAX_TOKENS would be exceeded. Dropped nodes are also dropped from the
+# sources, so <reference id="N"/> keeps pointing at sources[N-1].
+
+# "Title: ...\nAuthor: ...\nContent: " (Notion) and "Channel: ...\nSender: ...\nContent: " (Discord)
+CONTENT_MARKER = "Content: "
+# sentence ends and line breaks; the separator stays with the segment before it
+SEGMENT_PATTERN = re.compile(r"[^\n.!?]*(?:[.!?]+\s*|\n+|$)")
+QUERY_WORD_PATTERN = re.compile(r"\w{3,}")
+ELLIPSIS = "…"
+
+
+def split_passage(text_value: str) -> tuple[str, str]:
+    """(header, body) of a node text; the header (title/channel lines) is never cut"""
+    index = text_value.find(CONTENT_MARKER)
+    if index < 0:
+        return "", text_value
+    index += len(CONTENT_MARKER)
+    return text_value[:index], text_value[index:]
+
+
+class PackedContext:
+    """Passages that went into the prompt, their nodes, and what packing saved"""
+
+    def __init__(self):
+        self.nodes: List[NodeWithScore] = []
+        self.passages: List[str] = []
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.dropped_duplicates = 0
+        self.dropped_over_budget = 0
+        self.truncated = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def context_str(self) -> str:
+        return "".join(f"Source {i + 1}:\n{passage}\n\n" for i, passage in enumerate(self.passages))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "saved_tokens": self.saved_tokens,
+            "dropped_duplicates": self.dropped_duplicates,
+            "dropped_over_budget": self.dropped_over_budget,
+            "truncated": self.truncated,
+        }
+
+
+class ContextPacker:
+    """Fits reranked nodes into a token budget (0 disables a limit, a threshold above 1 disables dedupe)"""
+
+    def __init__(
+        self,
+        tokenizer: Callable[[str], List],
+        max_tokens: int = 4000,
+        passage_tokens: int = 512,
+        duplicate_threshold: float = 0.9,
+        min_passage_tokens: int = 48,
+        minhasher: MinHasher | None = None,
+    ):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.passage_tokens = passage_tokens
+        self.duplicate_threshold = duplicate_threshold
+        # a passage cut shorter than this to fit the remaining budget is dropped instead
+        self.min_passage_tokens = min_passage_tokens
+        self.minhasher = minhasher or MinHasher()
+
+    def count(self, text_value: str) -> int:
+        return len(self.tokenizer(text_value))
+
+    def truncate(self, query: str, text_value: str, max_tokens: int) -> str:
+        """Cut `text_value` to at most `max_tokens` around the run of sentences that mentions the query most"""
+        header, body = split_passage(text_value)
+        budget = max_tokens - self.count(header) - 2  # room for the ellipses
+        segments = [segment for segment in SEGMENT_PATTERN.findall(body) if segment]
+        if budget <= 0 or not segments:
+            return header
+
+        query_words = set(QUERY_WORD_PATTERN.findall(query.lower()))
+        counts = [self.count(segment) for segment in segments]
+        scores = [len(query_words & set(QUERY_WORD_PATTERN.findall(segment.lower()))) for segment in segments]
+
+        # start from the segment sharing the most query words (the first one if none does) and grow
+        # towards the more relevant neighbour while the span fits, so it is centred on the match
+        best = int(np.argmax(scores))
+        if counts[best] > budget:
+            # the segment alone is too long: keep its start
+            span = self.tokenizer(segments[best])[:budget]
+            prefix = ELLIPSIS if best > 0 else ""
+            return f"{header}{prefix}{self._decode(span, segments[best])}{ELLIPSIS}"
+
+        best_start, best_end, tokens = best, best + 1, counts[best]
+        while True:
+            grown_before, grown_after = best - best_start, best_end - best - 1
+            candidates = []
+            if best_start > 0 and tokens + counts[best_start - 1] <= budget:
+                candidates.append((scores[best_start - 1], grown_after - grown_before, -1))
+            if best_end < len(segments) and tokens + counts[best_end] <= budget:
+                candidates.append((scores[best_end], grown_before - grown_after, 1))
+            if not candidates:
+                break
+            # the higher-scoring neighbour, else the side the span has grown less on
+            _, _, side = max(candidates)
+            if side < 0:
+                best_start -= 1
+                tokens += counts[best_start]
+            else:
+                tokens += counts[best_end]
+                best_end += 1
+
+        span = "".join(segments[best_start:best_end]).strip()
+        prefix = ELLIPSIS if best_start > 0 else ""
+        suffix = ELLIPSIS if best_end < len(segments) else ""
+        return f"{header}{prefix}{span}{suffix}"
+
+    def _decode(self, tokens: Sequence, original: str) -> str:
+        # the default tokenizer is tiktoken's encode; fall back to a word cut for other tokenizers
+        decode = getattr(getattr(self.tokenizer, "__self__", None), "decode", None)
+        if decode is not None:
+            return decode(list(tokens))
+        return " ".join(original.split()[:len(tokens)])
+
+    def pack(self, query: str, nodes: Sequence[NodeWithScore]) -> PackedContext:
+        packed = PackedContext()
+        signatures = []
+        remaining = self.max_tokens if self.max_tokens > 0 else None
+
+        for node in nodes:
+            text_value = node.node.text
+            tokens = self.count(text_value)
+            packed.tokens_before += tokens
+
+            if self.duplicate_threshold <= 1:
+                signature = self.minhasher.signature(split_passage(text_value)[1])
+                if signatures and self.minhasher.max_similarity(signature, np.stack(signatures)) >= self.duplicate_threshold:
+                    packed.dropped_duplicates += 1
+                    continue
+
+            limit = self.passage_tokens if self.passage_tokens > 0 else tokens
+            if remaining is not None:
+                limit = min(limit, remaining)
+            if tokens > limit:
+                if limit < self.min_passage_tokens:
+                    packed.dropped_over_budget += 1
+                    continue
+                text_value = self.truncate(query, text_value, limit)
+                tokens = self.count(text_value)
+                packed.truncated += 1
+
+            if self.duplicate_threshold <= 1:
+                signatures.append(signature)
+            packed.nodes.append(node)
+            packed.passages.append(text_value)
+            packed.tokens_after += tokens
+            if remaining is not None:
+                remaining -= tokens
+
+        return packed
+
+
+def get_context_packer(tokenizer: Callable[[str], List]) -> ContextPacker:
+    """Return the packer configured by CONTEXT_* env vars"""
+    return ContextPacker(
+        tokenizer,
+        max_tokens=max(get_int_env("CONTEXT_MAX_TOKENS", 4000), 0),
+        passage_tokens=max(get_int_env("CONTEXT_PASSAGE_TOKENS", 512), 0),
+        duplicate_threshold=get_float_env("CONTEXT_DUPLICATE_THRESHOLD", 0.9),
+    )
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from RAG.config import get_int_env
+
+# One sync and one async engine per process. The vector stores and the relational queries share
+# them, so the pool sizes below bound the total number of Postgres connections the backend opens.
+
+
+def _connection_parts() -> tuple[str, str, str, str]:
+    """Read Postgres credentials and location from the environment."""
+    PG_USER = os.getenv("POSTGRES_USER", "postgres")
+    PG_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
+    PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
+    PG_PORT = os.getenv("POSTGRES_PORT", "5432")
+    return PG_USER, PG_PASSWORD, PG_HOST, PG_PORT
+
+
+def get_connection_string() -> str:
+    """Return the sync (psycopg2) connection string for the RAG database."""
+    user, password, host, port = _connection_parts()
+    return f"postgresql://{user}:{password}@{host}:{port}/postgres"
+
+
+def get_async_connection_string() -> str:
+    """Return the async (asyncpg) connection string for the RAG database."""
+    user, password, host, port = _connection_parts()
+    return f"postgresql+asyncpg://{user}:{password}@{host}:{port}/postgres"
+
+
+def get_pool_kwargs() -> dict[str, int | bool]:
+    """Return create_engine pool settings from the environment (applied to each engine)"""
+    return {
+        "pool_size": get_int_env("DB_POOL_SIZE", 5),
+        "max_overflow": get_int_env("DB_MAX_OVERFLOW", 5),
+        "pool_timeout": get_int_env("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": get_int_env("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+    }
+
+
+class PoolMetrics:
+    """Thread-safe checkout counters for one connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_checkout(self, wait_seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def record_timeout(self, wait_seconds: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def snapshot(self) -> dict[str, int | float]:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "total_wait_seconds": round(self.total_wait_seconds, 6),
+                "avg_wait_ms": round(self.total_wait_seconds / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+SYNC_POOL_METRICS = PoolMetrics()
+ASYNC_POOL_METRICS = PoolMetrics()
+
+
+class _TimedPoolMixin:
+    """Record how long each checkout waited for a free (or new) connection"""
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    metrics = SYNC_POOL_METRICS
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = ASYNC_POOL_METRICS
+
+
+_engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Return the process-wide sync engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(get_connection_string(), poolclass=TimedQueuePool, **get_pool_kwargs())
+        return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """Return the process-wide async (asyncpg) engine"""
+    global _async_engine
+    with _engine_lock:
+        if _async_engine is None:
+            _async_engine = create_async_engine(get_async_connection_string(), poolclass=TimedAsyncQueuePool, **get_pool_kwargs())
+        return _async_engine
+
+
+def _pool_usage(pool: QueuePool | None) -> dict[str, int | float]:
+    if pool is None:
+        return {}
+
+    size = pool.size()
+    checked_out = pool.checkedout()
+    capacity = size + max(pool._max_overflow, 0)
+    return {
+        "size": size,
+        "max_overflow": pool._max_overflow,
+        "checked_out": checked_out,
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "utilization": round(checked_out / capacity, 3) if capacity else 0.0,
+    }
+
+
+def get_pool_stats() -> dict[str, dict[str, int | float]]:
+    """Return utilization and checkout wait-time metrics for both pools"""
+    return {
+        "sync": {
+            **_pool_usage(_engine.pool if _engine is not None else None),
+            **SYNC_POOL_METRICS.snapshot(),
+        },
+        "async": {
+            **_pool_usage(_async_engine.sync_engine.pool if _async_engine is not None else None),
+            **ASYNC_POOL_METRICS.snapshot(),
+        },
+    }
+
+
+async def dispose_engines() -> None:
+    """Close all pooled connections of both engines"""
+    if _engine is not None:
+        _engine.dispose()
+    if _async_engine is not None:
+        await _async_engine.dispose()
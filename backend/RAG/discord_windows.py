@@ -0,0 +1,111 @@
+import os
+from typing import Callable, Dict, List, Sequence
+
+from llama_index.core import Document
+
+from models import MessageJson
+from RAG.config import get_float_env, get_int_env
+
+# Conversation windows: consecutive messages of one channel embedded as a single document instead
+# of one document per message. A window grows while messages arrive within
+# DISCORD_WINDOW_GAP_SECONDS of the previous one and its text stays within DISCORD_WINDOW_TOKENS;
+# the next message then opens a new window. A window's id is the id of the message that opened it
+# and is stored per message in discord_text.window_id, so edits and deletes can find the window
+# to rebuild. Windows are contiguous and do not overlap; each message belongs to exactly one.
+
+DISCORD_INDEX_MODES = ("message", "window")
+
+# metadata that identifies a window but carries no meaning for the embedding or the LLM
+WINDOW_EXCLUDED_METADATA_KEYS = ["windowId", "messageIds", "startTime", "endTime"]
+
+
+def get_discord_index_mode() -> str:
+    """Return how Discord messages are embedded: one document per `message` (default) or per `window`"""
+    mode = os.getenv("DISCORD_INDEX_MODE", "message").lower()
+    if mode not in DISCORD_INDEX_MODES:
+        print(f"Invalid DISCORD_INDEX_MODE value '{mode}'. Falling back to message.")
+        return "message"
+    return mode
+
+
+def get_window_gap_seconds() -> float:
+    """Return the longest pause between two messages of the same window (DISCORD_WINDOW_GAP_SECONDS, default 600)"""
+    return max(get_float_env("DISCORD_WINDOW_GAP_SECONDS", 600.0), 0.0)
+
+
+def get_window_tokens() -> int:
+    """Return the token budget of a window's text (DISCORD_WINDOW_TOKENS, default 384)"""
+    return max(get_int_env("DISCORD_WINDOW_TOKENS", 384), 32)
+
+
+def message_line(message: MessageJson) -> str:
+    sender = message.data.senderNickname if message.data.senderNickname else message.data.senderUsername
+    return f"[{message.metadata.dateTime:%Y-%m-%d %H:%M}] {sender}: {message.data.content}"
+
+
+class WindowAssigner:
+    """Splits the messages of one channel into windows by time gap and token budget"""
+
+    def __init__(self, gap_seconds: float, max_tokens: int, tokenizer: Callable[[str], List]):
+        self.gap_seconds = gap_seconds
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+
+    def count_tokens(self, message: MessageJson) -> int:
+        # +1 for the newline joining the line to the window
+        return len(self.tokenizer(message_line(message))) + 1
+
+    def assign(self, messages: Sequence[MessageJson], open_window: Sequence[MessageJson] = (), open_window_id: str | None = None) -> Dict[str, List[MessageJson]]:
+        """Group `messages` (one channel, any order) into windows; returns {window id: members in time order}.
+
+        `open_window` holds the stored members of the channel's newest window. New messages that
+        continue it (within the gap and budget) are appended to it, so its id comes back with the
+        extended member list; a backfilled message older than the open window never joins it.
+        """
+        windows: Dict[str, List[MessageJson]] = {}
+        current: List[MessageJson] = list(open_window) if open_window_id is not None else []
+        current_id = open_window_id if current else None
+        current_tokens = sum(self.count_tokens(message) for message in current)
+        # the open window only needs rebuilding once something was appended to it
+        extended = False
+
+        for message in sorted(messages, key=lambda message: message.metadata.dateTime):
+            tokens = self.count_tokens(message)
+            if current:
+                gap = (message.metadata.dateTime - current[-1].metadata.dateTime).total_seconds()
+                if gap < 0 or gap > self.gap_seconds or current_tokens + tokens > self.max_tokens:
+                    if current_id != open_window_id or extended:
+                        windows[current_id] = current
+                    current, current_tokens = [], 0
+
+            if not current:
+                current_id = message.metadata.messageId
+            elif current_id == open_window_id:
+                extended = True
+            current.append(message)
+            current_tokens += tokens
+
+        if current and (current_id != open_window_id or extended):
+            windows[current_id] = current
+        return windows
+
+
+def build_window_document(window_id: str, messages: Sequence[MessageJson]) -> Document:
+    """One document for a window; `messages` must be in time order"""
+    first = messages[0]
+    doc_text = f"Channel: {first.data.channelName}\n"
+    doc_text += "\n".join(message_line(message) for message in messages)
+
+    return Document(
+        text=doc_text,
+        metadata={
+            "serverId": first.metadata.serverId,
+            "channelId": first.metadata.channelId,
+            "windowId": window_id,
+            "messageIds": [message.metadata.messageId for message in messages],
+            "startTime": first.metadata.dateTime.isoformat(),
+            "endTime": messages[-1].metadata.dateTime.isoformat(),
+        },
+        excluded_embed_metadata_keys=WINDOW_EXCLUDED_METADATA_KEYS,
+        excluded_llm_metadata_keys=WINDOW_EXCLUDED_METADATA_KEYS,
+    )
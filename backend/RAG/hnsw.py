@@ -0,0 +1,235 @@
+import os
+import re
+from enum import Enum
+
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from models import SearchProfile
+from RAG.config import get_int_env
+
+
+class VectorStorage(Enum):
+    """How embeddings are represented in the HNSW index.
+
+    The table always keeps the full-precision `vector` column; the quantized layouts index an
+    expression over it and rescore oversampled candidates against the full vector.
+    """
+    FLOAT32 = "float32"
+    HALFVEC = "halfvec"
+    BINARY = "binary"
+
+
+class HNSWBuildParams(BaseModel):
+    """Parameters used when (re)building an HNSW index"""
+    m: int = 16
+    ef_construction: int = 64
+    storage: VectorStorage = VectorStorage.FLOAT32
+    # Matryoshka prefix length to index; None indexes every dimension
+    index_dim: int | None = None
+
+
+class HNSWSearchParams(BaseModel):
+    """Per-query HNSW search settings applied as transaction-local GUCs"""
+    ef_search: int
+    # pgvector >= 0.8: off, strict_order or relaxed_order
+    iterative_scan: str = "off"
+    max_scan_tuples: int = 20000
+
+    def as_store_kwargs(self) -> dict[str, int | str]:
+        """Return the settings as kwargs understood by TunedPGVectorStore"""
+        return {
+            "hnsw_ef_search": self.ef_search,
+            "hnsw_iterative_scan": self.iterative_scan,
+            "hnsw_max_scan_tuples": self.max_scan_tuples,
+        }
+
+
+ITERATIVE_SCAN_MODES = ("off", "strict_order", "relaxed_order")
+
+
+def get_vector_storage() -> VectorStorage:
+    """Return the configured index storage layout"""
+    raw_value = os.getenv("VECTOR_STORAGE", VectorStorage.FLOAT32.value)
+    try:
+        return VectorStorage(raw_value)
+    except ValueError:
+        print(f"Invalid VECTOR_STORAGE value '{raw_value}'. Falling back to float32.")
+        return VectorStorage.FLOAT32
+
+
+def get_rescore_oversample() -> int:
+    """Return how many candidates per result quantized layouts fetch before rescoring"""
+    return max(get_int_env("VECTOR_RESCORE_OVERSAMPLE", 4), 1)
+
+
+def get_rescore_enabled() -> bool:
+    """Return whether first-stage candidates are rescored against the full-precision vectors"""
+    return os.getenv("VECTOR_RESCORE", "true").lower() not in ("0", "false", "no")
+
+
+def get_embed_dim() -> int:
+    """Return the full embedding dimension produced by the embedding model"""
+    return get_int_env("EMBED_DIM", 1024)
+
+
+def get_index_dim(embed_dim: int) -> int | None:
+    """Return the Matryoshka prefix length to index, or None to index every dimension"""
+    index_dim = get_int_env("EMBED_INDEX_DIM", embed_dim)
+    if index_dim <= 0 or index_dim > embed_dim:
+        print(f"Invalid EMBED_INDEX_DIM value '{index_dim}'. Indexing all {embed_dim} dimensions.")
+        return None
+    return index_dim if index_dim < embed_dim else None
+
+
+def get_build_params(embed_dim: int | None = None) -> HNSWBuildParams:
+    """Return HNSW build parameters from the environment"""
+    return HNSWBuildParams(
+        m=get_int_env("HNSW_M", 16),
+        ef_construction=get_int_env("HNSW_EF_CONSTRUCTION", 64),
+        storage=get_vector_storage(),
+        index_dim=get_index_dim(embed_dim or get_embed_dim()),
+    )
+
+
+def get_search_profiles() -> dict[SearchProfile, HNSWSearchParams]:
+    """Return the named runtime search profiles.
+
+    fast skips iterative scans, so filtered queries (e.g. by serverId) may return fewer than top_k rows.
+    balanced keeps the previous ef_search default and lets filtered queries keep scanning.
+    accurate trades latency for recall with a wide candidate list and strict ordering.
+    Each ef_search is a floor: TunedPGVectorStore raises it to the query's top_k, or to
+    top_k * VECTOR_RESCORE_OVERSAMPLE when quantized candidates are rescored.
+    """
+    return {
+        SearchProfile.FAST: HNSWSearchParams(
+            ef_search=get_int_env("HNSW_FAST_EF_SEARCH", 20),
+            iterative_scan="off",
+        ),
+        SearchProfile.BALANCED: HNSWSearchParams(
+            ef_search=get_int_env("HNSW_EF_SEARCH", 40),
+            iterative_scan="relaxed_order",
+            max_scan_tuples=get_int_env("HNSW_MAX_SCAN_TUPLES", 20000),
+        ),
+        SearchProfile.ACCURATE: HNSWSearchParams(
+            ef_search=get_int_env("HNSW_ACCURATE_EF_SEARCH", 200),
+            iterative_scan="strict_order",
+            max_scan_tuples=get_int_env("HNSW_ACCURATE_MAX_SCAN_TUPLES", 100000),
+        ),
+    }
+
+
+def get_default_search_profile() -> SearchProfile:
+    """Return the profile used when a query does not select one"""
+    raw_value = os.getenv("HNSW_SEARCH_PROFILE", SearchProfile.BALANCED.value)
+    try:
+        return SearchProfile(raw_value)
+    except ValueError:
+        print(f"Invalid HNSW_SEARCH_PROFILE value '{raw_value}'. Falling back to balanced.")
+        return SearchProfile.BALANCED
+
+
+def _check_identifier(name: str) -> str:
+    if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name):
+        raise ValueError(f"Invalid SQL identifier: {name}")
+    return name
+
+
+def get_index_options(engine: Engine, index_name: str) -> list[str] | None:
+    """Return the reloptions (e.g. ['m=16', 'ef_construction=64']) of an index, or None if it does not exist"""
+    with engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT reloptions FROM pg_class WHERE relkind = 'i' AND relname = :index_name"),
+            {"index_name": index_name}
+        ).first()
+    if row is None:
+        return None
+    return list(row.reloptions or [])
+
+
+def index_name_for(table_name: str, params: HNSWBuildParams) -> str:
+    """Return the HNSW index name used for a table, storage layout and indexed dimension"""
+    suffix = {
+        VectorStorage.FLOAT32: "",
+        VectorStorage.HALFVEC: "_halfvec",
+        VectorStorage.BINARY: "_bit",
+    }[params.storage]
+    if params.index_dim is not None:
+        suffix += f"_{int(params.index_dim)}"
+    # the full float32 index keeps the name PGVectorStore has always created
+    return f"{table_name}_embedding{suffix}_idx"
+
+
+def index_expression(params: HNSWBuildParams, embed_dim: int) -> str:
+    """Return the `USING hnsw (...)` column expression and operator class for a storage layout.
+
+    Queries must order by exactly this expression for Postgres to use the index.
+    """
+    if params.index_dim is not None:
+        dim = int(params.index_dim)
+        column = f"subvector(embedding, 1, {dim})::vector({dim})"
+    else:
+        dim = int(embed_dim)
+        column = "embedding"
+
+    if params.storage == VectorStorage.FLOAT32:
+        return f"({column}) vector_cosine_ops" if params.index_dim is not None else "embedding vector_cosine_ops"
+    if params.storage == VectorStorage.HALFVEC:
+        return f"(({column})::halfvec({dim})) halfvec_cosine_ops"
+    return f"(binary_quantize({column})::bit({dim})) bit_hamming_ops"
+
+
+def create_index_statement(table_name: str, params: HNSWBuildParams, embed_dim: int, concurrently: bool = False, index_name: str | None = None) -> str:
+    """Return the CREATE INDEX statement for a table's HNSW index"""
+    table_name = _check_identifier(table_name)
+    index_name = _check_identifier(index_name or index_name_for(table_name, params))
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name} "
+        f"ON public.{table_name} "
+        f"USING hnsw ({index_expression(params, embed_dim)}) "
+        f"WITH (m = {int(params.m)}, ef_construction = {int(params.ef_construction)})"
+    )
+
+
+def rebuild_hnsw_index(
+    engine: Engine,
+    table_name: str,
+    params: HNSWBuildParams,
+    embed_dim: int = 1024,
+    maintenance_work_mem: str | None = None,
+) -> None:
+    """Rebuild the embedding HNSW index of a vector table with new build parameters.
+
+    The new index is built concurrently next to the old one and swapped in, so queries keep
+    using the old index until the rebuild finishes. HNSW indexes for other storage layouts or
+    indexed dimensions are dropped afterwards since queries no longer use them.
+    """
+    table_name = _check_identifier(table_name)
+    index_name = index_name_for(table_name, params)
+    rebuild_name = f"{index_name}_rebuild"
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if maintenance_work_mem:
+            conn.execute(
+                text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                {"value": maintenance_work_mem}
+            )
+
+        # leftover from an interrupted rebuild
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {rebuild_name}"))
+        conn.execute(text(create_index_statement(table_name, params, embed_dim, concurrently=True, index_name=rebuild_name)))
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+        conn.execute(text(f"ALTER INDEX {rebuild_name} RENAME TO {index_name}"))
+
+        stale_indexes = conn.execute(
+            text(
+                "SELECT indexname FROM pg_indexes "
+                "WHERE schemaname = 'public' AND tablename = :table_name "
+                "AND indexname <> :index_name AND indexdef ILIKE '%USING hnsw%'"
+            ),
+            {"table_name": table_name, "index_name": index_name}
+        ).scalars().all()
+        for stale_index in stale_indexes:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {_check_identifier(stale_index)}"))
@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+from collections import Counter, deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+import numpy as np
+
+from models import MessageJson
+from RAG.config import get_float_env, get_int_env
+from RAG.minhash import MinHasher
+
+# Pre-embedding filter for Discord messages. Messages that carry no retrievable text (emoji,
+# reactions, bare links, mentions), one-word replies, and near-copies of a message recently
+# embedded in the same channel are still written to discord_text (exact search keeps finding
+# them) but get no embedding. discord_text.filter_reason records why.
+
+FILTER_NO_TEXT = "no_text"
+FILTER_TOO_SHORT = "too_short"
+FILTER_NEAR_DUPLICATE = "near_duplicate"
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+# custom emoji, user/role/channel mentions and timestamps
+DISCORD_MARKUP_PATTERN = re.compile(r"<a?:\w+:\d+>|<@[!&]?\d+>|<#\d+>|<t:\d+(?::\w)?>")
+# unicode emoji and punctuation are not word characters
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def message_words(content: str) -> List[str]:
+    """Words of a message once links and Discord markup are removed"""
+    return WORD_PATTERN.findall(DISCORD_MARKUP_PATTERN.sub(" ", URL_PATTERN.sub(" ", content)))
+
+
+class MessageFilter:
+    """Decides which Discord messages get embedded and counts the work it saved"""
+
+    def __init__(
+        self,
+        tokenizer: Callable[[str], List],
+        min_tokens: int = 3,
+        duplicate_threshold: float = 0.9,
+        history_size: int = 200,
+        minhasher: MinHasher | None = None,
+    ):
+        self.tokenizer = tokenizer
+        self.min_tokens = min_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.history_size = history_size
+        self.minhasher = minhasher or MinHasher()
+        # (server id, channel id) -> signatures of the channel's most recently embedded messages
+        self._history: Dict[Tuple[str, str], Deque[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+        self.checked = 0
+        self.filtered: Counter = Counter()
+        self.saved_tokens = 0
+
+    def _is_near_duplicate(self, channel: Tuple[str, str], signature: np.ndarray) -> bool:
+        history = self._history.get(channel)
+        if not history:
+            return False
+        return self.minhasher.max_similarity(signature, np.stack(history)) >= self.duplicate_threshold
+
+    def check(self, message: MessageJson, check_duplicates: bool = True) -> str | None:
+        """Return why `message` should not be embedded, or None to embed it.
+
+        Messages that pass are remembered for the channel's near-duplicate check; pass
+        `check_duplicates=False` for edits, which would otherwise match their own earlier text.
+        """
+        content = message.data.content
+        words = message_words(content)
+        reason = None
+        signature = None
+        if not words:
+            reason = FILTER_NO_TEXT
+        elif len(self.tokenizer(" ".join(words))) < self.min_tokens:
+            reason = FILTER_TOO_SHORT
+        elif self.duplicate_threshold <= 1:
+            signature = self.minhasher.signature(content)
+
+        channel = (message.metadata.serverId, message.metadata.channelId)
+        with self._lock:
+            self.checked += 1
+            if signature is not None and check_duplicates and self._is_near_duplicate(channel, signature):
+                reason = FILTER_NEAR_DUPLICATE
+
+            if reason is not None:
+                self.filtered[reason] += 1
+                self.saved_tokens += len(self.tokenizer(content))
+            elif signature is not None:
+                self._history.setdefault(channel, deque(maxlen=self.history_size)).append(signature)
+
+        return reason
+
+    def snapshot(self) -> dict[str, int | dict[str, int]]:
+        with self._lock:
+            saved = sum(self.filtered.values())
+            return {
+                "checked": self.checked,
+                "embedded": self.checked - saved,
+                "filtered": dict(self.filtered),
+                "saved_embeddings": saved,
+                "saved_tokens": self.saved_tokens,
+            }
+
+
+def get_message_filter(tokenizer: Callable[[str], List]) -> MessageFilter | None:
+    """Return the filter configured by DISCORD_FILTER_* env vars, or None when DISCORD_FILTER_ENABLED is off"""
+    if os.getenv("DISCORD_FILTER_ENABLED", "false").lower() in ("0", "false", "no", ""):
+        return None
+
+    return MessageFilter(
+        tokenizer,
+        min_tokens=max(get_int_env("DISCORD_FILTER_MIN_TOKENS", 3), 0),
+        duplicate_threshold=get_float_env("DISCORD_FILTER_DUPLICATE_THRESHOLD", 0.9),
+        history_size=max(get_int_env("DISCORD_FILTER_HISTORY", 200), 1),
+    )
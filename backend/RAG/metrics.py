@@ -0,0 +1,65 @@
+import threading
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+
+from RAG.config import get_int_env
+
+# Process-wide metrics rendered by GET /metrics with prometheus_client. Everything is registered on
+# REGISTRY rather than the library's global one, so the endpoint exposes exactly these series (plus
+# collectors main.py adds for values read at scrape time, like the connection pools).
+
+REGISTRY = CollectorRegistry()
+
+# seconds, from a cached lookup to an LLM agent run
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# documents per ingest call
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# tokens of retrieved context put into a prompt
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class ServerLabels:
+    """Bounds the serverId label: the first `max_servers` ids seen keep their own series, later ones share `other`"""
+
+    def __init__(self, max_servers: int):
+        self.max_servers = max_servers
+        self._seen: set[str] = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, server_id: str | None) -> str:
+        if self.max_servers <= 0:
+            return "all"
+        if not server_id:
+            return "none"
+        with self._lock:
+            if server_id in self._seen:
+                return server_id
+            if len(self._seen) < self.max_servers:
+                self._seen.add(server_id)
+                return server_id
+        return "other"
+
+
+# METRICS_MAX_SERVER_LABELS=0 drops the per-server split entirely
+server_label = ServerLabels(get_int_env("METRICS_MAX_SERVER_LABELS", 50))
+
+QUERY_SECONDS = Histogram("rag_query_seconds", "End-to-end /query latency", ["server_id"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+QUERY_STAGE_SECONDS = Histogram(
+    "rag_query_stage_seconds",
+    "Latency of one query stage (embed_query, discord_retrieval, notion_retrieval, rerank, pack_context, agent, fusion)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+TOOL_CALL_SECONDS = Histogram("rag_tool_call_seconds", "Latency of each agent tool call", ["tool"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+QUERIES_IN_FLIGHT = Gauge("rag_queries_in_flight", "Queries currently being answered", ["server_id"], registry=REGISTRY)
+QUERY_ERRORS = Counter("rag_query_errors_total", "Queries that failed", ["server_id"], registry=REGISTRY)
+CONTEXT_TOKENS = Histogram("rag_context_tokens", "Tokens of retrieved context in the agent prompt after packing", buckets=TOKEN_BUCKETS, registry=REGISTRY)
+CONTEXT_TOKENS_SAVED = Counter("rag_context_tokens_saved_total", "Context tokens removed by packing (near-duplicates, truncation, budget)", registry=REGISTRY)
+
+INGEST_BATCH_SIZE = Histogram("rag_ingest_batch_size", "Documents per ingest call", ["source"], buckets=BATCH_SIZE_BUCKETS, registry=REGISTRY)
+DOCUMENTS_INGESTED = Counter("rag_documents_ingested_total", "Documents written to the vector store", ["source"], registry=REGISTRY)
+DOCUMENTS_DELETED = Counter("rag_documents_deleted_total", "Documents removed from the vector store", ["source"], registry=REGISTRY)
+
+NOTION_API_REQUESTS = Counter("rag_notion_api_requests_total", "Notion API requests by endpoint and status", ["endpoint", "status"], registry=REGISTRY)
+NOTION_API_SECONDS = Histogram("rag_notion_api_request_seconds", "Notion API request latency", ["endpoint"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
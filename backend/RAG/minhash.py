@@ -0,0 +1,54 @@
+import zlib
+
+import numpy as np
+
+# MinHash signatures over character shingles, for cheap near-duplicate detection of short texts.
+# Two signatures agree in each position with probability equal to the Jaccard similarity of the
+# texts' shingle sets, so the fraction of equal positions estimates it.
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_text(text_value: str) -> str:
+    """Lowercase and collapse whitespace so formatting changes do not count as differences"""
+    return " ".join(text_value.lower().split())
+
+
+class MinHasher:
+    """Computes fixed-length MinHash signatures; the same seed always yields comparable signatures"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text_value: str) -> set[str]:
+        normalized = normalize_text(text_value)
+        if len(normalized) <= self.shingle_size:
+            return {normalized} if normalized else set()
+        return {normalized[i:i + self.shingle_size] for i in range(len(normalized) - self.shingle_size + 1)}
+
+    def signature(self, text_value: str) -> np.ndarray:
+        shingles = self.shingles(text_value)
+        if not shingles:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+
+        hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        # universal hashing (a * x + b) mod p; the uint64 product may wrap, which only reshuffles values
+        permuted = ((np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME) & MAX_HASH
+        return permuted.min(axis=0)
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        """Estimated Jaccard similarity of two signatures"""
+        return float(np.mean(first == second))
+
+    @staticmethod
+    def max_similarity(signature: np.ndarray, signatures: np.ndarray) -> float:
+        """Highest estimated similarity between `signature` and the rows of `signatures`"""
+        if len(signatures) == 0:
+            return 0.0
+        return float(np.max(np.mean(signatures == signature, axis=1)))
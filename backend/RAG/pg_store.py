@@ -0,0 +1,287 @@
+from typing import Any, List, Optional, Sequence
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores import MetadataFilters
+from llama_index.vector_stores.postgres import PGVectorStore
+from llama_index.vector_stores.postgres.base import DBEmbeddingRow
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from pydantic import PrivateAttr
+from sqlalchemy import cast, delete, func, literal, literal_column, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from RAG.hnsw import ITERATIVE_SCAN_MODES, HNSWBuildParams, VectorStorage, _check_identifier, create_index_statement
+
+
+# upper bound pgvector accepts for hnsw.ef_search
+MAX_EF_SEARCH = 1000
+
+
+class TunedPGVectorStore(PGVectorStore):
+    """PGVectorStore that applies HNSW search settings per query.
+
+    The upstream store issues a session-wide `SET hnsw.ef_search`, which sticks to the pooled
+    connection. Here every setting is applied with `set_config(..., is_local => true)` so it only
+    lasts for the query's transaction. Settings are passed through the retriever's
+    `vector_store_kwargs` (see `HNSWSearchParams.as_store_kwargs`).
+
+    With a halfvec or binary storage layout, or a Matryoshka `index_dim` smaller than `embed_dim`,
+    the HNSW index is built over an expression of the full-precision column. Dense queries then
+    fetch `rescore_oversample * top_k` candidates through that index and re-order them by exact
+    cosine distance on the full vector before returning top_k (unless rescoring is disabled).
+
+    An HNSW scan returns at most `hnsw.ef_search` rows, so a profile's ef_search is raised to the
+    number of rows the scan must return (top_k, or the oversampled candidate count), capped at
+    pgvector's maximum of 1000.
+    """
+
+    _vector_storage: VectorStorage = PrivateAttr(default=VectorStorage.FLOAT32)
+    _index_dim: Optional[int] = PrivateAttr(default=None)
+    _rescore: bool = PrivateAttr(default=True)
+    _rescore_oversample: int = PrivateAttr(default=4)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TunedPGVectorStore"
+
+    @classmethod
+    def from_params(
+        cls,
+        vector_storage: VectorStorage = VectorStorage.FLOAT32,
+        index_dim: Optional[int] = None,
+        rescore: bool = True,
+        rescore_oversample: int = 4,
+        engine: Optional[Engine] = None,
+        async_engine: Optional[AsyncEngine] = None,
+        **kwargs: Any,
+    ) -> "TunedPGVectorStore":
+        store = super().from_params(**kwargs)
+        if (engine is None) != (async_engine is None):
+            raise ValueError("Both engine and async_engine must be provided, or both must be None")
+        # shared pools from RAG.database instead of a private engine pair per store
+        store._engine = engine
+        store._async_engine = async_engine
+
+        if index_dim is not None and not 0 < index_dim <= store.embed_dim:
+            raise ValueError(f"index_dim must be between 1 and embed_dim ({store.embed_dim}), got {index_dim}")
+
+        store._vector_storage = vector_storage
+        store._index_dim = index_dim if index_dim != store.embed_dim else None
+        store._rescore = rescore
+        store._rescore_oversample = max(rescore_oversample, 1)
+        return store
+
+    @property
+    def _uses_expression_index(self) -> bool:
+        return self._vector_storage != VectorStorage.FLOAT32 or self._index_dim is not None
+
+    def _create_hnsw_index(self) -> None:
+        if (
+            "hnsw_ef_construction" not in self.hnsw_kwargs
+            or "hnsw_m" not in self.hnsw_kwargs
+        ):
+            raise ValueError(
+                "Make sure hnsw_ef_search, hnsw_ef_construction, and hnsw_m are in hnsw_kwargs."
+            )
+
+        params = HNSWBuildParams(
+            m=self.hnsw_kwargs.pop("hnsw_m"),
+            ef_construction=self.hnsw_kwargs.pop("hnsw_ef_construction"),
+            storage=self._vector_storage,
+            index_dim=self._index_dim,
+        )
+        # the operator class follows from the storage layout
+        self.hnsw_kwargs.pop("hnsw_dist_method", None)
+
+        with self._session() as session, session.begin():
+            session.execute(text(create_index_statement(self._table_class.__tablename__, params, self.embed_dim)))
+
+    def session(self) -> Session:
+        """Open an ORM session on the store's engine.
+
+        Writes to other tables in the same `session.begin()` block share the vector rows'
+        connection and transaction, so both sides commit or roll back together.
+        """
+        self._initialize()
+        return self._session()
+
+    def add_in_session(self, session: Session, nodes: Sequence[BaseNode]) -> List[str]:
+        """Stage embedded nodes in a caller-managed session (committed with its transaction)"""
+        session.add_all([self._node_to_table_row(node) for node in nodes])
+        return [node.node_id for node in nodes]
+
+    def delete_by_metadata_in_session(self, session: Session, key: str, values: Sequence[str]) -> int:
+        """Delete every row whose metadata `key` is one of `values`; returns the number of rows deleted"""
+        if not values:
+            return 0
+
+        table = self._table_class
+        stmt = delete(table).where(table.metadata_[key].astext.in_(list(values)))
+        return session.execute(stmt, execution_options={"synchronize_session": False}).rowcount
+
+    def create_metadata_index(self, key: str) -> None:
+        """Create a btree index on `metadata_ ->> key` so per-key deletes and diffs avoid sequential scans"""
+        table_name = self._table_class.__tablename__
+        key = _check_identifier(key)
+        index_name = f"{table_name}_{key.lower()}_idx"
+        with self.session() as session, session.begin():
+            session.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ((metadata_ ->> '{key}'))"))
+
+    def _index_distance(self, embedding: List[float]) -> Any:
+        """Distance expression matching the index expression in RAG.hnsw.index_expression.
+
+        Dimensions are inlined as literals so the expression still matches the index when the
+        async driver sends bind parameters server-side.
+        """
+        embedding_col = self._table_class.embedding
+        if self._index_dim is not None:
+            dim = self._index_dim
+            # Matryoshka embeddings: the leading dimensions form a valid lower-dimensional embedding
+            embedding = embedding[:dim]
+            column = cast(
+                func.subvector(embedding_col, literal_column("1"), literal_column(str(int(dim)))),
+                Vector(dim),
+            )
+        else:
+            dim = self.embed_dim
+            column = embedding_col
+
+        if self._vector_storage == VectorStorage.FLOAT32:
+            return column.cosine_distance(embedding)
+        if self._vector_storage == VectorStorage.HALFVEC:
+            return cast(column, HALFVEC(dim)).cosine_distance(embedding)
+
+        query_vector = cast(literal(embedding, Vector(dim)), Vector(dim))
+        query_bits = cast(func.binary_quantize(query_vector), BIT(dim))
+        return cast(func.binary_quantize(column), BIT(dim)).hamming_distance(query_bits)
+
+    def _build_query(
+        self,
+        embedding: Optional[List[float]],
+        limit: int = 10,
+        metadata_filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> Any:
+        if not self._uses_expression_index:
+            return super()._build_query(embedding, limit, metadata_filters, **kwargs)
+
+        table = self._table_class
+        index_distance = self._index_distance(embedding)
+
+        if not self._rescore:
+            distance = index_distance
+            if self._vector_storage == VectorStorage.BINARY:
+                # hamming distance -> [0, 1] so similarity stays comparable
+                distance = index_distance / float(self._index_dim or self.embed_dim)
+            stmt = select(
+                table.id,
+                table.node_id,
+                table.text,
+                table.metadata_,
+                distance.label("distance"),
+            ).order_by(index_distance)
+            return self._apply_filters_and_limit(stmt, limit, metadata_filters)
+
+        candidates = select(
+            table.id,
+            table.node_id,
+            table.text,
+            table.metadata_,
+            table.embedding,
+        ).order_by(index_distance)
+        candidates = self._apply_filters_and_limit(
+            candidates, limit * self._rescore_oversample, metadata_filters
+        ).subquery("candidates")
+
+        # rescore the oversampled candidates against the full-precision vectors
+        return select(
+            candidates.c.id,
+            candidates.c.node_id,
+            candidates.c.text,
+            candidates.c.metadata_,
+            candidates.c.embedding.cosine_distance(embedding).label("distance"),
+        ).order_by(text("distance asc")).limit(limit)
+
+    def _index_scan_limit(self, limit: int) -> int:
+        """Rows the HNSW index scan has to return for a query of `limit` results"""
+        if self._uses_expression_index and self._rescore:
+            return limit * self._rescore_oversample
+        return limit
+
+    def _search_settings(self, limit: int, **kwargs: Any) -> dict[str, str]:
+        """Build the transaction-local GUCs for a dense query"""
+        settings: dict[str, str] = {}
+        if not self.hnsw_kwargs:
+            return settings
+
+        ef_search = kwargs.get("hnsw_ef_search") or self.hnsw_kwargs.get("hnsw_ef_search")
+        if ef_search:
+            # below the scan limit the rescore subquery silently gets fewer candidates than it asks for
+            ef_search = min(max(int(ef_search), self._index_scan_limit(limit)), MAX_EF_SEARCH)
+            settings["hnsw.ef_search"] = str(ef_search)
+
+        iterative_scan = kwargs.get("hnsw_iterative_scan")
+        if iterative_scan:
+            if iterative_scan not in ITERATIVE_SCAN_MODES:
+                raise ValueError(f"Invalid hnsw iterative_scan mode: {iterative_scan}")
+            settings["hnsw.iterative_scan"] = iterative_scan
+
+            max_scan_tuples = kwargs.get("hnsw_max_scan_tuples")
+            if iterative_scan != "off" and max_scan_tuples:
+                settings["hnsw.max_scan_tuples"] = str(int(max_scan_tuples))
+
+        return settings
+
+    @staticmethod
+    def _to_db_embedding_rows(rows: Any) -> List[DBEmbeddingRow]:
+        return [
+            DBEmbeddingRow(
+                node_id=item.node_id,
+                text=item.text,
+                metadata=item.metadata_,
+                custom_fields={
+                    key: val
+                    for key, val in item._asdict().items()
+                    if key not in ["id", "node_id", "text", "metadata_", "distance"]
+                },
+                similarity=(1 - item.distance) if item.distance is not None else 0,
+            )
+            for item in rows
+        ]
+
+    def _query_with_score(
+        self,
+        embedding: Optional[List[float]],
+        limit: int = 10,
+        metadata_filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> List[DBEmbeddingRow]:
+        stmt = self._build_query(embedding, limit, metadata_filters, **kwargs)
+        with self._session() as session, session.begin():
+            for name, value in self._search_settings(limit, **kwargs).items():
+                session.execute(
+                    text("SELECT set_config(:name, :value, true)"),
+                    {"name": name, "value": value}
+                )
+
+            res = session.execute(stmt)
+            return self._to_db_embedding_rows(res.all())
+
+    async def _aquery_with_score(
+        self,
+        embedding: Optional[List[float]],
+        limit: int = 10,
+        metadata_filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> List[DBEmbeddingRow]:
+        stmt = self._build_query(embedding, limit, metadata_filters, **kwargs)
+        async with self._async_session() as async_session, async_session.begin():
+            for name, value in self._search_settings(limit, **kwargs).items():
+                await async_session.execute(
+                    text("SELECT set_config(:name, :value, true)"),
+                    {"name": name, "value": value}
+                )
+
+            res = await async_session.execute(stmt)
+            return self._to_db_embedding_rows(res.all())
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List
+
+from RAG.config import get_float_env, get_int_env
+
+# Opt-in sampling profiler for slow requests (PROFILE_ENABLED). While a profiled request is in flight,
+# one background thread samples it every PROFILE_INTERVAL_MS: when its task is running on the event
+# loop the loop thread's stack is recorded, and when it is suspended its await chain is, ending in
+# "[waiting]". Profiles are therefore wall-clock and show where a slow /query waits (LLM, database)
+# as well as where it burns CPU. A request is kept when it took PROFILE_SLOW_MS or more, or for a
+# PROFILE_SAMPLE_RATE fraction of the rest; kept profiles go to PROFILE_DIR in the collapsed-stack
+# format read by flamegraph.pl, speedscope and inferno, next to a JSON file with its tags.
+# Only the newest PROFILE_MAX_FILES profiles are kept.
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    filename = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+    # ';' separates frames in the collapsed format
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _await_chain(coro: Any) -> List[str]:
+    """Frames of a suspended coroutine and everything it awaits, outermost first"""
+    names = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            # a future (I/O, sleep, another task, a thread), or a coroutine that just finished
+            if not hasattr(coro, "cr_frame") and not hasattr(coro, "gi_frame"):
+                names.append("[waiting]")
+            break
+        names.append(_frame_name(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return names
+
+
+def _thread_stack(frame, root_frame) -> List[str]:
+    """Frames of a thread from `root_frame` (the task's coroutine) to the innermost, outermost first"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root_frame:
+            break
+        frame = frame.f_back
+    return [_frame_name(frame) for frame in reversed(frames)]
+
+
+class Capture:
+    """Stack samples and tags of one profiled request"""
+
+    def __init__(self, path: str, task: asyncio.Task, loop: asyncio.AbstractEventLoop, loop_thread_id: int):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.task = task
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.started = time.time()
+        self.stacks: Counter = Counter()
+        self.tags: Dict[str, Any] = {}
+
+
+current_capture: ContextVar[Capture | None] = ContextVar("current_capture", default=None)
+
+
+def tag_profile(**tags: Any) -> None:
+    """Attach tags (serverId, stage timings, ...) to the current request's profile, if it is profiled"""
+    capture = current_capture.get()
+    if capture is not None:
+        capture.tags.update(tags)
+
+
+class StackSampler:
+    """Background thread sampling every registered capture; idle while there are none"""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._captures: Dict[str, Capture] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def register(self, capture: Capture) -> None:
+        with self._lock:
+            self._captures[capture.id] = capture
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def unregister(self, capture: Capture) -> None:
+        with self._lock:
+            self._captures.pop(capture.id, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                captures = list(self._captures.values())
+            if not captures:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            self._sample(captures)
+            time.sleep(self.interval_seconds)
+
+    def _sample(self, captures: List[Capture]) -> None:
+        thread_frames = sys._current_frames()
+        for capture in captures:
+            coro = capture.task.get_coro()
+            try:
+                running = asyncio.current_task(capture.loop) is capture.task
+            except RuntimeError:
+                running = False
+
+            root_frame = getattr(coro, "cr_frame", None)
+            if running and capture.loop_thread_id in thread_frames and root_frame is not None:
+                stack = _thread_stack(thread_frames[capture.loop_thread_id], root_frame)
+            else:
+                stack = _await_chain(coro)
+            if stack:
+                capture.stacks[";".join(stack)] += 1
+
+
+class ProfileStore:
+    """Ring buffer of captured profiles on disk: <id>.collapsed and <id>.json, newest `max_profiles` kept"""
+
+    def __init__(self, directory: str, max_profiles: int):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def save(self, capture: Capture, info: Dict[str, Any]) -> None:
+        collapsed = "".join(f"{stack} {count}\n" for stack, count in capture.stacks.most_common())
+        with self._lock:
+            with open(self._path(capture.id, "collapsed"), "w") as f:
+                f.write(collapsed)
+            # the JSON file is written last: a profile is listed once both exist
+            with open(self._path(capture.id, "json"), "w") as f:
+                json.dump(info, f, default=str)
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries[:max(len(entries) - self.max_profiles, 0)]:
+            profile_id = entry.name[:-len(".json")]
+            for extension in ("json", "collapsed"):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Tags of every stored profile, newest first"""
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(profiles, key=lambda profile: profile.get("started", 0), reverse=True)
+
+    def collapsed_path(self, profile_id: str) -> str | None:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self._path(profile_id, "collapsed")
+        return path if os.path.exists(path) else None
+
+
+class RequestProfiler:
+    """Which requests are profiled and kept, plus the sampler and store they use"""
+
+    def __init__(self, paths: List[str], sample_rate: float, slow_seconds: float, sampler: StackSampler, store: ProfileStore):
+        self.paths = set(paths)
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.sampler = sampler
+        self.store = store
+
+    def keep_reason(self, seconds: float) -> str | None:
+        if seconds >= self.slow_seconds:
+            return "slow"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests of `profiler.paths`.
+
+    It is plain ASGI (not BaseHTTPMiddleware) so the endpoint runs in the request's own task,
+    which is the task the sampler follows. The profile id is returned in the X-Profile-Id header.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.profiler.paths:
+            await self.app(scope, receive, send)
+            return
+
+        capture = Capture(scope["path"], asyncio.current_task(), asyncio.get_running_loop(), threading.get_ident())
+        status = None
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", capture.id.encode())]
+            await send(message)
+
+        token = current_capture.set(capture)
+        self.profiler.sampler.register(capture)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            seconds = time.perf_counter() - start
+            self.profiler.sampler.unregister(capture)
+            current_capture.reset(token)
+
+            reason = self.profiler.keep_reason(seconds)
+            if reason is not None:
+                info = {
+                    "id": capture.id,
+                    "path": capture.path,
+                    "started": capture.started,
+                    "duration_ms": round(seconds * 1000, 1),
+                    "status": status,
+                    "reason": reason,
+                    "samples": sum(capture.stacks.values()),
+                    "interval_ms": self.profiler.sampler.interval_seconds * 1000,
+                    **capture.tags,
+                }
+                try:
+                    self.profiler.store.save(capture, info)
+                except OSError as exc:
+                    print(f"Failed to save profile {capture.id}: {exc}")
+
+
+def get_request_profiler() -> RequestProfiler | None:
+    """Return the profiler configured by PROFILE_* env vars, or None unless PROFILE_ENABLED is on"""
+    if os.getenv("PROFILE_ENABLED", "false").lower() in ("0", "false", "no", ""):
+        return None
+
+    paths = [path.strip() for path in os.getenv("PROFILE_PATHS", "/query").split(",") if path.strip()]
+    return RequestProfiler(
+        paths=paths,
+        sample_rate=min(max(get_float_env("PROFILE_SAMPLE_RATE", 0.0), 0.0), 1.0),
+        slow_seconds=max(get_float_env("PROFILE_SLOW_MS", 10000.0), 0.0) / 1000,
+        sampler=StackSampler(max(get_float_env("PROFILE_INTERVAL_MS", 10.0), 1.0) / 1000),
+        store=ProfileStore(os.getenv("PROFILE_DIR", "profiles"), max(get_int_env("PROFILE_MAX_FILES", 50), 1)),
+    )
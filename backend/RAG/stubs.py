@@ -0,0 +1,252 @@
+import asyncio
+import math
+import re
+import time
+import zlib
+from collections import Counter
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.function_calling import FunctionCallingLLM
+from llama_index.core.llms.llm import ToolSelection
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+
+# Deterministic stand-ins for the embedding model, reranker and LLM (selected in RAG/backends.py).
+# They keep the retrieval, storage and agent plumbing real and only replace the model calls, so
+# answers are not meaningful. `latency_ms` injects a fixed delay per call that blocks the way the
+# real backend does: the local embedding and reranking models run on the event loop, the LLM is
+# awaited over the network.
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _words(text_value: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text_value.lower())
+
+
+class HashEmbedding(BaseEmbedding):
+    """Feature-hashed bag of words: texts sharing words get similar unit vectors of `dim` dimensions"""
+
+    dim: int = Field(default=1024, gt=0)
+    latency_ms: float = Field(default=0.0, ge=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text_value: str) -> List[float]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _words(text_value):
+            hashed = zlib.crc32(token.encode())
+            # the top bit picks the sign so colliding tokens do not only add up
+            vector[hashed % self.dim] += 1.0 if hashed & 0x80000000 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            # cosine distance is undefined for the zero vector
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class LexicalRerank(BaseNodePostprocessor):
+    """BM25 over the candidate set: keeps the `top_n` nodes sharing the most (rare) words with the query"""
+
+    top_n: int = 5
+    k1: float = 1.2
+    b: float = 0.75
+    latency_ms: float = Field(default=0.0, ge=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LexicalRerank"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if not nodes:
+            return []
+
+        query_terms = set(_words(query_bundle.query_str))
+        documents = [Counter(_words(node.node.get_content(metadata_mode=MetadataMode.EMBED))) for node in nodes]
+        average_length = sum(sum(document.values()) for document in documents) / len(documents) or 1.0
+        document_frequency = Counter(term for document in documents for term in query_terms & document.keys())
+
+        for node, document in zip(nodes, documents):
+            length = sum(document.values())
+            score = 0.0
+            for term in query_terms & document.keys():
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                tf = document[term]
+                score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+            node.score = score
+
+        # stable sort keeps the retrieval order among ties
+        return sorted(nodes, key=lambda node: node.score, reverse=True)[:self.top_n]
+
+
+class ScriptedLLM(FunctionCallingLLM):
+    """Function-calling LLM that plays back `script`, one step per agent turn, then answers.
+
+    A step is {"tool": name, "kwargs": {...}} (a tool call) or {"answer": text}. The step is picked
+    by the number of assistant turns since the last user message, so concurrent conversations do
+    not share state. Usage is reported in the OpenAI shape (tokens counted with the default
+    tokenizer), so query traces and token accounting behave as with a real provider.
+    """
+
+    script: List[dict] = Field(default_factory=list)
+    answer: str = Field(default='Stub answer based on the provided context <reference id="1"/>.')
+    latency_ms: float = Field(default=0.0, ge=0)
+    _tokenizer: Any = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        for step in self.script:
+            if not isinstance(step, dict) or ("tool" not in step) == ("answer" not in step):
+                raise ValueError(f"Script steps need exactly one of 'tool' or 'answer', got {step!r}")
+        self._tokenizer = get_tokenizer()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ScriptedLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="scripted", is_chat_model=True, is_function_calling_model=True)
+
+    def _next_step(self, messages: Sequence[ChatMessage]) -> dict:
+        turn = 0
+        for message in reversed(messages):
+            if message.role == MessageRole.USER:
+                break
+            if message.role == MessageRole.ASSISTANT:
+                turn += 1
+        return self.script[turn] if turn < len(self.script) else {"answer": self.answer}
+
+    def _respond(self, messages: Sequence[ChatMessage], allow_tools: bool = True) -> ChatResponse:
+        step = self._next_step(messages) if allow_tools else {"answer": self.answer}
+        prompt = "\n".join(message.content or "" for message in messages)
+        if "tool" in step:
+            turn = sum(1 for message in messages if message.role == MessageRole.ASSISTANT)
+            tool_call = {"id": f"call_{turn}", "name": step["tool"], "kwargs": step.get("kwargs", {})}
+            message = ChatMessage(role=MessageRole.ASSISTANT, content="", additional_kwargs={"tool_calls": [tool_call]})
+            completion = f"{step['tool']} {step.get('kwargs', {})}"
+        else:
+            message = ChatMessage(role=MessageRole.ASSISTANT, content=step["answer"])
+            completion = step["answer"]
+
+        raw = {"usage": {"prompt_tokens": len(self._tokenizer(prompt)), "completion_tokens": len(self._tokenizer(completion))}}
+        return ChatResponse(message=message, delta=message.content, raw=raw)
+
+    def _prepare_chat_with_tools(
+        self,
+        tools: Sequence[Any],
+        user_msg: Optional[str | ChatMessage] = None,
+        chat_history: Optional[List[ChatMessage]] = None,
+        verbose: bool = False,
+        allow_parallel_tool_calls: bool = False,
+        tool_required: bool = False,
+        **kwargs: Any,
+    ) -> dict:
+        messages = list(chat_history or [])
+        if isinstance(user_msg, str):
+            messages.append(ChatMessage(role=MessageRole.USER, content=user_msg))
+        elif user_msg is not None:
+            messages.append(user_msg)
+        return {"messages": messages, **kwargs}
+
+    def get_tool_calls_from_response(self, response: ChatResponse, error_on_no_tool_call: bool = True, **kwargs: Any) -> List[ToolSelection]:
+        tool_calls = response.message.additional_kwargs.get("tool_calls", [])
+        if not tool_calls and error_on_no_tool_call:
+            raise ValueError(f"Expected at least one tool call, but got {len(tool_calls)} tool calls.")
+        return [
+            ToolSelection(tool_id=tool_call["id"], tool_name=tool_call["name"], tool_kwargs=tool_call["kwargs"])
+            for tool_call in tool_calls
+        ]
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._respond(messages, allow_tools=kwargs.get("allow_tools", True))
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(messages, allow_tools=kwargs.get("allow_tools", True))
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        response = self.chat(messages, **kwargs)
+
+        def gen() -> ChatResponseGen:
+            yield response
+
+        return gen()
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        response = await self.achat(messages, **kwargs)
+
+        async def gen() -> ChatResponseAsyncGen:
+            yield response
+
+        return gen()
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        # completions (e.g. query generation in fusion_response) always answer
+        response = self.chat([ChatMessage(role=MessageRole.USER, content=prompt)], allow_tools=False)
+        return CompletionResponse(text=response.message.content or "", raw=response.raw)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        response = await self.achat([ChatMessage(role=MessageRole.USER, content=prompt)], allow_tools=False)
+        return CompletionResponse(text=response.message.content or "", raw=response.raw)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        response = self.complete(prompt, formatted=formatted, **kwargs)
+
+        def gen() -> CompletionResponseGen:
+            yield CompletionResponse(text=response.text, delta=response.text, raw=response.raw)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        response = await self.acomplete(prompt, formatted=formatted, **kwargs)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            yield CompletionResponse(text=response.text, delta=response.text, raw=response.raw)
+
+        return gen()
@@ -0,0 +1,192 @@
+import hashlib
+from datetime import datetime
+from typing import Iterable, Iterator, NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+# Per-page Notion sync state, stored next to the embeddings.
+# A page is exported again only if it was never synced, its last sync failed, or Notion reports a
+# newer last_edited_time. Re-exported pages whose rendered content hashes the same are not
+# re-embedded; only their edit time is advanced.
+
+SYNC_STATUS_INDEXED = "indexed"
+SYNC_STATUS_EMPTY = "empty"
+SYNC_STATUS_FAILED = "failed"
+
+CREATE_SYNC_STATE_SQL = """
+    CREATE TABLE IF NOT EXISTS notion_sync_state (
+        page_id TEXT PRIMARY KEY,
+        last_edited_time TIMESTAMPTZ,
+        content_hash TEXT,
+        status TEXT NOT NULL,
+        error TEXT,
+        attempts INT NOT NULL DEFAULT 0,
+        synced_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+
+SYNC_STATE_INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS idx_notion_sync_state_last_edited ON notion_sync_state (last_edited_time)",
+    "CREATE INDEX IF NOT EXISTS idx_notion_sync_state_failed ON notion_sync_state (page_id) WHERE status = 'failed'",
+]
+
+UPSERT_SYNCED_SQL = """
+    INSERT INTO notion_sync_state (page_id, last_edited_time, content_hash, status, error, attempts, synced_at)
+    VALUES (:page_id, :last_edited_time, :content_hash, :status, NULL, 0, NOW())
+    ON CONFLICT (page_id) DO UPDATE SET
+        last_edited_time = EXCLUDED.last_edited_time,
+        content_hash = EXCLUDED.content_hash,
+        status = EXCLUDED.status,
+        error = NULL,
+        attempts = 0,
+        synced_at = NOW()
+"""
+
+# Writers of a page (the polling import, webhook batches, import_notion.py in another process)
+# delete its rows and insert the new ones in one READ COMMITTED transaction. Two of them on the
+# same page would each miss the other's uncommitted inserts and both chunk sets would survive, so
+# every such transaction first takes the page's advisory lock, held until it commits.
+LOCK_PAGE_SQL = "SELECT pg_advisory_xact_lock(hashtextextended(:lock_key, 0))"
+
+# a failure keeps the last good edit time and hash so an unchanged retry is still skipped
+UPSERT_FAILED_SQL = """
+    INSERT INTO notion_sync_state (page_id, status, error, attempts, synced_at)
+    VALUES (:page_id, 'failed', :error, 1, NOW())
+    ON CONFLICT (page_id) DO UPDATE SET
+        status = 'failed',
+        error = EXCLUDED.error,
+        attempts = notion_sync_state.attempts + 1,
+        synced_at = NOW()
+"""
+
+
+class SyncRecord(NamedTuple):
+    last_edited_time: datetime | None
+    content_hash: str | None
+    status: str
+    attempts: int
+
+
+def ensure_sync_state_table(conn: Connection) -> None:
+    conn.execute(text(CREATE_SYNC_STATE_SQL))
+    for statement in SYNC_STATE_INDEX_STATEMENTS:
+        conn.execute(text(statement))
+
+
+def lock_notion_pages(conn: Connection | Session, page_ids: Iterable[str]) -> None:
+    """Take the write lock of each page until the transaction ends; in id order, so writers cannot deadlock"""
+    for page_id in sorted(set(page_ids)):
+        conn.execute(text(LOCK_PAGE_SQL), {"lock_key": f"notion_page:{page_id}"})
+
+
+def parse_notion_time(value: str) -> datetime:
+    """Parse Notion's ISO timestamps (`2025-01-01T00:00:00.000Z`)"""
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def content_hasher():
+    """Hash object for rendered page text; feed it the same pieces that are indexed"""
+    return hashlib.sha256()
+
+
+def hash_content(text_value: str) -> str:
+    hasher = content_hasher()
+    hasher.update(text_value.encode())
+    return hasher.hexdigest()
+
+
+def hash_page_sections(hasher, title: str, author: str, sections: Iterable[str]) -> Iterator[str]:
+    """Pass streamed page sections through, feeding `hasher` the text build_notion_page would index"""
+    hasher.update(f"Title: {title}\nAuthor: {author}\nContent: ".encode())
+    for i, section in enumerate(sections):
+        hasher.update(((("\n\n") if i else "") + section).encode())
+        yield section
+
+
+class NotionSyncState:
+    """Reads and writes notion_sync_state rows"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def get(self, page_id: str) -> SyncRecord | None:
+        return self.load([page_id]).get(page_id)
+
+    def load(self, page_ids: Iterable[str]) -> dict[str, SyncRecord]:
+        page_ids = list(page_ids)
+        if not page_ids:
+            return {}
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT page_id, last_edited_time, content_hash, status, attempts
+                    FROM notion_sync_state
+                    WHERE page_id = ANY(:page_ids)
+                """),
+                {"page_ids": page_ids}
+            ).fetchall()
+        return {
+            row.page_id: SyncRecord(row.last_edited_time, row.content_hash, row.status, row.attempts)
+            for row in rows
+        }
+
+    def pages_to_sync(self, listed_pages: dict[str, str]) -> list[str]:
+        """Filter listed pages ({page id: last_edited_time}) down to those that need an export"""
+        records = self.load(listed_pages)
+        page_ids = []
+        for page_id, last_edited_time in listed_pages.items():
+            record = records.get(page_id)
+            if (
+                record is None
+                or record.status == SYNC_STATUS_FAILED
+                or record.last_edited_time is None
+                or parse_notion_time(last_edited_time) > record.last_edited_time
+            ):
+                page_ids.append(page_id)
+        return page_ids
+
+    def failed_page_ids(self, max_attempts: int | None = None) -> list[str]:
+        """Pages whose last sync failed (optionally only those with fewer than `max_attempts` failures)"""
+        query = "SELECT page_id FROM notion_sync_state WHERE status = 'failed'"
+        params = {}
+        if max_attempts is not None:
+            query += " AND attempts < :max_attempts"
+            params["max_attempts"] = max_attempts
+
+        with self.engine.connect() as conn:
+            return list(conn.execute(text(query), params).scalars())
+
+    def mark_synced(
+        self,
+        page_id: str,
+        last_edited_time: datetime,
+        content_hash: str,
+        status: str = SYNC_STATUS_INDEXED,
+        session: Session | None = None,
+    ) -> None:
+        """Record a successful sync; pass `session` to commit it together with the embeddings"""
+        params = {
+            "page_id": page_id,
+            "last_edited_time": last_edited_time,
+            "content_hash": content_hash,
+            "status": status,
+        }
+        if session is not None:
+            session.execute(text(UPSERT_SYNCED_SQL), params)
+            return
+
+        with self.engine.begin() as conn:
+            conn.execute(text(UPSERT_SYNCED_SQL), params)
+
+    def mark_failed(self, page_id: str, error: Exception | str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(text(UPSERT_FAILED_SQL), {"page_id": page_id, "error": str(error)[:2000]})
+
+    def counts(self) -> dict[str, int]:
+        """Number of pages per status"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT status, COUNT(*) FROM notion_sync_state GROUP BY status")).fetchall()
+        return {status: int(count) for status, count in rows}
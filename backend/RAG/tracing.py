@@ -0,0 +1,99 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from RAG.metrics import QUERY_STAGE_SECONDS
+
+# Per-request timing trace of llm_response. A trace is built when QueryRequest.debug is set (and
+# returned in the response) or for a QUERY_TRACE_SAMPLE_RATE fraction of queries (and logged).
+# Recording is a few perf_counter calls per stage and tool call, so sampling in production is cheap.
+
+
+def get_trace_sample_rate() -> float:
+    """Return the fraction of queries traced without asking (QUERY_TRACE_SAMPLE_RATE, default 0)"""
+    raw_value = os.getenv("QUERY_TRACE_SAMPLE_RATE")
+    if raw_value is None or raw_value == "":
+        return 0.0
+
+    try:
+        return min(max(float(raw_value), 0.0), 1.0)
+    except ValueError:
+        print(f"Invalid QUERY_TRACE_SAMPLE_RATE value '{raw_value}'. Falling back to 0.")
+        return 0.0
+
+
+def should_sample(sample_rate: float) -> bool:
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _usage_from_raw(raw: Any) -> tuple[int, int] | None:
+    """(prompt, completion) tokens from an LLM's raw chat response (OpenAI or Ollama shapes)"""
+    if not isinstance(raw, dict):
+        return None
+
+    usage = raw.get("usage")
+    if isinstance(usage, dict):
+        prompt = usage.get("prompt_tokens", usage.get("input_tokens"))
+        completion = usage.get("completion_tokens", usage.get("output_tokens"))
+        if prompt is not None or completion is not None:
+            return int(prompt or 0), int(completion or 0)
+
+    if "prompt_eval_count" in raw or "eval_count" in raw:
+        return int(raw.get("prompt_eval_count") or 0), int(raw.get("eval_count") or 0)
+    return None
+
+
+class QueryTrace:
+    """Stage wall times, candidate counts, context packing, agent steps, tool calls and LLM token usage of one query"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.candidates: dict[str, int] = {}
+        # ContextPacker stats: tokens before/after/saved, passages dropped or truncated
+        self.context: dict[str, int] = {}
+        self.agent_steps = 0
+        self.tool_calls: list[dict[str, Any]] = []
+        self.prompt_tokens: int | None = None
+        self.completion_tokens: int | None = None
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tool_call(self, tool: str, seconds: float, error: bool = False) -> None:
+        self.tool_calls.append({"tool": tool, "ms": round(seconds * 1000, 1), "error": error})
+
+    def add_agent_step(self, raw: Any) -> None:
+        """Count one LLM call of the agent and add the token usage its provider reported"""
+        self.agent_steps += 1
+        usage = _usage_from_raw(raw)
+        if usage is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + usage[0]
+            self.completion_tokens = (self.completion_tokens or 0) + usage[1]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 1),
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+            "candidates": dict(self.candidates),
+            "context": dict(self.context),
+            "agent_steps": self.agent_steps,
+            "tool_calls": list(self.tool_calls),
+            # None when the provider does not report usage
+            "tokens": {"prompt": self.prompt_tokens, "completion": self.completion_tokens},
+        }
+
+
+@contextmanager
+def timed_stage(trace: QueryTrace | None, stage: str) -> Iterator[None]:
+    """Observe a query stage in rag_query_stage_seconds and, if tracing, in the trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        QUERY_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+        if trace is not None:
+            trace.add_stage(stage, seconds)
@@ -1,28 +1,73 @@
 from llama_index.core import VectorStoreIndex, Document
 from llama_index.core.settings import Settings
-from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
 from llama_index.core.vector_stores import MetadataFilters, ExactMatchFilter
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.vector_stores.postgres import PGVectorStore
-from llama_index.core.postprocessor import SentenceTransformerRerank
 from llama_index.core.retrievers import QueryFusionRetriever
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.tools.openapi import OpenAPIToolSpec
 from llama_index.tools.requests import RequestsToolSpec
 from llama_index.core.tools.tool_spec.load_and_search.base import LoadAndSearchToolSpec
-from llama_index.core.agent.workflow import FunctionAgent
+from llama_index.core.agent.workflow import AgentOutput, FunctionAgent
 from llama_index.core.tools import FunctionTool
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.indices.utils import embed_nodes
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import MetadataMode
+from llama_index.core.utils import get_tokenizer
 
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 from datetime import datetime, timezone
+from itertools import chain
 from typing import List, Union, Optional
-from models import MessageJson, MessageMetadata, MessageData, FormattedDiscordSource, SourceType, NotionPageJson, FormattedNotionSource
-
-from sqlalchemy import create_engine, text
+from models import MessageJson, MessageMetadata, MessageData, FormattedDiscordSource, SourceType, NotionPageJson, FormattedNotionSource, SearchProfile
+from RAG.database import get_connection_string, get_async_connection_string, get_engine, get_async_engine
+from RAG.hnsw import HNSWBuildParams, get_build_params, get_embed_dim, get_search_profiles, get_default_search_profile, get_index_options, get_rescore_enabled, get_rescore_oversample, index_name_for, rebuild_hnsw_index
+from RAG.pg_store import TunedPGVectorStore
+from RAG.consistency import delete_duplicate_vectors, delete_notion_pages, delete_orphan_vectors, diff_discord_stores, fetch_messages_missing_vectors, find_stale_notion_pages
+from RAG.chunking import NotionMarkdownChunker, NotionNodeParser, get_notion_chunk_tokens
+from RAG.message_filter import get_message_filter
+from RAG.context_packer import get_context_packer
+from RAG.metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED, DOCUMENTS_DELETED, DOCUMENTS_INGESTED, INGEST_BATCH_SIZE, TOOL_CALL_SECONDS
+from RAG.tracing import QueryTrace, timed_stage
+from RAG.backends import EMBED_BACKENDS, LLM_BACKENDS, RERANK_BACKENDS
+from RAG.discord_windows import WindowAssigner, build_window_document, get_discord_index_mode, get_window_gap_seconds, get_window_tokens
+from RAG.sync_state import SYNC_STATUS_EMPTY, SYNC_STATUS_FAILED, SYNC_STATUS_INDEXED, NotionSyncState, content_hasher, ensure_sync_state_table, hash_content, hash_page_sections, lock_notion_pages
+from notion.notion_page_exporter import NotionPageStream
+
+from sqlalchemy import column, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 import json
 
+# column list for building multi-row INSERT ... RETURNING statements (the DDL lives in _ensure_relational_tables)
+DISCORD_TEXT_TABLE = table(
+    "discord_text",
+    column("message_id"),
+    column("channel_id"),
+    column("server_id"),
+    column("sender_id"),
+    column("sender_username"),
+    column("sender_nickname"),
+    column("channel_name"),
+    column("content"),
+    column("created_at"),
+    column("window_id"),
+    column("filter_reason"),
+)
+
+DISCORD_TEXT_COLUMNS = """
+    message_id, channel_id, server_id, sender_id,
+    sender_username, sender_nickname, channel_name,
+    content, created_at, window_id, filter_reason
+"""
+
+# streamed Notion pages are embedded in batches of this many chunks
+NOTION_EMBED_BATCH_SIZE = 32
+
 class VectorDB:
     def __init__(self):
         # configure notion
@@ -52,95 +97,138 @@ class VectorDB:
         ).to_tool_list()
 
 
-        # Configure embedding and reranking models
-        self.embed_model = Settings.embed_model = HuggingFaceEmbedding(
-            model_name="Qwen/Qwen3-Embedding-0.6B",
-            query_instruction="Given a Discord search query, retrieve relevant passages that answer the query"
-        )
+        # Configure embedding and reranking models (EMBED_BACKEND / RERANK_BACKEND, see RAG/backends.py)
+        self.embed_model = Settings.embed_model = EMBED_BACKENDS.build()
+        # pages are indexed from several exporter threads; only one runs the model at a time
+        self._embed_lock = threading.Lock()
 
-        # reranker (prune irrelevant context)
-        # todo test effectiveness
-        self.rerank_model = SentenceTransformerRerank(
-            model="BAAI/bge-reranker-v2-m3",
-            top_n=5
-        )
+        # DISCORD_INDEX_MODE=window embeds conversation windows instead of single messages
+        self.discord_index_mode = get_discord_index_mode()
+        self.window_assigner = WindowAssigner(get_window_gap_seconds(), get_window_tokens(), get_tokenizer())
+        # window writes read the channel's open window before rewriting it; serialize them
+        self._window_lock = threading.RLock()
+        # DISCORD_FILTER_ENABLED skips embedding low-information messages (None when disabled)
+        self.message_filter = get_message_filter(get_tokenizer())
 
-        # Choose LLM based on environment variables
-        if os.getenv("OPENAI_API_KEY"):
-            from llama_index.llms.openai import OpenAI
-            Settings.llm = OpenAI(
-                model=os.getenv("OPENAI_MODEL", "gpt-5-mini"),
-                api_base=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
-                api_key=os.getenv("OPENAI_API_KEY"),
-                max_retries=3,
-                request_timeout=60.0,
-            )
+        # reranker (prune irrelevant context); None when RERANK_BACKEND=none
+        # todo test effectiveness
+        self.rerank_model = RERANK_BACKENDS.build()
 
-            self.model = os.getenv("OPENAI_MODEL", "gpt-5-mini")
-        
-        else:
-            from llama_index.llms.ollama import Ollama
-            Settings.llm = Ollama(
-                model=os.getenv("OLLAMA_MODEL", "gpt-oss:20b"),
-                base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
-                request_timeout=60.0, 
-            )
+        # fits the reranked context into CONTEXT_MAX_TOKENS and drops near-duplicate passages
+        self.context_packer = get_context_packer(get_tokenizer())
 
-            self.model = os.getenv("OLLAMA_MODEL", "gpt-oss:20b")
-        
-        PG_USER = os.getenv("POSTGRES_USER", "postgres")
-        PG_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
-        PG_HOST = os.getenv("POSTGRES_HOST", "127.0.0.1")
-        PG_PORT = os.getenv("POSTGRES_PORT", "5432")
+        # LLM_BACKEND, or OpenAI when OPENAI_API_KEY is set and Ollama otherwise
+        Settings.llm, self.model = LLM_BACKENDS.build()
 
-        connection_string = f"postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/postgres"
-        async_connection_string = f"postgresql+asyncpg://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/postgres"
+        connection_string = get_connection_string()
+        async_connection_string = get_async_connection_string()
 
-        # for stats and relational writes
-        self._engine = create_engine(connection_string)
+        # process-wide pools shared by the vector stores and relational queries (sized by DB_POOL_* env vars)
+        self._engine = get_engine()
+        self._async_engine = get_async_engine()
         self._ensure_relational_tables()
+        self.notion_sync_state = NotionSyncState(self._engine)
+
+        # one embedding dimension for the model, both tables and the query path
+        self.embed_dim = get_embed_dim()
+        self._check_embed_dim()
+
+        # HNSW build parameters only apply when an index is created; use reindex_hnsw to apply new ones
+        self.hnsw_build_params = get_build_params(self.embed_dim)
+        self.search_profiles = get_search_profiles()
+        self.default_search_profile = get_default_search_profile()
 
-        self.discord_vector_store = PGVectorStore.from_params(
+        self.discord_vector_store = TunedPGVectorStore.from_params(
             connection_string=connection_string,
             async_connection_string=async_connection_string,
 
             table_name="discord_embeddings",
-            embed_dim=1024,
+            embed_dim=self.embed_dim,
             use_jsonb=True,
-            hnsw_kwargs={
-                "hnsw_m": 16,
-                "hnsw_ef_construction": 64,
-                "hnsw_ef_search": 40,
-                "hnsw_dist_method": "vector_cosine_ops",
-            },
-            hybrid_search=True
+            hnsw_kwargs=self._hnsw_kwargs(),
+            hybrid_search=True,
+            vector_storage=self.hnsw_build_params.storage,
+            index_dim=self.hnsw_build_params.index_dim,
+            rescore=get_rescore_enabled(),
+            rescore_oversample=get_rescore_oversample(),
+            engine=self._engine,
+            async_engine=self._async_engine
         )
         
-        self.notion_vector_store = PGVectorStore.from_params(
+        self.notion_vector_store = TunedPGVectorStore.from_params(
             connection_string=connection_string,
             async_connection_string=async_connection_string,
 
             table_name="notion_embeddings",
-            embed_dim=1024,
+            embed_dim=self.embed_dim,
             use_jsonb=True,
-            hnsw_kwargs={
-                "hnsw_m": 16,
-                "hnsw_ef_construction": 64,
-                "hnsw_ef_search": 40,
-                "hnsw_dist_method": "vector_cosine_ops",
-            },
-            hybrid_search=True
+            hnsw_kwargs=self._hnsw_kwargs(),
+            hybrid_search=True,
+            vector_storage=self.hnsw_build_params.storage,
+            index_dim=self.hnsw_build_params.index_dim,
+            rescore=get_rescore_enabled(),
+            rescore_oversample=get_rescore_oversample(),
+            engine=self._engine,
+            async_engine=self._async_engine
         )
         
+        # deletes and consistency checks look rows up by message id
+        self.discord_vector_store.create_metadata_index("messageId")
+        self.discord_vector_store.create_metadata_index("windowId")
+        self.notion_vector_store.create_metadata_index("pageId")
+
         self.messages_index = VectorStoreIndex.from_vector_store(vector_store=self.discord_vector_store)
-        self.notion_index = VectorStoreIndex.from_vector_store(vector_store=self.notion_vector_store)
+        # Notion pages are split on their markdown structure instead of Settings.node_parser
+        self.notion_node_parser = NotionNodeParser(chunk_size=get_notion_chunk_tokens())
+        self.notion_index = VectorStoreIndex.from_vector_store(
+            vector_store=self.notion_vector_store,
+            transformations=[self.notion_node_parser]
+        )
 
         # Create tool for searching Discord messages
         self._create_discord_search_tool()
 
+    def _check_embed_dim(self) -> None:
+        """Fail fast if the embedding model does not produce EMBED_DIM-dimensional vectors"""
+        model_dim = len(self.embed_model.get_query_embedding("dimension check"))
+        if model_dim != self.embed_dim:
+            raise RuntimeError(f"Embedding model produces {model_dim}-dim vectors but EMBED_DIM is {self.embed_dim}")
+
+    def _hnsw_kwargs(self) -> dict[str, int | str]:
+        """Build a fresh hnsw_kwargs dict (PGVectorStore pops the build keys when creating the index)"""
+        return {
+            "hnsw_m": self.hnsw_build_params.m,
+            "hnsw_ef_construction": self.hnsw_build_params.ef_construction,
+            "hnsw_ef_search": self.search_profiles[self.default_search_profile].ef_search,
+        }
+
+    def _search_kwargs(self, search_profile: SearchProfile | None = None) -> dict[str, int | str]:
+        """Return vector store kwargs for the requested (or default) search profile"""
+        profile = search_profile or self.default_search_profile
+        return self.search_profiles[profile].as_store_kwargs()
+
+    def reindex_hnsw(self, params: HNSWBuildParams | None = None, maintenance_work_mem: str | None = None) -> dict[str, list[str] | None]:
+        """Rebuild the HNSW indexes of both vector tables with new build parameters.
+
+        Changing the storage layout or indexed dimension also requires restarting with the matching
+        VECTOR_STORAGE / EMBED_INDEX_DIM so queries use the new index.
+        """
+        if self._engine is None:
+            raise RuntimeError("Database engine not initialized")
+
+        params = params or get_build_params(self.embed_dim)
+        index_options = {}
+        for table_name in ("data_discord_embeddings", "data_notion_embeddings"):
+            rebuild_hnsw_index(self._engine, table_name, params, embed_dim=self.embed_dim, maintenance_work_mem=maintenance_work_mem)
+            index_options[table_name] = get_index_options(self._engine, index_name_for(table_name, params))
+            print(f"Rebuilt {params.storage.value} HNSW index on {table_name} with m={params.m}, ef_construction={params.ef_construction}")
+
+        self.hnsw_build_params = params
+        return index_options
+
     def _create_discord_search_tool(self) -> None:
         """Create a tool that allows the agent to search Discord messages"""
-        def search_discord_tool(
+        async def search_discord_tool(
             search_text: Optional[str] = None,
             channel_id: Optional[str] = None,
             sender_id: Optional[str] = None,
@@ -187,7 +275,7 @@ class VectorDB:
             limit = min(limit, 100)
             
             try:
-                messages = self.search_discord_messages(
+                messages = await self.search_discord_messages(
                     server_id=server_id,
                     search_text=search_text,
                     channel_id=channel_id,
@@ -213,7 +301,7 @@ class VectorDB:
                 return f"Error searching messages: {str(e)}"
         
         self.discord_search_tool = FunctionTool.from_defaults(
-            fn=search_discord_tool,
+            async_fn=search_discord_tool,
             name="search_discord_messages",
             description="""Search Discord messages using direct database queries. 
             Use this tool when you need to find specific messages by text content, 
@@ -221,25 +309,25 @@ class VectorDB:
             for exact matches or date-based queries."""
         )
 
-    def get_stats(self, server_id: str | None = None) -> dict[str, int | str]:
+    async def get_stats(self, server_id: str | None = None) -> dict[str, int | str]:
         """Return basic document counts for Discord messages and Notion pages."""
-        if self._engine is None:
+        if self._async_engine is None:
             raise RuntimeError("Database engine not initialized")
 
         stats: dict[str, int | str] = {}
 
         try:
-            with self._engine.connect() as conn:
-                discord_table = conn.execute(text("SELECT to_regclass('data_discord_embeddings')")).scalar()
+            async with self._async_engine.connect() as conn:
+                discord_table = (await conn.execute(text("SELECT to_regclass('data_discord_embeddings')"))).scalar()
                 if discord_table:
-                    total_discord = conn.execute(text("SELECT COUNT(*) FROM data_discord_embeddings")).scalar_one()
+                    total_discord = (await conn.execute(text("SELECT COUNT(*) FROM data_discord_embeddings"))).scalar_one()
                     stats["discord_messages_total"] = int(total_discord)
 
                     if server_id:
-                        server_discord = conn.execute(
+                        server_discord = (await conn.execute(
                             text("SELECT COUNT(*) FROM data_discord_embeddings WHERE metadata_ ->> 'serverId' = :server_id"),
                             {"server_id": server_id}
-                        ).scalar_one()
+                        )).scalar_one()
                         stats["discord_messages_for_server"] = int(server_discord)
                         stats["server_id"] = server_id
                 else:
@@ -249,9 +337,9 @@ class VectorDB:
                         stats["discord_messages_for_server"] = 0
                         stats["server_id"] = server_id
 
-                notion_table = conn.execute(text("SELECT to_regclass('data_notion_embeddings')")).scalar()
+                notion_table = (await conn.execute(text("SELECT to_regclass('data_notion_embeddings')"))).scalar()
                 if notion_table:
-                    notion_count = conn.execute(text("SELECT COUNT(*) FROM data_notion_embeddings")).scalar_one()
+                    notion_count = (await conn.execute(text("SELECT COUNT(*) FROM data_notion_embeddings"))).scalar_one()
                     stats["notion_documents_total"] = int(notion_count)
                 else:
                     print("Notion embeddings table does not exist")
@@ -263,7 +351,34 @@ class VectorDB:
 
         return stats
     
-    def search_discord_messages(
+    async def get_discord_filter_stats(self) -> dict:
+        """Messages kept out of the Discord vector store by the pre-embedding filter, and what that saved.
+
+        `stored` counts every filtered message in discord_text; `session` holds the live filter's
+        counters since startup (None when DISCORD_FILTER_ENABLED is off).
+        """
+        if self._async_engine is None:
+            raise RuntimeError("Database engine not initialized")
+
+        async with self._async_engine.connect() as conn:
+            rows = (await conn.execute(text("""
+                SELECT filter_reason, COUNT(*) AS messages, COALESCE(SUM(LENGTH(content)), 0) AS characters
+                FROM discord_text
+                WHERE filter_reason IS NOT NULL
+                GROUP BY filter_reason
+            """))).fetchall()
+
+        saved_vectors = sum(int(row.messages) for row in rows)
+        return {
+            "enabled": self.message_filter is not None,
+            "stored": {row.filter_reason: int(row.messages) for row in rows},
+            "saved_vectors": saved_vectors,
+            # float32 embedding plus the text and metadata copied into every vector row
+            "saved_vector_bytes": saved_vectors * self.embed_dim * 4 + sum(int(row.characters) for row in rows),
+            "session": self.message_filter.snapshot() if self.message_filter is not None else None,
+        }
+
+    async def search_discord_messages(
         self,
         server_id: str,
         search_text: str | None = None,
@@ -288,7 +403,7 @@ class VectorDB:
         Returns:
             List of MessageJson objects matching the search criteria
         """
-        if self._engine is None:
+        if self._async_engine is None:
             raise RuntimeError("Database engine not initialized")
         
         # Cap the limit to prevent excessive results
@@ -329,36 +444,36 @@ class VectorDB:
         params["limit"] = limit
         
         try:
-            with self._engine.connect() as conn:
-                result = conn.execute(text(query), params)
+            async with self._async_engine.connect() as conn:
+                result = await conn.execute(text(query), params)
                 rows = result.fetchall()
                 
                 # Convert rows to MessageJson objects
-                messages = []
-                for row in rows:
-                    message_json = MessageJson(
-                        metadata=MessageMetadata(
-                            messageId=row.message_id,
-                            channelId=row.channel_id,
-                            serverId=row.server_id,
-                            senderId=row.sender_id,
-                            dateTime=row.created_at
-                        ),
-                        data=MessageData(
-                            senderUsername=row.sender_username,
-                            senderNickname=row.sender_nickname,
-                            channelName=row.channel_name,
-                            content=row.content
-                        )
-                    )
-                    messages.append(message_json)
-                
-                return messages
+                return [self._row_to_message(row) for row in rows]
                 
         except SQLAlchemyError as exc:
             print(f"Error searching Discord messages: {exc}")
             raise
     
+    @staticmethod
+    def _row_to_message(row) -> MessageJson:
+        """Convert a discord_text row to a MessageJson"""
+        return MessageJson(
+            metadata=MessageMetadata(
+                messageId=row.message_id,
+                channelId=row.channel_id,
+                serverId=row.server_id,
+                senderId=row.sender_id,
+                dateTime=row.created_at
+            ),
+            data=MessageData(
+                senderUsername=row.sender_username,
+                senderNickname=row.sender_nickname,
+                channelName=row.channel_name,
+                content=row.content
+            )
+        )
+
     def _ensure_relational_tables(self) -> None:
         """Create auxiliary Postgres tables required by the API if missing."""
         if self._engine is None:
@@ -384,7 +499,13 @@ class VectorDB:
         index_statements = [
             text("CREATE INDEX IF NOT EXISTS idx_discord_text_server_channel ON discord_text (server_id, channel_id)"),
             text("CREATE INDEX IF NOT EXISTS idx_discord_text_sender ON discord_text (sender_id)"),
-            text("CREATE INDEX IF NOT EXISTS idx_discord_text_created_at ON discord_text (created_at)")
+            text("CREATE INDEX IF NOT EXISTS idx_discord_text_created_at ON discord_text (created_at)"),
+            # conversation windows: members of a window, and the newest message of a channel
+            text("ALTER TABLE discord_text ADD COLUMN IF NOT EXISTS window_id TEXT"),
+            text("CREATE INDEX IF NOT EXISTS idx_discord_text_window ON discord_text (window_id) WHERE window_id IS NOT NULL"),
+            text("CREATE INDEX IF NOT EXISTS idx_discord_text_channel_created_at ON discord_text (server_id, channel_id, created_at DESC)"),
+            # messages the pre-embedding filter kept out of the vector store (NULL = embedded)
+            text("ALTER TABLE discord_text ADD COLUMN IF NOT EXISTS filter_reason TEXT")
         ]
 
         try:
@@ -392,8 +513,9 @@ class VectorDB:
                 conn.execute(create_table_stmt)
                 for stmt in index_statements:
                     conn.execute(stmt)
+                ensure_sync_state_table(conn)
         except SQLAlchemyError as exc:
-            print(f"Error ensuring discord_text table exists: {exc}")
+            print(f"Error ensuring relational tables exist: {exc}")
             raise
     
     def shutdown(self) -> None:
@@ -423,11 +545,6 @@ class VectorDB:
             import gc
             gc.collect()
 
-            if hasattr(self, '_engine') and self._engine is not None:
-                self._engine.dispose()
-                self._engine = None
-                print("Database engine disposed successfully")
-            
             print("VectorDB shutdown completed successfully")
             
         except Exception as e:
@@ -451,11 +568,40 @@ class VectorDB:
         try:
             # Clear all documents from the Notion table
             self.notion_vector_store.delete_nodes()
+            # every page must be exported again
+            with self._engine.begin() as conn:
+                conn.execute(text("DELETE FROM notion_sync_state"))
             print("Successfully deleted all Notion documents from the vector store")
         except Exception as e:
             print(f"Error deleting all Notion documents: {e}")
             raise
             
+    def reconcile_notion_pages(self, live_page_ids: set[str], batch_size: int = 500) -> int:
+        """Delete the documents of pages that are no longer live in Notion (deleted or archived).
+
+        `live_page_ids` must come from a full workspace listing. Returns the number of pages removed.
+        """
+        if not live_page_ids:
+            # an empty listing is far more likely a lost integration share than an empty workspace
+            print("Skipping Notion reconciliation: the workspace listing returned no pages")
+            return 0
+
+        stale_page_ids = find_stale_notion_pages(self._engine, live_page_ids)
+        if not stale_page_ids:
+            return 0
+
+        deleted_rows = self.delete_notion_pages(stale_page_ids, batch_size=batch_size)
+        print(f"Removed {len(stale_page_ids)} deleted or archived Notion pages ({deleted_rows} rows)")
+        return len(stale_page_ids)
+
+    def delete_notion_pages(self, page_ids: List[str], batch_size: int = 500) -> int:
+        """Delete the documents of several Notion pages; returns the number of rows deleted"""
+        if not page_ids:
+            return 0
+        deleted_rows = delete_notion_pages(self._engine, page_ids, batch_size=batch_size)
+        DOCUMENTS_DELETED.labels(source="notion").inc(len(page_ids))
+        return deleted_rows
+
     def store_notion_page(self, page: NotionPageJson) -> None:
         """Store a single Notion page in the vector database"""
         # Delete any existing documents with the same page ID
@@ -464,9 +610,13 @@ class VectorDB:
         # Insert the new document
         page_doc = self.build_notion_page(page)
         self.notion_index.insert(page_doc)
+        self.notion_sync_state.mark_synced(page.metadata.pageId, page.metadata.lastEditedTime, hash_content(page_doc.text))
+        INGEST_BATCH_SIZE.labels(source="notion").observe(1)
+        DOCUMENTS_INGESTED.labels(source="notion").inc()
 
     def store_notion_pages(self, pages: List[NotionPageJson]) -> None:
         """Store a list of Notion pages in the vector database"""
+        INGEST_BATCH_SIZE.labels(source="notion").observe(len(pages))
         # Delete existing documents for each page ID
         for page in pages:
             if page.data.content.strip() == "" or page.data.content.strip == "![]":
@@ -475,11 +625,118 @@ class VectorDB:
             self.delete_notion_page_by_id(page.metadata.pageId)
             page_doc = self.build_notion_page(page)
             self.notion_index.insert(page_doc)
+            self.notion_sync_state.mark_synced(page.metadata.pageId, page.metadata.lastEditedTime, hash_content(page_doc.text))
+            DOCUMENTS_INGESTED.labels(source="notion").inc()
         
         # Insert all new documents
         # page_list = [self.build_notion_page(page) for page in pages]
         # self.notion_index.insert_nodes(page_list)
-    
+
+    def store_notion_page_stream(self, stream: NotionPageStream) -> int:
+        """Chunk and embed a Notion page while its sections are still being fetched.
+
+        Sections are split on their heading/table/code structure as they arrive (NotionMarkdownChunker)
+        and embedded in batches, so the page's markdown is never joined into one string. The embedded
+        nodes (chunk text and vectors) are kept until the old documents of the page and its sync state
+        are replaced in one transaction, so memory still grows with the size of the page.
+
+        For a page synced before, an unchanged content hash only advances the sync state. With the
+        block cache enabled the sections are hashed in a first streaming pass, which also fills the
+        cache, and are replayed from the cache for embedding only if the hash changed. Without it
+        the page is embedded while it streams and the nodes are dropped if the hash turns out equal.
+        A page is only recorded as empty once its whole stream was read without error.
+        Returns the number of nodes written (0 for an empty or unchanged page).
+        """
+        page_id = stream.metadata.pageId
+        last_edited_time = stream.metadata.lastEditedTime
+        previous = self.notion_sync_state.get(page_id)
+        previous_hash = previous.content_hash if previous is not None else None
+
+        def unchanged() -> int:
+            # a failed retry keeps the rows of its last good sync, which match this content
+            status = SYNC_STATUS_INDEXED if previous.status == SYNC_STATUS_FAILED else previous.status
+            self.notion_sync_state.mark_synced(page_id, last_edited_time, previous_hash, status)
+            return 0
+
+        sections = iter(stream.sections)
+        if previous_hash is not None and stream.replay is not None:
+            # an edit time can move without a content change (e.g. property or comment edits)
+            first_pass = content_hasher()
+            for _ in hash_page_sections(first_pass, stream.title, stream.author, sections):
+                pass
+            if first_pass.hexdigest() == previous_hash:
+                return unchanged()
+            sections = iter(stream.replay())
+
+        # look ahead past blank sections so an empty page is never embedded
+        leading: List[str] = []
+        for section in sections:
+            leading.append(section)
+            if section.strip() not in ("", "![]"):
+                break
+        is_empty = not leading or leading[-1].strip() in ("", "![]")
+
+        # hashed again on the pass that is indexed, so the stored hash always matches the rows
+        hasher = content_hasher()
+        hashed_sections = hash_page_sections(hasher, stream.title, stream.author, chain(leading, sections))
+
+        if is_empty:
+            # read to the end before anything is written: a block listing that fails raises here, so
+            # the page is marked failed and retried with its rows and sync state left as they were
+            for _ in hashed_sections:
+                pass
+            with self.notion_vector_store.session() as session, session.begin():
+                lock_notion_pages(session, [page_id])
+                self.notion_vector_store.delete_by_metadata_in_session(session, "pageId", [page_id])
+                self.notion_sync_state.mark_synced(page_id, last_edited_time, hasher.hexdigest(), SYNC_STATUS_EMPTY, session=session)
+            return 0
+
+        ref_doc = Document(text="", metadata=stream.metadata.model_dump(mode='json'))
+        # chunk sizes are budgeted with the metadata that is prepended at embedding time
+        metadata_str = max(
+            ref_doc.get_metadata_str(mode=MetadataMode.EMBED),
+            ref_doc.get_metadata_str(mode=MetadataMode.LLM),
+            key=len
+        )
+        chunker = NotionMarkdownChunker(self.notion_node_parser.chunk_size, metadata_str=metadata_str)
+        chunks = chunker.iter_chunks(stream.title, stream.author, hashed_sections)
+
+        nodes: List[BaseNode] = []
+        batch: List[str] = []
+
+        def embed_batch() -> None:
+            batch_nodes = build_nodes_from_splits(batch, ref_doc)
+            for node in batch_nodes:
+                node.metadata = {**ref_doc.metadata, **node.metadata}
+            with self._embed_lock:
+                id_to_embedding = embed_nodes(batch_nodes, self.embed_model)
+            for node in batch_nodes:
+                node.embedding = id_to_embedding[node.node_id]
+            nodes.extend(batch_nodes)
+            batch.clear()
+
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= NOTION_EMBED_BATCH_SIZE:
+                embed_batch()
+        if batch:
+            embed_batch()
+
+        if hasher.hexdigest() == previous_hash:
+            # embedded optimistically (no block cache to replay from); the stored rows already match
+            return unchanged()
+
+        with self.notion_vector_store.session() as session, session.begin():
+            # another writer of this page (webhook batch, polling run, import_notion.py) commits
+            # first, so the delete below also removes its rows
+            lock_notion_pages(session, [page_id])
+            self.notion_vector_store.delete_by_metadata_in_session(session, "pageId", [page_id])
+            self.notion_vector_store.add_in_session(session, nodes)
+            self.notion_sync_state.mark_synced(page_id, last_edited_time, hasher.hexdigest(), session=session)
+
+        DOCUMENTS_INGESTED.labels(source="notion").inc(len(nodes))
+        return len(nodes)
+
     def retrieve_notion(self, query: str) -> List[Document]:
         """Retrieve relevant Notion pages based on a query"""
         retriever = self.notion_index.as_retriever()
@@ -493,97 +750,354 @@ class VectorDB:
                 metadata=node.metadata
             )
             documents.append(doc)
-        
-        print(documents)
+
         return documents
     
-    def store_discord_message(self, message: MessageJson) -> None:
-        message_id = message.metadata.messageId
+    def _discord_text_row(self, message: MessageJson) -> dict:
+        return {
+            "server_id": message.metadata.serverId,
+            "channel_id": message.metadata.channelId,
+            "message_id": message.metadata.messageId,
+            "sender_id": message.metadata.senderId,
+            "sender_username": message.data.senderUsername,
+            "sender_nickname": message.data.senderNickname,
+            "channel_name": message.data.channelName,
+            "content": message.data.content,
+            "created_at": message.metadata.dateTime
+        }
+
+    def _filter_discord_messages(self, messages: List[MessageJson], check_duplicates: bool = True) -> dict[str, str]:
+        """Run the pre-embedding filter in time order; returns {message id: reason} of messages not to embed"""
+        if self.message_filter is None:
+            return {}
+
+        filtered = {}
+        for message in sorted(messages, key=lambda message: message.metadata.dateTime):
+            reason = self.message_filter.check(message, check_duplicates=check_duplicates)
+            if reason is not None:
+                filtered[message.metadata.messageId] = reason
+        return filtered
+
+    def _embed_discord_documents(self, documents: List[Document]) -> List[BaseNode]:
+        """Chunk and embed documents outside of any transaction (the slow part of a write)"""
+        nodes = run_transformations(documents, Settings.transformations)
+        id_to_embedding = embed_nodes(nodes, self.embed_model)
+        for node in nodes:
+            node.embedding = id_to_embedding[node.node_id]
+        return nodes
+
+    def _embed_discord_messages(self, messages: List[MessageJson]) -> List[BaseNode]:
+        return self._embed_discord_documents([self.build_message(message) for message in messages])
+
+    def _embed_discord_windows(self, windows: dict[str, List[MessageJson]]) -> List[BaseNode]:
+        return self._embed_discord_documents([
+            build_window_document(window_id, members) for window_id, members in windows.items()
+        ])
+
+    def _load_discord_windows(self, conn, window_ids) -> dict[str, List[MessageJson]]:
+        """Stored members of each window, in time order"""
+        rows = conn.execute(
+            text(f"""
+                SELECT {DISCORD_TEXT_COLUMNS}
+                FROM discord_text
+                WHERE window_id = ANY(:window_ids)
+                ORDER BY created_at, message_id
+            """),
+            {"window_ids": list(window_ids)}
+        ).fetchall()
+
+        windows: dict[str, List[MessageJson]] = {}
+        for row in rows:
+            windows.setdefault(row.window_id, []).append(self._row_to_message(row))
+        return windows
+
+    def _load_open_window(self, conn, server_id: str, channel_id: str) -> tuple[str | None, List[MessageJson]]:
+        """The window of the channel's newest message (none if that message was embedded on its own)"""
+        window_id = conn.execute(
+            text("""
+                SELECT window_id FROM discord_text
+                WHERE server_id = :server_id AND channel_id = :channel_id AND filter_reason IS NULL
+                ORDER BY created_at DESC
+                LIMIT 1
+            """),
+            {"server_id": server_id, "channel_id": channel_id}
+        ).scalar()
+        if window_id is None:
+            return None, []
+        return window_id, self._load_discord_windows(conn, [window_id]).get(window_id, [])
+
+    def _write_discord_windows(self, messages: List[MessageJson], replace: bool = False) -> int:
+        """Window-mode counterpart of _write_discord_messages.
+
+        New messages extend their channel's open window or open new ones; every window that gained
+        or changed a member is embedded again and replaces its old nodes in the same transaction
+        that writes discord_text. With `replace`, messages already in a window are edited in place.
+        Returns the number of messages written.
+        """
+        if self._engine is None:
+            raise RuntimeError("Database engine not initialized")
 
-        filters = MetadataFilters(filters=[ExactMatchFilter(key="messageId", value=message_id)])
-        existing_nodes = self.discord_vector_store.get_nodes(filters=filters)
+        unique_messages: dict[str, MessageJson] = {}
+        for message in messages:
+            unique_messages.setdefault(message.metadata.messageId, message)
 
-        # insert to vector store if not exists
-        if existing_nodes:
-            print(f"Message {message_id} already exists in vector index; skipping insert")
-        else:
-            messageDoc = self.build_message(message)
-            self.messages_index.insert(messageDoc)
-
-        # insert to postgres table if not exists
-        with self._engine.begin() as conn:
-            insert_query = text("""
-                INSERT INTO discord_text (server_id, channel_id, message_id, sender_id, sender_username, sender_nickname, channel_name, content, created_at)
-                VALUES (:server_id, :channel_id, :message_id, :sender_id, :sender_username, :sender_nickname, :channel_name, :content, :created_at)
-                ON CONFLICT (message_id) DO NOTHING;
-            """)
-            conn.execute(insert_query, {
-                "server_id": message.metadata.serverId,
-                "channel_id": message.metadata.channelId,
-                "message_id": message.metadata.messageId,
-                "sender_id": message.metadata.senderId,
-                "sender_username": message.data.senderUsername,
-                "sender_nickname": message.data.senderNickname,
-                "channel_name": message.data.channelName,
-                "content": message.data.content,
-                "created_at": message.metadata.dateTime
-            })
-        
+        with self._window_lock:
+            with self._engine.connect() as conn:
+                stored_windows = dict(conn.execute(
+                    text("SELECT message_id, window_id FROM discord_text WHERE message_id = ANY(:message_ids)"),
+                    {"message_ids": list(unique_messages)}
+                ).all())
+
+                if not replace:
+                    for message_id in stored_windows:
+                        print(f"Message {message_id} already exists; skipping insert")
+                        del unique_messages[message_id]
+                # filtered messages stay out of windows; an edit can move a message in or out of one
+                filtered = self._filter_discord_messages(list(unique_messages.values()), check_duplicates=not replace)
+
+                windows: dict[str, List[MessageJson]] = {}
+                if replace:
+                    edited_window_ids = {window_id for window_id in stored_windows.values() if window_id is not None}
+                    for window_id, members in self._load_discord_windows(conn, edited_window_ids).items():
+                        windows[window_id] = [
+                            unique_messages.get(member.metadata.messageId, member) for member in members
+                            if member.metadata.messageId not in filtered
+                        ]
+                new_messages = [
+                    message for message_id, message in unique_messages.items()
+                    if stored_windows.get(message_id) is None and message_id not in filtered
+                ]
+
+                channels: dict[tuple[str, str], List[MessageJson]] = {}
+                for message in new_messages:
+                    channels.setdefault((message.metadata.serverId, message.metadata.channelId), []).append(message)
+                for (server_id, channel_id), channel_messages in channels.items():
+                    open_window_id, open_window = self._load_open_window(conn, server_id, channel_id)
+                    windows.update(self.window_assigner.assign(channel_messages, open_window, open_window_id))
+
+            if not unique_messages:
+                return 0
+
+            nodes = self._embed_discord_windows({window_id: members for window_id, members in windows.items() if members})
+            window_of = {
+                member.metadata.messageId: window_id
+                for window_id, members in windows.items()
+                for member in members
+            }
+            message_rows = [
+                {
+                    **self._discord_text_row(message),
+                    "window_id": window_of.get(message_id),
+                    "filter_reason": filtered.get(message_id),
+                }
+                for message_id, message in unique_messages.items()
+            ]
+
+            with self.discord_vector_store.session() as session, session.begin():
+                if replace:
+                    # also drops single-message nodes left from DISCORD_INDEX_MODE=message
+                    self.discord_vector_store.delete_by_metadata_in_session(session, "messageId", list(unique_messages))
+                    session.execute(
+                        text("DELETE FROM discord_text WHERE message_id = ANY(:message_ids)"),
+                        {"message_ids": list(unique_messages)}
+                    )
+
+                insert_query = (
+                    pg_insert(DISCORD_TEXT_TABLE)
+                    .values(message_rows)
+                    .on_conflict_do_nothing(index_elements=["message_id"])
+                    .returning(DISCORD_TEXT_TABLE.c.message_id)
+                )
+                inserted_ids = set(session.execute(insert_query).scalars())
+                self.discord_vector_store.delete_by_metadata_in_session(session, "windowId", list(windows))
+                self.discord_vector_store.add_in_session(session, nodes)
+
+        return len(inserted_ids)
+
+    def _rebuild_discord_windows(self, window_ids: List[str]) -> int:
+        """Embed the stored members of `window_ids` again; windows without members lose their nodes"""
+        with self._window_lock:
+            with self._engine.connect() as conn:
+                windows = self._load_discord_windows(conn, window_ids)
+            nodes = self._embed_discord_windows(windows) if windows else []
+
+            with self.discord_vector_store.session() as session, session.begin():
+                self.discord_vector_store.delete_by_metadata_in_session(session, "windowId", list(window_ids))
+                self.discord_vector_store.add_in_session(session, nodes)
+        return len(windows)
+
+    def rebuild_discord_windows(self, server_id: str | None = None) -> dict[str, int]:
+        """Regroup every stored message (of one server, or all) into windows and embed them.
+
+        Used after switching DISCORD_INDEX_MODE to window; the single-message nodes of each channel
+        are replaced in the channel's transaction.
+        """
+        if self._engine is None:
+            raise RuntimeError("Database engine not initialized")
+
+        query = "SELECT DISTINCT server_id, channel_id FROM discord_text"
+        params = {}
+        if server_id:
+            query += " WHERE server_id = :server_id"
+            params["server_id"] = server_id
+
+        with self._engine.connect() as conn:
+            channels = conn.execute(text(query), params).fetchall()
+
+        report = {"channels": 0, "messages": 0, "windows": 0}
+        for channel in channels:
+            with self._window_lock:
+                with self._engine.connect() as conn:
+                    rows = conn.execute(
+                        text(f"""
+                            SELECT {DISCORD_TEXT_COLUMNS}
+                            FROM discord_text
+                            WHERE server_id = :server_id AND channel_id = :channel_id AND filter_reason IS NULL
+                        """),
+                        {"server_id": channel.server_id, "channel_id": channel.channel_id}
+                    ).fetchall()
+                if not rows:
+                    continue
+
+                old_window_ids = {row.window_id for row in rows if row.window_id is not None}
+                windows = self.window_assigner.assign([self._row_to_message(row) for row in rows])
+                nodes = self._embed_discord_windows(windows)
+                message_ids = [member.metadata.messageId for members in windows.values() for member in members]
+                window_ids = [window_id for window_id, members in windows.items() for _ in members]
+
+                with self.discord_vector_store.session() as session, session.begin():
+                    self.discord_vector_store.delete_by_metadata_in_session(session, "messageId", message_ids)
+                    self.discord_vector_store.delete_by_metadata_in_session(session, "windowId", list(old_window_ids | set(windows)))
+                    session.execute(
+                        text("""
+                            UPDATE discord_text SET window_id = assigned.window_id
+                            FROM UNNEST(CAST(:message_ids AS TEXT[]), CAST(:window_ids AS TEXT[])) AS assigned (message_id, window_id)
+                            WHERE discord_text.message_id = assigned.message_id
+                        """),
+                        {"message_ids": message_ids, "window_ids": window_ids}
+                    )
+                    self.discord_vector_store.add_in_session(session, nodes)
+
+            report["channels"] += 1
+            report["messages"] += len(message_ids)
+            report["windows"] += len(windows)
+            print(f"Rebuilt {len(windows)} windows from {len(message_ids)} messages in channel {channel.channel_id}")
+
+        return report
+
+    def _write_discord_messages(self, messages: List[MessageJson], replace: bool = False) -> int:
+        """Write messages to data_discord_embeddings and discord_text in one transaction.
+
+        Without `replace`, messages already in discord_text are skipped (and not embedded). With
+        `replace`, the old rows of every message id are deleted in the same transaction first.
+        Returns the number of messages written.
+        """
+        if self._engine is None:
+            raise RuntimeError("Database engine not initialized")
+
+        # the first copy of a message id in the batch wins, as with ON CONFLICT DO NOTHING
+        unique_messages: dict[str, MessageJson] = {}
+        for message in messages:
+            unique_messages.setdefault(message.metadata.messageId, message)
+
+        if not replace:
+            with self._engine.connect() as conn:
+                existing_ids = set(conn.execute(
+                    text("SELECT message_id FROM discord_text WHERE message_id = ANY(:message_ids)"),
+                    {"message_ids": list(unique_messages)}
+                ).scalars())
+            for message_id in existing_ids:
+                print(f"Message {message_id} already exists; skipping insert")
+                del unique_messages[message_id]
+
+        if not unique_messages:
+            return 0
+
+        filtered = self._filter_discord_messages(list(unique_messages.values()), check_duplicates=not replace)
+        nodes = self._embed_discord_messages([
+            message for message_id, message in unique_messages.items() if message_id not in filtered
+        ])
+        message_rows = [
+            {**self._discord_text_row(message), "filter_reason": filtered.get(message_id)}
+            for message_id, message in unique_messages.items()
+        ]
+
+        with self.discord_vector_store.session() as session, session.begin():
+            if replace:
+                self.discord_vector_store.delete_by_metadata_in_session(session, "messageId", list(unique_messages))
+                session.execute(
+                    text("DELETE FROM discord_text WHERE message_id = ANY(:message_ids)"),
+                    {"message_ids": list(unique_messages)}
+                )
+
+            insert_query = (
+                pg_insert(DISCORD_TEXT_TABLE)
+                .values(message_rows)
+                .on_conflict_do_nothing(index_elements=["message_id"])
+                .returning(DISCORD_TEXT_TABLE.c.message_id)
+            )
+            # a concurrent writer may have inserted some ids since the check; only embed what we inserted
+            inserted_ids = set(session.execute(insert_query).scalars())
+            self.discord_vector_store.add_in_session(
+                session,
+                [node for node in nodes if node.metadata.get("messageId") in inserted_ids]
+            )
+
+        return len(inserted_ids)
+
+    def store_discord_message(self, message: MessageJson) -> None:
+        self.store_discord_message_list([message])
 
     def store_discord_message_list(self, messages: List[MessageJson]) -> None:
 
         if not messages:
             return
 
-        # insert to vector store
-        message_documents = [self.build_message(message) for message in messages]
-        self.messages_index.insert_nodes(message_documents)
+        INGEST_BATCH_SIZE.labels(source="discord").observe(len(messages))
+        if self.discord_index_mode == "window":
+            written = self._write_discord_windows(messages)
+        else:
+            written = self._write_discord_messages(messages)
+        DOCUMENTS_INGESTED.labels(source="discord").inc(written)
 
-        # insert to postgres table
-        message_rows = []
-        for message in messages:
-            message_rows.append({
-                "server_id": message.metadata.serverId,
-                "channel_id": message.metadata.channelId,
-                "message_id": message.metadata.messageId,
-                "sender_id": message.metadata.senderId,
-                "sender_username": message.data.senderUsername,
-                "sender_nickname": message.data.senderNickname,
-                "channel_name": message.data.channelName,
-                "content": message.data.content,
-                "created_at": message.metadata.dateTime
-            })
-
-        with self._engine.begin() as conn:
-            insert_query = text("""
-                INSERT INTO discord_text (server_id, channel_id, message_id, sender_id, sender_username, sender_nickname, channel_name, content, created_at)
-                VALUES (:server_id, :channel_id, :message_id, :sender_id, :sender_username, :sender_nickname, :channel_name, :content, :created_at)
-                ON CONFLICT (message_id) DO NOTHING;
-            """)
-            conn.execute(insert_query, message_rows)
+    def update_discord_message(self, message: MessageJson) -> None:
+        """Replace a message's text and embeddings atomically"""
+        if self.discord_index_mode == "window":
+            written = self._write_discord_windows([message], replace=True)
+        else:
+            written = self._write_discord_messages([message], replace=True)
+        DOCUMENTS_INGESTED.labels(source="discord").inc(written)
 
-        
-    
     def delete_discord_message(self, messageId: str):
         try:
-            # Create a filter to match documents with the specific page ID
-            filters = MetadataFilters(filters=[ExactMatchFilter(key="messageId", value=messageId)])            
-            # Delete documents from the vector store that match the filter
-            nodes_to_delete = self.discord_vector_store.get_nodes(filters=filters)
-            delete_ids = [node.node_id for node in nodes_to_delete]
-
-            self.discord_vector_store.delete_nodes(node_ids=delete_ids,filters=filters)
-
-            if self._engine is None:
-                raise RuntimeError("Database engine not initialized")
+            with self._window_lock:
+                with self._engine.connect() as conn:
+                    window_id = conn.execute(
+                        text("SELECT window_id FROM discord_text WHERE message_id = :message_id"),
+                        {"message_id": messageId}
+                    ).scalar()
+                    windows = self._load_discord_windows(conn, [window_id]) if window_id is not None else {}
+
+                # the rest of the message's window is embedded again without it
+                remaining = {
+                    window_id: [member for member in members if member.metadata.messageId != messageId]
+                    for window_id, members in windows.items()
+                }
+                remaining = {window_id: members for window_id, members in remaining.items() if members}
+                nodes = self._embed_discord_windows(remaining) if remaining else []
+
+                # vector rows and SQL representation are deleted in the same transaction
+                with self.discord_vector_store.session() as session, session.begin():
+                    self.discord_vector_store.delete_by_metadata_in_session(session, "messageId", [messageId])
+                    if window_id is not None:
+                        self.discord_vector_store.delete_by_metadata_in_session(session, "windowId", [window_id])
+                    session.execute(
+                        text("DELETE FROM discord_text WHERE message_id = :message_id"),
+                        {"message_id": messageId}
+                    )
+                    self.discord_vector_store.add_in_session(session, nodes)
 
-            # Keep SQL representation in sync with vector store entries
-            with self._engine.begin() as conn:
-                conn.execute(
-                    text("DELETE FROM discord_text WHERE message_id = :message_id"),
-                    {"message_id": messageId}
-                )
-           
+            DOCUMENTS_DELETED.labels(source="discord").inc()
             print(f"Deleted existing documents for message ID: {messageId}")
         except Exception as e:
             print(f"Warning: Could not delete existing documents for message ID {messageId}: {e}")
@@ -592,19 +1106,51 @@ class VectorDB:
         """Delete all documents from the Discord vector store"""
         try:
             # Clear all documents from the Discord tables
-            self.discord_vector_store.delete_nodes()
-
-            if self._engine is None:
-                raise RuntimeError("Database engine not initialized")
-
-            with self._engine.begin() as conn:
-                conn.execute(text("DELETE FROM discord_text"))
+            with self.discord_vector_store.session() as session, session.begin():
+                session.execute(text("DELETE FROM data_discord_embeddings"))
+                session.execute(text("DELETE FROM discord_text"))
 
             print("Successfully deleted all Discord documents from the vector store")
         except Exception as e:
             print(f"Error deleting all Discord documents: {e}")
             raise
 
+    def check_discord_consistency(self, repair: bool = False, batch_size: int = 256) -> dict:
+        """Diff discord_text against the Discord embeddings by message id.
+
+        With `repair`, orphaned and duplicated embedding rows are deleted and messages without
+        embeddings are re-embedded (messages of a conversation window by rebuilding the window).
+        Returns the report from before the repair.
+        """
+        if self._engine is None:
+            raise RuntimeError("Database engine not initialized")
+
+        report = diff_discord_stores(self._engine)
+        if not repair:
+            return report
+
+        report["deleted_orphan_vectors"] = delete_orphan_vectors(self._engine)
+        report["deleted_duplicate_vectors"] = delete_duplicate_vectors(self._engine)
+
+        reembedded = 0
+        rows = fetch_messages_missing_vectors(self._engine)
+
+        # a window missing a member (or its node) is embedded again as a whole
+        window_ids = sorted({row.window_id for row in rows if row.window_id is not None})
+        for start in range(0, len(window_ids), batch_size):
+            self._rebuild_discord_windows(window_ids[start:start + batch_size])
+        report["rebuilt_windows"] = len(window_ids)
+        rows = [row for row in rows if row.window_id is None]
+
+        for start in range(0, len(rows), batch_size):
+            nodes = self._embed_discord_messages([self._row_to_message(row) for row in rows[start:start + batch_size]])
+            with self.discord_vector_store.session() as session, session.begin():
+                self.discord_vector_store.add_in_session(session, nodes)
+            reembedded += len(rows[start:start + batch_size])
+        report["reembedded_messages"] = reembedded
+
+        return report
+
     def retrieve_discord(self, query: str, server_id: str) -> List[Document]:
         """Retrieve relevant Discord messages based on a query"""
         filters = MetadataFilters(filters=[ExactMatchFilter(key="serverId", value=server_id)])
@@ -619,60 +1165,124 @@ class VectorDB:
                 metadata=node.metadata
             )
             documents.append(doc)
-        
-        print(documents)
-        
+
         return documents
     
-    async def llm_response(self, query: str, server_id: str, similarity_top_k: int = 7, enabled_sources: List[SourceType] = [SourceType.DISCORD, SourceType.NOTION]) -> tuple[str, List[Union[FormattedDiscordSource, FormattedNotionSource]]]:
-        """Generate an LLM response based on retrieved messages using FunctionAgent with Notion tools"""
-
-        # Set server_id for the discord search tool
-        self._current_server_id = server_id
+    async def retrieve_nodes(
+        self,
+        query: str,
+        server_id: str,
+        similarity_top_k: int = 7,
+        enabled_sources: List[SourceType] = [SourceType.DISCORD, SourceType.NOTION],
+        search_kwargs: dict[str, int | str] | None = None,
+        query_mode: str = "hybrid",
+        query_embedding: List[float] | None = None,
+        expand_windows: bool = True,
+        trace: QueryTrace | None = None,
+    ) -> List[NodeWithScore]:
+        """Retrieve the context of a query: search the enabled sources, rerank, and expand conversation windows
+
+        This is the retrieval half of llm_response. The query mode, a precomputed query embedding and
+        skipping window expansion are only used by benchmarks/retrieval_sweep.py.
+        """
+        search_kwargs = search_kwargs if search_kwargs is not None else self._search_kwargs()
 
         # Collect nodes from enabled sources
         all_nodes = []
-        
+
+        # embed the query once for both retrievers
+        query_bundle = QueryBundle(query_str=query)
+        if query_embedding is not None:
+            query_bundle.embedding = query_embedding
+        elif enabled_sources:
+            with timed_stage(trace, "embed_query"):
+                query_bundle.embedding = await self.embed_model.aget_query_embedding(query)
+
         # Retrieve from Discord if enabled
         if SourceType.DISCORD in enabled_sources:
             filters = MetadataFilters(filters=[ExactMatchFilter(key="serverId", value=server_id)])
             discord_retriever = self.messages_index.as_retriever(
                 filters=filters,
                 similarity_top_k=similarity_top_k,
-                vector_store_query_mode="hybrid"
+                vector_store_query_mode=query_mode,
+                vector_store_kwargs=search_kwargs
             )
-            discord_nodes = discord_retriever.retrieve(query)
+            with timed_stage(trace, "discord_retrieval"):
+                discord_nodes = await discord_retriever.aretrieve(query_bundle)
             all_nodes.extend(discord_nodes)
+            if trace is not None:
+                trace.candidates["discord"] = len(discord_nodes)
         
         # Retrieve from Notion if enabled
         if SourceType.NOTION in enabled_sources:
             # retrieve from Notion without server filtering
             notion_retriever = self.notion_index.as_retriever(
                 similarity_top_k=similarity_top_k,
-                vector_store_query_mode="hybrid"
+                vector_store_query_mode=query_mode,
+                vector_store_kwargs=search_kwargs
             )
-            notion_nodes = notion_retriever.retrieve(query)
+            with timed_stage(trace, "notion_retrieval"):
+                notion_nodes = await notion_retriever.aretrieve(query_bundle)
             all_nodes.extend(notion_nodes)
+            if trace is not None:
+                trace.candidates["notion"] = len(notion_nodes)
         
         # Rerank the combined results (up to 14 total retrieved sources pre-rerank)
         if all_nodes and self.rerank_model is not None:
-            reranked_nodes = self.rerank_model.postprocess_nodes(all_nodes, query_str=query)
+            with timed_stage(trace, "rerank"):
+                reranked_nodes = self.rerank_model.postprocess_nodes(all_nodes, query_str=query)
         else:
             reranked_nodes = all_nodes
+
+        # each message of a conversation window becomes its own numbered source
+        if expand_windows:
+            with timed_stage(trace, "expand_windows"):
+                reranked_nodes = await self._expand_discord_windows(reranked_nodes)
+        if trace is not None:
+            trace.candidates["retrieved"] = len(all_nodes)
+            trace.candidates["reranked"] = len(reranked_nodes)
+        return reranked_nodes
+
+    async def llm_response(self, query: str, server_id: str, similarity_top_k: int = 7, enabled_sources: List[SourceType] = [SourceType.DISCORD, SourceType.NOTION], search_profile: SearchProfile | None = None, trace: QueryTrace | None = None) -> tuple[str, List[Union[FormattedDiscordSource, FormattedNotionSource]]]:
+        """Generate an LLM response based on retrieved messages using FunctionAgent with Notion tools
+
+        Pass a QueryTrace to have stage timings, candidate counts, context packing, agent steps,
+        tool calls and token usage recorded into it.
+        """
+
+        # Set server_id for the discord search tool
+        self._current_server_id = server_id
+
+        reranked_nodes = await self.retrieve_nodes(
+            query,
+            server_id,
+            similarity_top_k=similarity_top_k,
+            enabled_sources=enabled_sources,
+            search_kwargs=self._search_kwargs(search_profile),
+            trace=trace,
+        )
         
         # Generate response using LLM with the reranked context 
         
-        # Create context from reranked nodes
-        context_str = ""
-        for i, node in enumerate(reranked_nodes):
-            context_str += f"Source {i+1}:\n{node.node.text}\n\n"
+        # Create context from reranked nodes; nodes packing drops are dropped from the sources too,
+        # so citation N still refers to the Nth source
+        with timed_stage(trace, "pack_context"):
+            packed = self.context_packer.pack(query, reranked_nodes)
+        reranked_nodes = packed.nodes
+        context_str = packed.context_str()
+        CONTEXT_TOKENS.observe(packed.tokens_after)
+        CONTEXT_TOKENS_SAVED.inc(packed.saved_tokens)
+        if trace is not None:
+            trace.context = packed.stats()
         
         # Create FunctionAgent with Notion tools, requests tool, and Discord search tool
-        agent_tools = (
-            self.notion_tool_spec.to_tool_list() + 
-            self.requests_spec.to_tool_list() + 
-            [self.discord_search_tool]
-        )
+        agent_tools = [
+            self._timed_tool(tool, trace) for tool in (
+                self.notion_tool_spec.to_tool_list() +
+                self.requests_spec.to_tool_list() +
+                [self.discord_search_tool]
+            )
+        ]
 
         agent = FunctionAgent(
             tools=agent_tools,
@@ -697,7 +1307,13 @@ class VectorDB:
         If you need additional information from Notion, use the available tools.
         If you need to search for specific Discord messages (e.g., by date, channel, or exact text), use the search_discord_messages tool."""
 
-        response = await agent.run(agent_prompt)
+        with timed_stage(trace, "agent"):
+            handler = agent.run(agent_prompt)
+            if trace is not None:
+                async for event in handler.stream_events():
+                    if isinstance(event, AgentOutput):
+                        trace.add_agent_step(event.raw)
+            response = await handler
 
         response_text = str(response)
         
@@ -708,8 +1324,9 @@ class VectorDB:
 
         return (response_text, sourceList)
     
-    async def fusion_response(self, query: str, server_id: str, similarity_top_k: int = 7, enabled_sources: List[SourceType] = [SourceType.DISCORD, SourceType.NOTION]) -> tuple[str, List[Union[FormattedDiscordSource, FormattedNotionSource]]]:
+    async def fusion_response(self, query: str, server_id: str, similarity_top_k: int = 7, enabled_sources: List[SourceType] = [SourceType.DISCORD, SourceType.NOTION], search_profile: SearchProfile | None = None) -> tuple[str, List[Union[FormattedDiscordSource, FormattedNotionSource]]]:
         """Generate an LLM response based on retrieved messages using fusion approach"""
+        search_kwargs = self._search_kwargs(search_profile)
 
         source_retrievers = []
         # Retrieve from Discord if enabled
@@ -718,7 +1335,8 @@ class VectorDB:
             discord_retriever = self.messages_index.as_retriever(
                 filters=filters,
                 similarity_top_k=similarity_top_k,
-                vector_store_query_mode="hybrid"
+                vector_store_query_mode="hybrid",
+                vector_store_kwargs=search_kwargs
             )
             source_retrievers.append(discord_retriever)
         
@@ -727,7 +1345,8 @@ class VectorDB:
             # retrieve from Notion without server filtering
             notion_retriever = self.notion_index.as_retriever(
                 similarity_top_k=similarity_top_k,
-                vector_store_query_mode="hybrid"
+                vector_store_query_mode="hybrid",
+                vector_store_kwargs=search_kwargs
             )
             source_retrievers.append(notion_retriever)
 
@@ -739,19 +1358,78 @@ class VectorDB:
 
         query_engine = RetrieverQueryEngine(fusion_retriever)
 
-        response = await query_engine.aquery(query)
-
-        print(response, response.source_nodes)
+        with timed_stage(None, "fusion"):
+            response = await query_engine.aquery(query)
 
         response_text = response.response
 
          # Format sources
         sourceList = []
-        for node in response.source_nodes:
+        for node in await self._expand_discord_windows(response.source_nodes):
             sourceList.append(self.format_source(node))
 
         return (response_text, sourceList)
 
+    @staticmethod
+    def _timed_tool(tool: FunctionTool, trace: QueryTrace | None = None) -> FunctionTool:
+        """Wrap an agent tool so every call is observed in rag_tool_call_seconds (and the trace)"""
+        name = tool.metadata.name
+
+        @contextmanager
+        def timed():
+            start = time.perf_counter()
+            error = True
+            try:
+                yield
+                error = False
+            finally:
+                seconds = time.perf_counter() - start
+                TOOL_CALL_SECONDS.labels(tool=name).observe(seconds)
+                if trace is not None:
+                    trace.add_tool_call(name, seconds, error=error)
+
+        def fn(*args, **kwargs):
+            with timed():
+                return tool.fn(*args, **kwargs)
+
+        async def async_fn(*args, **kwargs):
+            with timed():
+                return await tool.async_fn(*args, **kwargs)
+
+        return FunctionTool(fn=fn, async_fn=async_fn, metadata=tool.metadata)
+
+    async def _expand_discord_windows(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        """Replace conversation-window nodes with one node per member message (keeping the window's score).
+
+        Members are read from discord_text in one query; a member deleted since the window was
+        retrieved is dropped.
+        """
+        message_ids = [message_id for node in nodes for message_id in node.node.metadata.get("messageIds") or []]
+        if not message_ids:
+            return nodes
+
+        async with self._async_engine.connect() as conn:
+            rows = (await conn.execute(
+                text(f"SELECT {DISCORD_TEXT_COLUMNS} FROM discord_text WHERE message_id = ANY(:message_ids)"),
+                {"message_ids": message_ids}
+            )).fetchall()
+        messages = {row.message_id: self._row_to_message(row) for row in rows}
+
+        expanded = []
+        seen = set()
+        for node in nodes:
+            member_ids = node.node.metadata.get("messageIds")
+            if not member_ids:
+                expanded.append(node)
+                continue
+
+            # a long window split into several nodes lists the same members in each
+            for message_id in member_ids:
+                if message_id in messages and message_id not in seen:
+                    seen.add(message_id)
+                    expanded.append(NodeWithScore(node=self.build_message(messages[message_id]), score=node.score))
+        return expanded
+
     def build_message(self, message: MessageJson) -> Document:
         doc_text = f"Channel: {message.data.channelName}\n"
         doc_text += f"Sender: {message.data.senderNickname if message.data.senderNickname else message.data.senderUsername}\n"
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+
+from models import MessageData, MessageJson, MessageMetadata, NotionPageData, NotionPageJson, NotionPageMetadata
+
+# End-to-end load benchmark: ingest a synthetic guild and Notion workspace through the FastAPI
+# endpoints, then drive concurrent /query and /uploadMessage traffic and report throughput and
+# p50/p95/p99 latency per endpoint and per query stage (from the /query debug trace).
+# Runs offline against a backend started with stub models on a scratch database:
+#   RAG_STUB_BACKENDS=true NOTION_INTERVAL=0 POSTGRES_DB=rag_bench python main.py
+# Run from backend/: python -m benchmarks.load_benchmark --messages 5000 --concurrency 8
+
+# each synthetic conversation sticks to one topic so queries have something to find
+TOPICS = {
+    "deploy": ["deploy", "release", "rollback", "pipeline", "staging", "production", "docker", "build"],
+    "database": ["postgres", "migration", "index", "query", "schema", "vacuum", "replica", "backup"],
+    "onboarding": ["welcome", "mentor", "laptop", "access", "handbook", "orientation", "account", "team"],
+    "events": ["hackathon", "meetup", "schedule", "venue", "speaker", "tickets", "sponsor", "workshop"],
+    "billing": ["invoice", "payment", "refund", "subscription", "receipt", "budget", "reimbursement", "card"],
+    "design": ["figma", "mockup", "color", "layout", "font", "review", "prototype", "component"],
+}
+FILLER = ["the", "we", "should", "maybe", "today", "after", "before", "check", "about", "with", "is", "on", "for", "it", "can", "someone"]
+REACTIONS = ["lol", "+1", "thanks!", "👍", "nice", "ok"]
+
+
+def make_sentence(rng: random.Random, topic: str, words: int) -> str:
+    vocabulary = TOPICS[topic]
+    return " ".join(rng.choice(vocabulary) if rng.random() < 0.4 else rng.choice(FILLER) for _ in range(words)).capitalize()
+
+
+class GuildGenerator:
+    """Deterministic synthetic Discord traffic: bursts of messages on one topic per channel"""
+
+    def __init__(self, server_id: str, channels: int, senders: int, seed: int):
+        self.server_id = server_id
+        self.rng = random.Random(seed)
+        self.channels = [(f"{server_id}-channel-{i}", f"{topic}-{i}") for i, topic in enumerate(self.rng.choices(list(TOPICS), k=channels))]
+        self.senders = [(f"{server_id}-user-{i}", f"user{i}", f"Nick {i}" if i % 3 else None) for i in range(senders)]
+        self.clock = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.count = 0
+
+    def next_message(self) -> MessageJson:
+        channel_id, channel_name = self.rng.choice(self.channels)
+        sender_id, username, nickname = self.rng.choice(self.senders)
+        # mostly replies within a conversation, sometimes a long pause
+        self.clock += timedelta(seconds=self.rng.expovariate(1 / 45) if self.rng.random() < 0.95 else self.rng.uniform(1800, 7200))
+        self.count += 1
+
+        if self.rng.random() < 0.1:
+            content = self.rng.choice(REACTIONS)
+        else:
+            topic = channel_name.rsplit("-", 1)[0]
+            content = make_sentence(self.rng, topic, self.rng.randint(5, 30))
+
+        return MessageJson(
+            data=MessageData(senderNickname=nickname, senderUsername=username, channelName=channel_name, content=content),
+            metadata=MessageMetadata(
+                messageId=f"{self.server_id}-msg-{self.count}",
+                channelId=channel_id,
+                senderId=sender_id,
+                serverId=self.server_id,
+                dateTime=self.clock,
+            ),
+        )
+
+    def messages(self, count: int) -> list[MessageJson]:
+        return [self.next_message() for _ in range(count)]
+
+
+def make_notion_pages(count: int, sections: int, seed: int) -> list[NotionPageJson]:
+    """Markdown pages with a few headed sections each, on the same topics as the guild"""
+    rng = random.Random(seed + 1)
+    pages = []
+    for i in range(count):
+        topic = rng.choice(list(TOPICS))
+        body = []
+        for section in range(sections):
+            body.append(f"## {make_sentence(rng, topic, 3)} {section}")
+            body.extend(make_sentence(rng, topic, rng.randint(15, 60)) + "." for _ in range(rng.randint(1, 4)))
+            if rng.random() < 0.3:
+                body.extend(f"- {make_sentence(rng, topic, 6)}" for _ in range(rng.randint(2, 5)))
+        edited = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(hours=i)
+        pages.append(NotionPageJson(
+            data=NotionPageData(title=f"{topic.capitalize()} notes {i}", content="\n\n".join(body), author=f"author{i % 7}"),
+            metadata=NotionPageMetadata(
+                pageId=f"bench-page-{seed}-{i}",
+                authorId=f"bench-author-{i % 7}",
+                createdTime=edited,
+                lastEditedTime=edited,
+            ),
+        ))
+    return pages
+
+
+def make_queries(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed + 2)
+    templates = ["What did we decide about {}?", "Who knows how the {} works?", "Any update on the {} and {}?", "Where is the doc for {}?"]
+    queries = []
+    for _ in range(count):
+        topic = rng.choice(list(TOPICS))
+        template = rng.choice(templates)
+        queries.append(template.format(*rng.sample(TOPICS[topic], template.count("{}"))))
+    return queries
+
+
+class LatencyRecorder:
+    """Latency samples and error counts per operation name"""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        self.samples.setdefault(name, []).append(seconds)
+
+    def error(self, name: str) -> None:
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed: float) -> list[dict[str, float | int | str]]:
+        rows = []
+        for name in sorted(set(self.samples) | set(self.errors)):
+            samples = self.samples.get(name, [])
+            row = {"name": name, "count": len(samples), "errors": self.errors.get(name, 0), "per_s": len(samples) / elapsed if elapsed else 0.0}
+            if samples:
+                p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+                row.update({"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)})
+            rows.append(row)
+        return rows
+
+
+async def post(client: httpx.AsyncClient, recorder: LatencyRecorder, name: str, path: str, payload) -> dict | None:
+    """POST and record the client-side latency under `name`; failures only count as errors"""
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json=payload)
+        response.raise_for_status()
+    except httpx.HTTPError as exc:
+        recorder.error(name)
+        print(f"⚠️  {name} failed: {exc}")
+        return None
+    recorder.record(name, time.perf_counter() - start)
+    return response.json()
+
+
+async def ingest(client: httpx.AsyncClient, path: str, documents: list, batch_size: int, concurrency: int, name: str) -> tuple[LatencyRecorder, float]:
+    """Upload `documents` in batches, `concurrency` batches at a time; returns the recorder and wall seconds"""
+    recorder = LatencyRecorder()
+    batches = [
+        [document.model_dump(mode="json") for document in documents[start:start + batch_size]]
+        for start in range(0, len(documents), batch_size)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(batch: list[dict]) -> None:
+        async with semaphore:
+            await post(client, recorder, name, path, batch)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(upload(batch) for batch in batches))
+    return recorder, time.perf_counter() - start
+
+
+async def drive_load(
+    client: httpx.AsyncClient,
+    guild: GuildGenerator,
+    queries: list[str],
+    requests: int,
+    concurrency: int,
+    write_ratio: float,
+    enable_notion: bool,
+    seed: int,
+) -> tuple[LatencyRecorder, float]:
+    """Run `requests` operations from `concurrency` workers: uploads with probability `write_ratio`, else queries"""
+    recorder = LatencyRecorder()
+    rng = random.Random(seed + 3)
+    # decided up front so every run with the same seed issues the same operations
+    operations = [
+        ("upload", guild.next_message().model_dump(mode="json")) if rng.random() < write_ratio else ("query", rng.choice(queries))
+        for _ in range(requests)
+    ]
+    queue: asyncio.Queue = asyncio.Queue()
+    for operation in operations:
+        queue.put_nowait(operation)
+
+    async def worker() -> None:
+        while not queue.empty():
+            kind, payload = queue.get_nowait()
+            if kind == "upload":
+                await post(client, recorder, "/uploadMessage", "/uploadMessage", payload)
+                continue
+
+            result = await post(client, recorder, "/query", "/query", {
+                "query": payload,
+                "serverId": guild.server_id,
+                "enable_discord": True,
+                "enable_notion": enable_notion,
+                "debug": True,
+            })
+            trace = (result or {}).get("trace")
+            if trace:
+                recorder.record("/query server total", trace["total_ms"] / 1000)
+                for stage, ms in trace["stages_ms"].items():
+                    recorder.record(f"/query {stage}", ms / 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return recorder, time.perf_counter() - start
+
+
+def print_report(title: str, rows: list[dict], elapsed: float) -> None:
+    print(f"\n📊 {title} ({elapsed:.1f}s)")
+    print(f"{'operation':<32}{'count':>8}{'errors':>8}{'per s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        latencies = "".join(f"{row[key]:>10.1f}" if key in row else f"{'-':>10}" for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{row['name']:<32}{row['count']:>8}{row['errors']:>8}{row['per_s']:>9.1f}{latencies}")
+
+
+async def main(args: argparse.Namespace) -> dict:
+    server_id = f"bench-{args.seed}"
+    guild = GuildGenerator(server_id, args.channels, args.senders, args.seed)
+    messages = guild.messages(args.messages)
+    pages = make_notion_pages(args.notion_pages, args.sections, args.seed)
+    queries = make_queries(max(args.requests, 1), args.seed)
+    print(f"📦 {len(messages)} messages in {args.channels} channels from {args.senders} senders, {len(pages)} Notion pages (server {server_id})")
+
+    report = {"config": vars(args)}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        (await client.get("/")).raise_for_status()
+
+        if not args.skip_ingest:
+            for name, path, documents in (("/uploadMessages", "/uploadMessages", messages), ("/uploadNotionDocs", "/uploadNotionDocs", pages)):
+                if not documents:
+                    continue
+                recorder, elapsed = await ingest(client, path, documents, args.batch_size, args.ingest_concurrency, name)
+                rows = recorder.summary(elapsed)
+                print_report(f"ingest {len(documents)} documents via {path}, {len(documents) / elapsed:.1f} documents/s", rows, elapsed)
+                report[f"ingest {path}"] = {"seconds": elapsed, "documents_per_s": len(documents) / elapsed, "operations": rows}
+
+        recorder, elapsed = await drive_load(client, guild, queries, args.requests, args.concurrency, args.write_ratio, args.notion_pages > 0, args.seed)
+        rows = recorder.summary(elapsed)
+        print_report(f"load: {args.requests} requests, concurrency {args.concurrency}, {args.write_ratio:.0%} uploads", rows, elapsed)
+        report["load"] = {"seconds": elapsed, "operations": rows}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a synthetic guild through the API and benchmark concurrent /query and /uploadMessage load")
+    parser.add_argument("--url", default="http://127.0.0.1:7007", help="Backend base URL (default: http://127.0.0.1:7007)")
+    parser.add_argument("--messages", type=int, default=2000, help="Discord messages to ingest (default: 2000)")
+    parser.add_argument("--channels", type=int, default=8, help="Channels in the synthetic guild (default: 8)")
+    parser.add_argument("--senders", type=int, default=25, help="Distinct senders (default: 25)")
+    parser.add_argument("--notion-pages", type=int, default=100, help="Notion pages to ingest; 0 disables Notion in queries (default: 100)")
+    parser.add_argument("--sections", type=int, default=4, help="Headed sections per Notion page (default: 4)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents per ingest request (default: 100)")
+    parser.add_argument("--ingest-concurrency", type=int, default=2, help="Ingest requests in flight (default: 2)")
+    parser.add_argument("--skip-ingest", action="store_true", help="Reuse a corpus ingested by an earlier run with the same seed")
+    parser.add_argument("--requests", type=int, default=500, help="Operations in the load phase (default: 500)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients in the load phase (default: 8)")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Fraction of load operations that upload a message (default: 0.2)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds (default: 120)")
+    parser.add_argument("--output", default=None, help="Write the report as JSON to this file, e.g. to compare runs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.output}")
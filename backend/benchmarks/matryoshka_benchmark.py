@@ -0,0 +1,105 @@
+import argparse
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+from RAG.database import get_connection_string
+from RAG.hnsw import HNSWBuildParams, VectorStorage
+from benchmarks.vector_storage_benchmark import (
+    BENCH_TABLE,
+    SOURCE_TABLES,
+    build_index,
+    drop_index,
+    exact_neighbors,
+    load_bench_table,
+    load_corpus,
+    make_queries,
+    run_queries,
+    search_statement,
+)
+
+# Recall/latency of Matryoshka-truncated first-stage indexes on our own embeddings.
+# Ground truth is exact cosine top-k on the full vectors.
+# Run from backend/: python -m benchmarks.matryoshka_benchmark --source discord --dims 128,256,512,1024
+
+
+def embed_query_file(path: str, model_name: str, instruction: str) -> np.ndarray:
+    """Embed real queries (one per line) with the production embedding model"""
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    with open(path, "r") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    embed_model = HuggingFaceEmbedding(model_name=model_name, query_instruction=instruction)
+    return np.array([embed_model.get_query_embedding(line) for line in lines], dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate truncated (Matryoshka) HNSW indexes at several dimensions")
+    parser.add_argument("--source", choices=list(SOURCE_TABLES.keys()), default="discord", help="Vector table to sample (default: discord)")
+    parser.add_argument("--limit", type=int, default=20000, help="Corpus size (default: 20000)")
+    parser.add_argument("--dims", default="64,128,256,512,1024", help="Comma-separated indexed dimensions (default: 64,128,256,512,1024)")
+    parser.add_argument("--storage", choices=[storage.value for storage in VectorStorage], default="float32", help="Index storage layout (default: float32)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of perturbed corpus queries when --query-file is not given (default: 200)")
+    parser.add_argument("--noise", type=float, default=0.3, help="Relative gaussian noise for perturbed queries (default: 0.3)")
+    parser.add_argument("--query-file", default=None, help="Text file with one real query per line, embedded with --model")
+    parser.add_argument("--model", default="Qwen/Qwen3-Embedding-0.6B", help="Embedding model for --query-file")
+    parser.add_argument(
+        "--instruction",
+        default="Given a Discord search query, retrieve relevant passages that answer the query",
+        help="Query instruction for --query-file"
+    )
+    parser.add_argument("--k", type=int, default=7, help="Results per query / recall@k (default: 7)")
+    parser.add_argument("--oversample", type=int, default=4, help="Rescoring oversample factor (default: 4)")
+    parser.add_argument("--ef-search", type=int, default=40, help="hnsw.ef_search (default: 40)")
+    parser.add_argument("--m", type=int, default=16, help="HNSW m (default: 16)")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW ef_construction (default: 64)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    engine = create_engine(get_connection_string())
+    try:
+        corpus = load_corpus(engine, args.source, args.limit, 0, args.seed)
+        dim = corpus.shape[1]
+        if args.query_file:
+            queries = embed_query_file(args.query_file, args.model, args.instruction)
+        else:
+            queries = make_queries(corpus, args.queries, args.noise, args.seed)
+        truth = exact_neighbors(corpus, queries, args.k)
+        print(f"📦 {len(corpus)} vectors x {dim} dims from {args.source}, {len(queries)} queries, k={args.k}")
+
+        load_bench_table(engine, corpus)
+
+        print(f"\n{'dim':>6}{'index MB':>10}{'build s':>9}{'rescore':>9}{'QPS':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall@' + str(args.k):>11}")
+        for index_dim in sorted(int(value) for value in args.dims.split(",")):
+            if index_dim > dim:
+                print(f"{index_dim:>6}  skipped (> {dim})")
+                continue
+
+            params = HNSWBuildParams(
+                m=args.m,
+                ef_construction=args.ef_construction,
+                storage=VectorStorage(args.storage),
+                index_dim=index_dim if index_dim < dim else None,
+            )
+            index_name, build_seconds, index_bytes = build_index(engine, params, dim)
+            try:
+                for rescore in (False, True):
+                    if not rescore and params.index_dim is None and params.storage == VectorStorage.FLOAT32:
+                        continue
+                    stats = run_queries(
+                        engine, search_statement(params, dim, rescore=rescore),
+                        queries, truth, args.k, args.oversample, args.ef_search
+                    )
+                    print(
+                        f"{index_dim:>6}{index_bytes / (1024 * 1024):>10.1f}{build_seconds:>9.1f}{'yes' if rescore else 'no':>9}"
+                        f"{stats['qps']:>9.1f}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['recall']:>11.3f}"
+                    )
+            finally:
+                drop_index(engine, index_name)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        engine.dispose()
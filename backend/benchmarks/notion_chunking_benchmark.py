@@ -0,0 +1,129 @@
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+
+from RAG.chunking import NotionNodeParser, get_notion_chunk_tokens
+
+# Chunk count, chunk sizes, embedding time and reranker latency of the structure-aware Notion
+# parser against the sentence splitter Notion pages used before (LlamaIndex defaults).
+# Pages come from an import_notion.py --dump-file (JSON lines) or a /uploadNotionDocs payload.
+# Run from backend/: python -m benchmarks.notion_chunking_benchmark --pages notion_pages.jsonl
+
+
+def load_pages(path: str) -> list[dict]:
+    with open(path, "r") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def page_document(page: dict) -> Document:
+    """Same text layout as VectorDB.build_notion_page"""
+    data = page["data"]
+    return Document(
+        text=f"Title: {data['title']}\nAuthor: {data['author']}\nContent: {data['content']}",
+        metadata=page["metadata"]
+    )
+
+
+def unbalanced_fences(text: str) -> bool:
+    """A chunk with an odd number of ``` markers starts or ends inside a code block"""
+    return text.count("```") % 2 == 1
+
+
+def chunk_stats(nodes, tokenizer) -> dict:
+    sizes = np.array([len(tokenizer(node.get_content(metadata_mode=MetadataMode.EMBED))) for node in nodes])
+    return {
+        "chunks": len(nodes),
+        "mean_tokens": float(sizes.mean()) if len(sizes) else 0.0,
+        "p95_tokens": float(np.percentile(sizes, 95)) if len(sizes) else 0.0,
+        "max_tokens": int(sizes.max()) if len(sizes) else 0,
+        "cut_code": sum(1 for node in nodes if unbalanced_fences(node.get_content())),
+    }
+
+
+def time_embeddings(nodes, model_name: str, batch_size: int) -> float:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    embed_model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size)
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    embed_model.get_text_embedding_batch(texts[:batch_size])  # warm-up
+    start = time.perf_counter()
+    embed_model.get_text_embedding_batch(texts)
+    return time.perf_counter() - start
+
+
+def time_reranker(nodes, queries: list[str], reranker, candidates: int, seed: int) -> list[float]:
+    """Rerank `candidates` random chunks per query; returns per-query latencies in ms"""
+    rng = random.Random(seed)
+    latencies = []
+    for query in queries:
+        sample = rng.sample(nodes, min(candidates, len(nodes)))
+        start = time.perf_counter()
+        reranker.postprocess_nodes([NodeWithScore(node=node, score=0.0) for node in sample], QueryBundle(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Notion chunking strategies")
+    parser.add_argument("--pages", required=True, help="Pages as JSON lines (import_notion.py --dump-file) or a JSON array")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="Notion parser token budget (default: NOTION_CHUNK_TOKENS or 512)")
+    parser.add_argument("--sentence-chunk-size", type=int, default=1024, help="Baseline sentence splitter chunk size (default: 1024)")
+    parser.add_argument("--sentence-overlap", type=int, default=200, help="Baseline sentence splitter overlap (default: 200)")
+    parser.add_argument("--embed", action="store_true", help="Time embedding all chunks (loads --model)")
+    parser.add_argument("--model", default="Qwen/Qwen3-Embedding-0.6B", help="Embedding model for --embed")
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--rerank", action="store_true", help="Time the reranker on random candidates (loads --rerank-model)")
+    parser.add_argument("--rerank-model", default="BAAI/bge-reranker-v2-m3")
+    parser.add_argument("--candidates", type=int, default=20, help="Chunks reranked per query (default: 20)")
+    parser.add_argument("--queries", type=int, default=50, help="Queries for --rerank, taken from page titles (default: 50)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    pages = load_pages(args.pages)
+    documents = [page_document(page) for page in pages]
+    tokenizer = get_tokenizer()
+    strategies = {
+        "sentence": SentenceSplitter(chunk_size=args.sentence_chunk_size, chunk_overlap=args.sentence_overlap),
+        "notion": NotionNodeParser(chunk_size=args.chunk_tokens or get_notion_chunk_tokens()),
+    }
+
+    reranker = None
+    queries = []
+    if args.rerank:
+        from llama_index.core.postprocessor import SentenceTransformerRerank
+
+        reranker = SentenceTransformerRerank(model=args.rerank_model, top_n=5)
+        titles = [page["data"]["title"] for page in pages if page["data"]["title"]]
+        queries = random.Random(args.seed).choices(titles, k=args.queries) if titles else []
+
+    print(f"📦 {len(documents)} pages, {sum(len(doc.text) for doc in documents) / 1024 / 1024:.1f} MB of text")
+    print(f"\n{'strategy':<10}{'chunks':>8}{'mean tok':>10}{'p95 tok':>9}{'max tok':>9}{'cut code':>10}{'parse s':>9}{'embed s':>9}{'rerank p50':>12}{'rerank p95':>12}")
+    for name, node_parser in strategies.items():
+        start = time.perf_counter()
+        nodes = node_parser.get_nodes_from_documents(documents)
+        parse_seconds = time.perf_counter() - start
+        stats = chunk_stats(nodes, tokenizer)
+
+        embed_seconds = time_embeddings(nodes, args.model, args.embed_batch_size) if args.embed and nodes else None
+        latencies = time_reranker(nodes, queries, reranker, args.candidates, args.seed) if reranker and queries and nodes else []
+
+        print(
+            f"{name:<10}{stats['chunks']:>8}{stats['mean_tokens']:>10.0f}{stats['p95_tokens']:>9.0f}{stats['max_tokens']:>9}"
+            f"{stats['cut_code']:>10}{parse_seconds:>9.2f}"
+            f"{embed_seconds if embed_seconds is not None else float('nan'):>9.2f}"
+            f"{np.percentile(latencies, 50) if latencies else float('nan'):>12.1f}"
+            f"{np.percentile(latencies, 95) if latencies else float('nan'):>12.1f}"
+        )
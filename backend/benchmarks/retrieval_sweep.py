@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from models import SourceType
+from RAG.tracing import QueryTrace, timed_stage
+
+# Retrieval quality vs latency of the /query retrieval knobs: similarity_top_k, the reranker's top_n,
+# hnsw.ef_search and hybrid vs dense-only search. Every setting runs a labelled query set through
+# VectorDB.retrieve_nodes (the production retrieval path and models, per EMBED_BACKEND / RERANK_BACKEND)
+# against the corpus currently in the database, and the Pareto frontier of latency vs recall and MRR
+# is reported. Run from backend/:
+#   python -m benchmarks.retrieval_sweep --queries labelled.jsonl --top-k 5,7,10 --top-n 3,5,8 --ef-search 20,40,100
+# Each line of the query file: {"query": "...", "serverId": "...", "relevant": ["<messageId or pageId>", ...]}
+
+RETRIEVAL_STAGES = ("discord_retrieval", "notion_retrieval")
+
+
+class LabelledQuery(BaseModel):
+    query: str
+    serverId: str | None = None
+    # message ids (Discord) and page ids (Notion) that answer the query
+    relevant: list[str]
+
+
+def load_labelled_queries(path: str, default_server_id: str | None) -> list[LabelledQuery]:
+    queries = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            labelled = LabelledQuery.model_validate_json(line)
+            if not labelled.relevant:
+                print(f"⚠️  line {line_number}: no relevant ids, skipped")
+                continue
+            labelled.serverId = labelled.serverId or default_server_id
+            queries.append(labelled)
+    return queries
+
+
+def _int_list(value: str) -> list[int]:
+    return sorted({int(item) for item in value.split(",") if item.strip()})
+
+
+def result_ids(nodes) -> list[str]:
+    """Source ids in rank order; the chunks of one Notion page count once, at their best rank"""
+    ids = []
+    for node in nodes:
+        metadata = node.node.metadata
+        source_id = metadata.get("messageId") or metadata.get("pageId")
+        if source_id and source_id not in ids:
+            ids.append(source_id)
+    return ids
+
+
+def recall(ids: list[str], relevant: list[str]) -> float:
+    return len(set(ids) & set(relevant)) / len(set(relevant))
+
+
+def reciprocal_rank(ids: list[str], relevant: list[str]) -> float:
+    relevant_ids = set(relevant)
+    for rank, source_id in enumerate(ids, start=1):
+        if source_id in relevant_ids:
+            return 1.0 / rank
+    return 0.0
+
+
+def pareto_frontier(results: list[dict], latency_key: str) -> list[dict]:
+    """Settings no other setting beats on latency, recall and MRR at once"""
+    def dominates(other: dict, result: dict) -> bool:
+        no_worse = other[latency_key] <= result[latency_key] and other["recall"] >= result["recall"] and other["mrr"] >= result["mrr"]
+        better = other[latency_key] < result[latency_key] or other["recall"] > result["recall"] or other["mrr"] > result["mrr"]
+        return no_worse and better
+
+    return [result for result in results if not any(dominates(other, result) for other in results if other is not result)]
+
+
+async def run_setting(
+    db,
+    queries: list[LabelledQuery],
+    embeddings: list[list[float]],
+    sources: list[SourceType],
+    top_k: int,
+    ef_search: int,
+    hybrid: bool,
+    top_ns: list[int],
+) -> list[dict]:
+    """Run every query once with one retrieval setting; returns one result per reranker top_n.
+
+    The reranker scores every candidate whatever its top_n, so candidates are reranked once and
+    each top_n evaluates a prefix of that order (window expansion is timed per top_n).
+    """
+    search_kwargs = db.search_profiles[db.default_search_profile].model_copy(update={"ef_search": ef_search}).as_store_kwargs()
+    retrieval_seconds, rerank_seconds, candidate_recalls = [], [], []
+    per_top_n = {top_n: {"recall": [], "mrr": [], "expand": []} for top_n in top_ns}
+
+    for labelled, embedding in zip(queries, embeddings):
+        trace = QueryTrace()
+        nodes = await db.retrieve_nodes(
+            labelled.query,
+            labelled.serverId,
+            similarity_top_k=top_k,
+            enabled_sources=sources,
+            search_kwargs=search_kwargs,
+            query_mode="hybrid" if hybrid else "default",
+            query_embedding=embedding,
+            expand_windows=False,
+            trace=trace,
+        )
+        retrieval_seconds.append(sum(trace.stages.get(stage, 0.0) for stage in RETRIEVAL_STAGES))
+        rerank_seconds.append(trace.stages.get("rerank", 0.0))
+
+        expanded = await db._expand_discord_windows(nodes)
+        candidate_recalls.append(recall(result_ids(expanded), labelled.relevant))
+
+        for top_n in top_ns:
+            expand_trace = QueryTrace()
+            with timed_stage(expand_trace, "expand_windows"):
+                context = await db._expand_discord_windows(nodes[:top_n])
+            ids = result_ids(context)
+            per_top_n[top_n]["recall"].append(recall(ids, labelled.relevant))
+            per_top_n[top_n]["mrr"].append(reciprocal_rank(ids, labelled.relevant))
+            per_top_n[top_n]["expand"].append(expand_trace.stages["expand_windows"])
+
+    results = []
+    for top_n in top_ns:
+        totals = np.array(retrieval_seconds) + np.array(rerank_seconds) + np.array(per_top_n[top_n]["expand"])
+        results.append({
+            "hybrid": hybrid,
+            "top_k": top_k,
+            "ef_search": ef_search,
+            "top_n": top_n,
+            "recall": float(np.mean(per_top_n[top_n]["recall"])),
+            "mrr": float(np.mean(per_top_n[top_n]["mrr"])),
+            # recall of everything retrieved, before the reranker cuts to top_n
+            "candidate_recall": float(np.mean(candidate_recalls)),
+            "retrieval_p50_ms": float(np.percentile(retrieval_seconds, 50) * 1000),
+            "rerank_p50_ms": float(np.percentile(rerank_seconds, 50) * 1000),
+            "expand_p50_ms": float(np.percentile(per_top_n[top_n]["expand"], 50) * 1000),
+            "p50_ms": float(np.percentile(totals, 50) * 1000),
+            "p95_ms": float(np.percentile(totals, 95) * 1000),
+        })
+    return results
+
+
+async def main(args: argparse.Namespace) -> dict:
+    # imported here so .env is loaded before the models and pools are configured
+    from RAG.database import dispose_engines
+    from RAG.vectordb import vector_db_instance as db
+
+    sources = [SourceType(source) for source in args.sources.split(",")]
+    queries = load_labelled_queries(args.queries, args.server_id)
+    if SourceType.DISCORD in sources and any(labelled.serverId is None for labelled in queries):
+        raise SystemExit("Discord retrieval needs a serverId per query or --server-id")
+    if not queries:
+        raise SystemExit(f"No labelled queries in {args.queries}")
+
+    top_ks, top_ns, ef_searches = _int_list(args.top_k), _int_list(args.top_n), _int_list(args.ef_search)
+    hybrid_modes = [mode == "on" for mode in args.hybrid.split(",")]
+    if db.rerank_model is not None:
+        # rerank every candidate; run_setting cuts to each top_n itself
+        db.rerank_model.top_n = max(top_ks) * 2 * len(sources)
+
+    try:
+        # query embeddings do not depend on the swept knobs, so they are computed once
+        embed_seconds, embeddings = [], []
+        for labelled in queries:
+            start = time.perf_counter()
+            embeddings.append(await db.embed_model.aget_query_embedding(labelled.query))
+            embed_seconds.append(time.perf_counter() - start)
+        print(f"📦 {len(queries)} labelled queries, embed_query p50 {np.percentile(embed_seconds, 50) * 1000:.1f} ms (not included below)")
+
+        # warm the indexes and pools before timing
+        warmup = min(args.warmup, len(queries))
+        await run_setting(db, queries[:warmup], embeddings[:warmup], sources, max(top_ks), max(ef_searches), True, [max(top_ns)])
+
+        results = []
+        for hybrid, top_k, ef_search in itertools.product(hybrid_modes, top_ks, ef_searches):
+            results.extend(await run_setting(db, queries, embeddings, sources, top_k, ef_search, hybrid, top_ns))
+    finally:
+        db.shutdown()
+        await dispose_engines()
+
+    latency_key = f"{args.latency}_ms"
+    frontier = pareto_frontier(results, latency_key)
+    results.sort(key=lambda result: result[latency_key])
+
+    print(f"\n{'hybrid':>7}{'top_k':>7}{'ef':>6}{'top_n':>7}{'recall':>8}{'MRR':>7}{'cand.':>7}{'retr ms':>9}{'rerank ms':>11}{'p50 ms':>9}{'p95 ms':>9}")
+    for result in results:
+        marker = " *" if result in frontier else ""
+        print(
+            f"{'on' if result['hybrid'] else 'off':>7}{result['top_k']:>7}{result['ef_search']:>6}{result['top_n']:>7}"
+            f"{result['recall']:>8.3f}{result['mrr']:>7.3f}{result['candidate_recall']:>7.3f}"
+            f"{result['retrieval_p50_ms']:>9.1f}{result['rerank_p50_ms']:>11.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{marker}"
+        )
+    print(f"\n⭐ {len(frontier)} of {len(results)} settings on the {args.latency} latency / recall / MRR Pareto frontier (marked *)")
+
+    return {
+        "config": vars(args),
+        "embed_query_p50_ms": float(np.percentile(embed_seconds, 50) * 1000),
+        "results": results,
+        "frontier": sorted(frontier, key=lambda result: result[latency_key]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep retrieval settings on a labelled query set and report the latency/quality Pareto frontier")
+    parser.add_argument("--queries", required=True, help="JSONL file of labelled queries")
+    parser.add_argument("--server-id", default=None, help="serverId for queries that do not set one")
+    parser.add_argument("--sources", default="discord,notion", help="Comma-separated sources to retrieve from (default: discord,notion)")
+    parser.add_argument("--top-k", default="3,5,7,10,15", help="similarity_top_k values per source (default: 3,5,7,10,15)")
+    parser.add_argument("--top-n", default="3,5,7,10", help="Reranker top_n values (default: 3,5,7,10)")
+    parser.add_argument("--ef-search", default="20,40,100,200", help="hnsw.ef_search values (default: 20,40,100,200)")
+    parser.add_argument("--hybrid", default="on,off", help="Hybrid (vector + full-text) search: on, off or on,off (default: on,off)")
+    parser.add_argument("--latency", choices=["p50", "p95"], default="p95", help="Latency the frontier is computed on (default: p95)")
+    parser.add_argument("--warmup", type=int, default=5, help="Queries run untimed before the sweep (default: 5)")
+    parser.add_argument("--output", default=None, help="Write every result and the frontier as JSON to this file")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
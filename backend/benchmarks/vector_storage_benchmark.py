@@ -0,0 +1,233 @@
+import argparse
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from RAG.database import get_connection_string
+from RAG.hnsw import HNSWBuildParams, VectorStorage, create_index_statement
+
+# Compare HNSW storage layouts (float32 / halfvec / binary + rescoring) on index size, build time,
+# QPS and recall@k. Run from backend/: python -m benchmarks.vector_storage_benchmark --source discord
+
+BENCH_TABLE = "bench_vector_storage"
+SOURCE_TABLES = {
+    "discord": "data_discord_embeddings",
+    "notion": "data_notion_embeddings",
+}
+
+
+def load_corpus(engine: Engine, source: str, limit: int, dim: int, seed: int) -> np.ndarray:
+    """Load embeddings from one of our vector tables, or generate random gaussian vectors"""
+    if source == "synthetic":
+        rng = np.random.default_rng(seed)
+        return rng.standard_normal((limit, dim)).astype(np.float32)
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f"SELECT embedding::real[] AS embedding FROM {SOURCE_TABLES[source]} ORDER BY id LIMIT :limit"),
+            {"limit": limit}
+        ).fetchall()
+    if not rows:
+        raise SystemExit(f"No embeddings found in {SOURCE_TABLES[source]}")
+    return np.array([row.embedding for row in rows], dtype=np.float32)
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float, seed: int) -> np.ndarray:
+    """Perturb random corpus vectors so queries resemble real traffic without being exact duplicates"""
+    rng = np.random.default_rng(seed + 1)
+    picks = corpus[rng.integers(0, len(corpus), size=count)]
+    scale = np.linalg.norm(picks, axis=1, keepdims=True) / np.sqrt(corpus.shape[1])
+    return (picks + rng.standard_normal(picks.shape).astype(np.float32) * noise * scale).astype(np.float32)
+
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int) -> list[set[int]]:
+    """Brute-force cosine top-k (ids are row positions)"""
+    corpus_norm = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    query_norm = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = query_norm @ corpus_norm.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def to_pg_vector(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{value:.7g}" for value in vector) + "]"
+
+
+def load_bench_table(engine: Engine, corpus: np.ndarray, batch_size: int = 500) -> None:
+    dim = corpus.shape[1]
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {BENCH_TABLE} (id BIGINT PRIMARY KEY, embedding vector({dim}) NOT NULL)"))
+        for start in range(0, len(corpus), batch_size):
+            conn.execute(
+                text(f"INSERT INTO {BENCH_TABLE} (id, embedding) VALUES (:id, :embedding)"),
+                [
+                    {"id": start + offset, "embedding": to_pg_vector(vector)}
+                    for offset, vector in enumerate(corpus[start:start + batch_size])
+                ]
+            )
+        conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+
+
+def search_statement(params: HNSWBuildParams, dim: int, rescore: bool = True) -> str:
+    """Top-k query for an index layout; mirrors TunedPGVectorStore._build_query"""
+    if params.storage == VectorStorage.FLOAT32 and params.index_dim is None:
+        return f"SELECT id FROM {BENCH_TABLE} ORDER BY embedding <=> CAST(:query AS vector({dim})) LIMIT :k"
+
+    if params.index_dim is not None:
+        index_dim = int(params.index_dim)
+        column = f"subvector(embedding, 1, {index_dim})::vector({index_dim})"
+        query = f"subvector(CAST(:query AS vector({dim})), 1, {index_dim})::vector({index_dim})"
+    else:
+        index_dim = dim
+        column = "embedding"
+        query = f"CAST(:query AS vector({dim}))"
+
+    if params.storage == VectorStorage.FLOAT32:
+        index_order = f"({column}) <=> {query}"
+    elif params.storage == VectorStorage.HALFVEC:
+        index_order = f"({column})::halfvec({index_dim}) <=> ({query})::halfvec({index_dim})"
+    else:
+        index_order = f"binary_quantize({column})::bit({index_dim}) <~> binary_quantize({query})::bit({index_dim})"
+
+    if not rescore:
+        return f"SELECT id FROM {BENCH_TABLE} ORDER BY {index_order} LIMIT :k"
+
+    return (
+        f"SELECT id FROM ("
+        f"SELECT id, embedding FROM {BENCH_TABLE} ORDER BY {index_order} LIMIT :candidates"
+        f") candidates ORDER BY embedding <=> CAST(:query AS vector({dim})) LIMIT :k"
+    )
+
+
+def build_index(engine: Engine, params: HNSWBuildParams, dim: int) -> tuple[str, float, int]:
+    """Build a bench index; returns its name, build seconds and size in bytes"""
+    suffix = f"_{params.index_dim}" if params.index_dim is not None else ""
+    index_name = f"{BENCH_TABLE}_{params.storage.value}{suffix}_idx"
+
+    with engine.begin() as conn:
+        build_start = time.perf_counter()
+        conn.execute(text(create_index_statement(BENCH_TABLE, params, dim, index_name=index_name)))
+        build_seconds = time.perf_counter() - build_start
+
+    with engine.connect() as conn:
+        index_bytes = conn.execute(text("SELECT pg_relation_size(CAST(:name AS regclass))"), {"name": index_name}).scalar_one()
+
+    return index_name, build_seconds, index_bytes
+
+
+def drop_index(engine: Engine, index_name: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+
+def run_queries(
+    engine: Engine,
+    statement: str,
+    queries: np.ndarray,
+    truth: list[set[int]],
+    k: int,
+    oversample: int,
+    ef_search: int,
+) -> dict[str, float]:
+    """Run every query once (after a short warm-up) and return QPS, latency percentiles and recall@k"""
+    statement = text(statement)
+    found = []
+    latencies = []
+    with engine.connect() as conn:
+        def search(query: np.ndarray) -> list[int]:
+            with conn.begin():
+                conn.execute(text("SELECT set_config('hnsw.ef_search', :value, true)"), {"value": str(ef_search)})
+                rows = conn.execute(statement, {"query": to_pg_vector(query), "k": k, "candidates": k * oversample}).fetchall()
+            return [row.id for row in rows]
+
+        # warm the index into shared_buffers / page cache before timing
+        for query in queries[:min(len(queries), 10)]:
+            search(query)
+
+        for query in queries:
+            query_start = time.perf_counter()
+            ids = search(query)
+            latencies.append(time.perf_counter() - query_start)
+            found.append(set(ids))
+
+    return {
+        "qps": len(queries) / sum(latencies),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "recall": float(np.mean([len(result & expected) / k for result, expected in zip(found, truth)])),
+    }
+
+
+def run_layout(
+    engine: Engine,
+    params: HNSWBuildParams,
+    queries: np.ndarray,
+    truth: list[set[int]],
+    k: int,
+    oversample: int,
+    ef_search: int,
+) -> dict[str, float | str]:
+    dim = queries.shape[1]
+    index_name, build_seconds, index_bytes = build_index(engine, params, dim)
+    try:
+        stats = run_queries(engine, search_statement(params, dim), queries, truth, k, oversample, ef_search)
+    finally:
+        drop_index(engine, index_name)
+
+    return {
+        "layout": params.storage.value,
+        "index_mb": index_bytes / (1024 * 1024),
+        "build_s": build_seconds,
+        **stats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark HNSW storage layouts against the float32 layout")
+    parser.add_argument("--source", choices=["synthetic", *SOURCE_TABLES.keys()], default="synthetic", help="Where to take corpus vectors from (default: synthetic)")
+    parser.add_argument("--limit", type=int, default=20000, help="Corpus size (default: 20000)")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimension for synthetic vectors (default: 1024)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries (default: 200)")
+    parser.add_argument("--noise", type=float, default=0.3, help="Relative gaussian noise added to sampled query vectors (default: 0.3)")
+    parser.add_argument("--k", type=int, default=7, help="Results per query / recall@k (default: 7)")
+    parser.add_argument("--oversample", type=int, default=4, help="Rescoring oversample factor for quantized layouts (default: 4)")
+    parser.add_argument("--ef-search", type=int, default=40, help="hnsw.ef_search (default: 40)")
+    parser.add_argument("--m", type=int, default=16, help="HNSW m (default: 16)")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW ef_construction (default: 64)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    engine = create_engine(get_connection_string())
+    try:
+        corpus = load_corpus(engine, args.source, args.limit, args.dim, args.seed)
+        queries = make_queries(corpus, args.queries, args.noise, args.seed)
+        truth = exact_neighbors(corpus, queries, args.k)
+        print(f"📦 {len(corpus)} vectors x {corpus.shape[1]} dims from {args.source}, {len(queries)} queries, k={args.k}")
+
+        load_bench_table(engine, corpus)
+        results = [
+            run_layout(
+                engine,
+                HNSWBuildParams(m=args.m, ef_construction=args.ef_construction, storage=storage),
+                queries, truth, args.k, args.oversample, args.ef_search
+            )
+            for storage in VectorStorage
+        ]
+
+        baseline = results[0]
+        print(f"\n{'layout':<10}{'index MB':>10}{'vs f32':>8}{'build s':>9}{'QPS':>9}{'p95 ms':>9}{'recall@' + str(args.k):>11}")
+        for result in results:
+            print(
+                f"{result['layout']:<10}{result['index_mb']:>10.1f}{result['index_mb'] / baseline['index_mb']:>8.2f}"
+                f"{result['build_s']:>9.1f}{result['qps']:>9.1f}{result['p95_ms']:>9.1f}{result['recall']:>11.3f}"
+            )
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+        engine.dispose()
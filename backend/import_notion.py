@@ -1,80 +1,196 @@
 import argparse
+import os
 import requests
 import json
+import time
 from datetime import datetime, date
 from notion.notion_exporter import NotionExporter
-from notion.notion_page_exporter import NotionPageExporter
 from dotenv import load_dotenv
 
 #slopmaxxed script.
 
-def upload_notion_pages_to_api(pages, api_url):
-    """Upload Notion pages to the RAG API endpoint"""
+def make_serializable(obj):
+    """Recursively convert datetimes to ISO strings and pydantic models to dicts."""
+    # Pydantic models have model_dump
+    if hasattr(obj, "model_dump"):
+        return make_serializable(obj.model_dump())
+    # dicts: process values
+    if isinstance(obj, dict):
+        return {k: make_serializable(v) for k, v in obj.items()}
+    # lists/tuples: process items
+    if isinstance(obj, (list, tuple)):
+        return [make_serializable(v) for v in obj]
+    # dates/datetimes: convert to ISO
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # fallback: return as-is (json will error if not serializable)
+    return obj
+
+
+def upload_notion_pages_to_api(pages, api_url, timeout=120, retries=3):
+    """Upload a batch of Notion pages to the RAG API endpoint; returns the number of bytes sent or None on failure"""
     endpoint = f"{api_url}/uploadNotionDocs"
-    
-    # Convert pages to JSON serializable format
-    def make_serializable(obj):
-        """Recursively convert datetimes to ISO strings and pydantic models to dicts."""
-        # Pydantic models have model_dump
-        if hasattr(obj, "model_dump"):
-            return make_serializable(obj.model_dump())
-        # dicts: process values
-        if isinstance(obj, dict):
-            return {k: make_serializable(v) for k, v in obj.items()}
-        # lists/tuples: process items
-        if isinstance(obj, (list, tuple)):
-            return [make_serializable(v) for v in obj]
-        # dates/datetimes: convert to ISO
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        # fallback: return as-is (json will error if not serializable)
-        return obj
-
-    pages_data = [make_serializable(p) for p in pages]
-
-    # dump data to file
-    with open("./notion_pages_dump.json", "w") as f:
-        json.dump(pages_data, f, indent=2)
+    body = json.dumps([make_serializable(p) for p in pages])
+
+    for attempt in range(retries + 1):
+        if attempt:
+            # the batch is idempotent (pages are replaced by id), so it is safe to resend
+            time.sleep(min(2 ** attempt, 30))
+            print(f"🔁 Retrying batch (attempt {attempt + 1} of {retries + 1})")
+
+        try:
+            response = requests.post(
+                endpoint,
+                data=body,
+                headers={"Content-Type": "application/json"},
+                timeout=timeout
+            )
+        except requests.exceptions.Timeout:
+            print("❌ Request timed out. The upload may still be processing.")
+            continue
+        except requests.exceptions.ConnectionError:
+            print(f"❌ Could not connect to API at {api_url}")
+            print("Make sure the RAG API server is running.")
+            continue
+        except requests.exceptions.RequestException as e:
+            print(f"❌ Request failed: {e}")
+            continue
 
-    try:
-        response = requests.post(
-            endpoint,
-            json=pages_data,
-            headers={"Content-Type": "application/json"},
-            timeout=600  # 10 minute timeout for large uploads
-        )
-        
         if response.status_code == 200:
-            result = response.json()
-            print(f"✅ {result.get('message', 'Upload successful')}")
-            return True
-        else:
-            print(f"❌ API request failed with status {response.status_code}")
-            try:
-                error_detail = response.json()
-                print(f"Error details: {error_detail}")
-            except:
-                print(f"Error response: {response.text}")
+            return len(body)
+
+        print(f"❌ API request failed with status {response.status_code}")
+        try:
+            print(f"Error details: {response.json()}")
+        except ValueError:
+            print(f"Error response: {response.text}")
+        if response.status_code < 500:
+            # the payload itself was rejected; resending it will not help
+            return None
+
+    return None
+
+
+class ImportCheckpoint:
+    """Page ids uploaded by an unfinished run, so a rerun from the same watermark can skip them"""
+
+    def __init__(self, path):
+        self.path = path
+        self.started_at = None
+        self.watermark = None
+        self.completed = set()
+
+    def load(self, watermark):
+        """Load the checkpoint if it belongs to a run from `watermark`; returns True when resuming"""
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
             return False
-            
-    except requests.exceptions.Timeout:
-        print("❌ Request timed out. The upload may still be processing.")
-        return False
-    except requests.exceptions.ConnectionError:
-        print(f"❌ Could not connect to API at {api_url}")
-        print("Make sure the RAG API server is running.")
-        return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Request failed: {e}")
-        return False
-    except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        return False
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable checkpoint {self.path}: {e}")
+            return False
+
+        if state.get("watermark") != watermark:
+            # the timestamp moved on since; the checkpoint describes an older set of changes
+            return False
+
+        self.started_at = state.get("started_at")
+        self.watermark = watermark
+        self.completed = set(state.get("completed", []))
+        return True
+
+    def start(self, started_at, watermark):
+        self.started_at = started_at
+        self.watermark = watermark
+        self.completed = set()
+        self.save()
+
+    def mark_completed(self, page_ids):
+        self.completed.update(page_ids)
+        self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "started_at": self.started_at,
+                "watermark": self.watermark,
+                "completed": sorted(self.completed),
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BatchUploader:
+    """Collects exported pages and uploads them in batches while the export keeps running"""
+
+    def __init__(self, api_url, batch_size, checkpoint, timeout=120, retries=3, dump_file=None, dry_run=False):
+        self.api_url = api_url
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.timeout = timeout
+        self.retries = retries
+        self.dump_file = dump_file
+        self.dry_run = dry_run
+
+        self.batch = []
+        self.exported = 0
+        self.uploaded = 0
+        self.batches = 0
+        self.bytes_sent = 0
+        self.upload_seconds = 0.0
+
+    def add(self, page):
+        self.exported += 1
+        if self.dry_run:
+            print(f"  {self.exported}. {page.data.title}")
+            return
+
+        self.batch.append(page)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+
+        if self.dump_file:
+            with open(self.dump_file, "a") as f:
+                for page in self.batch:
+                    f.write(json.dumps(make_serializable(page)) + "\n")
+
+        start = time.perf_counter()
+        sent = upload_notion_pages_to_api(self.batch, self.api_url, timeout=self.timeout, retries=self.retries)
+        self.upload_seconds += time.perf_counter() - start
+        if sent is None:
+            raise RuntimeError(f"upload of a batch of {len(self.batch)} pages failed")
+
+        self.checkpoint.mark_completed(page.metadata.pageId for page in self.batch)
+        self.uploaded += len(self.batch)
+        self.batches += 1
+        self.bytes_sent += sent
+        print(f"✅ Uploaded batch {self.batches} ({len(self.batch)} pages, {self.uploaded} total)")
+        self.batch = []
+
+    def print_summary(self, elapsed):
+        rate = self.exported / elapsed if elapsed else 0.0
+        print(
+            f"📊 {self.exported} pages exported, {self.uploaded} uploaded in {self.batches} batches "
+            f"({self.bytes_sent / 1024 / 1024:.1f} MB) in {elapsed:.1f}s: {rate:.2f} pages/s, "
+            f"{self.upload_seconds:.1f}s spent uploading"
+        )
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Import Notion pages to RAG API")
     parser.add_argument(
-        "--api-url", 
+        "--api-url",
         default="http://localhost:7007",
         help="Base URL of the RAG API server (default: http://localhost:7007)"
     )
@@ -93,42 +209,98 @@ if __name__ == "__main__":
         action="store_true",
         help="Display a progress bar while fetching pages from Notion"
     )
-    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of pages to fetch concurrently (default: NOTION_WORKERS or 4)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=20,
+        help="Pages per upload request (default: 20)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=120,
+        help="Timeout in seconds for each batch upload (default: 120)"
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Retries per failed batch before giving up (default: 3)"
+    )
+    parser.add_argument(
+        "--checkpoint-file",
+        default=None,
+        help="File recording uploaded page ids of an unfinished run (default: <timer file>.checkpoint.json)"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore an existing checkpoint and upload every changed page again"
+    )
+    parser.add_argument(
+        "--dump-file",
+        default=None,
+        help="Also append every uploaded page to this JSON-lines file"
+    )
+
     args = parser.parse_args()
-    
+
     load_dotenv()
-    
+
     print(f"🔄 Starting Notion import to {args.api_url}")
-    
+
+    checkpoint = ImportCheckpoint(args.checkpoint_file or f"{os.path.splitext(args.timer_file)[0]}.checkpoint.json")
+    uploader = None
+    start = time.perf_counter()
+
     try:
-        notion_exporter = NotionExporter(timer_file_path=args.timer_file)
+        notion_exporter = NotionExporter(timer_file_path=args.timer_file, workers=args.workers)
         current_time = notion_exporter.get_timestamp()
-        pages = notion_exporter.get_pages(show_progress=args.progress)
-        
-        print(f"📄 Found {len(pages)} pages to process")
-        
+        page_ids = notion_exporter.get_changed_page_ids()
+
+        if not args.dry_run:
+            if not args.restart and checkpoint.load(notion_exporter.most_recent_timestamp):
+                # keep the original start time: pages edited since then must be picked up next run
+                current_time = checkpoint.started_at or current_time
+                print(f"⏩ Resuming: {len(checkpoint.completed)} pages were already uploaded")
+                page_ids = [page_id for page_id in page_ids if page_id not in checkpoint.completed]
+            else:
+                checkpoint.start(current_time, notion_exporter.most_recent_timestamp)
+
+        print(f"📄 Found {len(page_ids)} pages to process")
         if args.dry_run:
             print("🔍 Dry run mode - showing pages that would be uploaded:")
-            for i, page in enumerate(pages, 1):
-                if hasattr(page, 'data') and hasattr(page.data, 'title'):
-                    title = page.data.title
-                elif isinstance(page, dict) and 'data' in page:
-                    title = page['data'].get('title', 'Unknown')
-                else:
-                    title = 'Unknown'
-                print(f"  {i}. {title}")
+
+        uploader = BatchUploader(
+            args.api_url,
+            max(args.batch_size, 1),
+            checkpoint,
+            timeout=args.timeout,
+            retries=max(args.retries, 0),
+            dump_file=args.dump_file,
+            dry_run=args.dry_run
+        )
+        notion_exporter.export_pages(page_ids, uploader.add, show_progress=args.progress)
+        uploader.flush()
+
+        if args.dry_run:
             print("No pages were uploaded (dry run mode)")
         else:
-            success = upload_notion_pages_to_api(pages, args.api_url)
-            
-            if success:
-                notion_exporter.save_timestamp(current_time)
-                print("✅ Import completed successfully!")
-            else:
-                print("❌ Import failed - timestamp not updated")
-                exit(1)
-                
+            notion_exporter.save_timestamp(current_time)
+            checkpoint.remove()
+            print("✅ Import completed successfully!")
+
     except Exception as e:
         print(f"❌ Error during import: {e}")
+        if not args.dry_run and checkpoint.watermark is not None:
+            print(f"Timestamp not updated; rerun to resume from {checkpoint.path}")
         exit(1)
-    
\ No newline at end of file
+    finally:
+        if uploader is not None:
+            uploader.print_summary(time.perf_counter() - start)
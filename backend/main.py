@@ -1,17 +1,32 @@
 import asyncio
+import json
 import os
 
 from dotenv.main import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse
 from typing import List
+from RAG.config import get_float_env
 from RAG.vectordb import vector_db_instance
+from RAG.database import dispose_engines, get_pool_stats
+from RAG.tracing import QueryTrace, get_trace_sample_rate, should_sample
+from RAG.profiler import ProfilingMiddleware, current_capture, get_request_profiler, tag_profile
+from RAG.metrics import QUERIES_IN_FLIGHT, QUERY_ERRORS, QUERY_SECONDS, REGISTRY, server_label
 from contextlib import asynccontextmanager
 from models import MessageData, MessageMetadata, MessageJson, QueryRequest, NotionPageJson, DeleteMessageRequest, SourceType
 from notion.notion_exporter import NotionExporter
+from notion.webhooks import PageChangeQueue, page_change, verify_signature
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 
 # lifecycle stuff
 database = None
 notion_import_task = None
+notion_webhook_queue = None
+notion_webhook_task = None
+notion_webhook_exporter = None
+# held by a polling import for its whole run and by each webhook batch, so the two never overlap
+notion_sync_lock = asyncio.Lock()
 
 
 def _get_notion_interval() -> int:
@@ -29,27 +44,60 @@ def _get_notion_interval() -> int:
         return 1440
 
 
+def _get_reconcile_interval() -> float:
+    """Return how often (in hours) deleted/archived Notion pages are reconciled (defaults to daily)."""
+    return get_float_env("NOTION_RECONCILE_INTERVAL_HOURS", 24.0)
+
+
+def _get_webhook_secret() -> str | None:
+    """Return the Notion webhook verification token; webhooks are disabled without it."""
+    return os.getenv("NOTION_WEBHOOK_SECRET") or None
+
+
+def _get_webhook_poll_interval() -> int:
+    """Return the safety-net polling interval in minutes used while webhooks are enabled (defaults to weekly)."""
+    return max(int(get_float_env("NOTION_WEBHOOK_POLL_INTERVAL", 10080)), 0)
+
+
 async def import_notion(timer_file_path: str) -> int:
     """Import Notion pages once and persist them to the vector database."""
     if database is None:
         print("Skipping Notion import: database not initialized")
         return 0
 
+    # webhook batches wait for the whole run: a page they index after the listing snapshot must
+    # not be removed by this run's reconciliation
+    async with notion_sync_lock:
+        return await _import_notion(timer_file_path)
+
+
+async def _import_notion(timer_file_path: str) -> int:
     exporter = NotionExporter(timer_file_path=timer_file_path)
     current_time = exporter.get_timestamp()
 
+    # a due reconciliation lists the whole workspace once and reuses it to find changed pages
+    reconcile = exporter.reconcile_due(_get_reconcile_interval())
+
     try:
-        pages = await asyncio.to_thread(exporter.get_pages)
+        # pages are chunked and embedded while their blocks are still being fetched
+        imported = await asyncio.to_thread(
+            exporter.index_pages,
+            database.store_notion_page_stream,
+            full_listing=reconcile,
+            sync_state=database.notion_sync_state,
+        )
+        # failed pages are tracked in notion_sync_state and retried, so the watermark can move past them
+        exporter.save_timestamp(current_time)
 
-        if not pages:
+        if reconcile and exporter.live_page_ids is not None:
+            await asyncio.to_thread(database.reconcile_notion_pages, exporter.live_page_ids)
+
+        if not imported:
             print("No new Notion pages to import.")
-            exporter.save_timestamp(current_time)
             return 0
 
-        await asyncio.to_thread(database.store_notion_pages, pages)
-        exporter.save_timestamp(current_time)
-        print(f"Imported {len(pages)} Notion pages into the vector database.")
-        return len(pages)
+        print(f"Imported {imported} Notion pages into the vector database.")
+        return imported
     except Exception as exc:
         print(f"Error during Notion import: {exc}")
         return 0
@@ -75,12 +123,33 @@ async def notion_import_worker(interval_minutes: int, timer_file_path: str) -> N
         print("Notion import worker cancelled.")
         raise
 
+async def process_notion_changes(upserts: List[str], deletes: List[str]) -> None:
+    """Re-export and re-index the pages of debounced webhook events, and drop deleted ones."""
+    if database is None or notion_webhook_exporter is None:
+        return
+
+    if deletes:
+        await asyncio.to_thread(database.delete_notion_pages, deletes)
+    indexed = 0
+    if upserts:
+        indexed = await asyncio.to_thread(
+            notion_webhook_exporter.index_page_ids,
+            upserts,
+            database.store_notion_page_stream,
+            on_failure=database.notion_sync_state.mark_failed,
+        )
+    print(f"Notion webhook batch: {indexed} of {len(upserts)} changed pages indexed, {len(deletes)} deleted pages removed.")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     load_dotenv()
     
     global database
     global notion_import_task
+    global notion_webhook_queue
+    global notion_webhook_task
+    global notion_webhook_exporter
     try:
         # Startup: Initialize the database connection
         database = vector_db_instance
@@ -88,6 +157,18 @@ async def lifespan(app: FastAPI):
         interval_minutes = _get_notion_interval()
         timer_file_path = os.getenv("NOTION_TIMER_FILE", "notion_last_export.txt")
 
+        if _get_webhook_secret():
+            # webhooks deliver changes; polling only catches missed events
+            notion_webhook_exporter = NotionExporter(timer_file_path=timer_file_path)
+            notion_webhook_queue = PageChangeQueue(
+                debounce_seconds=get_float_env("NOTION_WEBHOOK_DEBOUNCE_SECONDS", 30.0),
+                max_delay_seconds=get_float_env("NOTION_WEBHOOK_MAX_DELAY_SECONDS", 300.0),
+                lock=notion_sync_lock,
+            )
+            notion_webhook_task = asyncio.create_task(notion_webhook_queue.run(process_notion_changes))
+            interval_minutes = _get_webhook_poll_interval()
+            print(f"Notion webhooks enabled (debounce {notion_webhook_queue.debounce_seconds:g}s); polling is a safety net.")
+
         notion_import_task = asyncio.create_task(
             notion_import_worker(interval_minutes=interval_minutes, timer_file_path=timer_file_path)
         )
@@ -112,13 +193,29 @@ async def lifespan(app: FastAPI):
                 pass
         notion_import_task = None
 
+        if notion_webhook_task is not None:
+            notion_webhook_task.cancel()
+            try:
+                await notion_webhook_task
+            except asyncio.CancelledError:
+                pass
+        notion_webhook_task = None
+        notion_webhook_queue = None
+        notion_webhook_exporter = None
+
         if database is not None:
             database.shutdown()
         database = None
+        await dispose_engines()
         print("Database connection closed")
 
 app = FastAPI(title="RAG API", version="1.0.0", lifespan=lifespan)
 
+# PROFILE_ENABLED keeps sampling profiles of slow (and a fraction of other) requests; see GET /profiles
+request_profiler = get_request_profiler()
+if request_profiler is not None:
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler)
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -136,7 +233,7 @@ async def stats_endpoint(server_id: str | None = None):
                 }
             )
 
-        stats = database.get_stats(server_id=server_id)
+        stats = await database.get_stats(server_id=server_id)
         return {
             "status": "success",
             **stats
@@ -154,6 +251,129 @@ async def stats_endpoint(server_id: str | None = None):
             }
         )
 
+@app.get("/poolStats")
+async def pool_stats_endpoint():
+    """Connection pool utilization and checkout wait times for the shared engines"""
+    return {
+        "status": "success",
+        "pools": get_pool_stats()
+    }
+
+class PoolCollector:
+    """Connection pool gauges, read from get_pool_stats at scrape time"""
+
+    def collect(self):
+        checked_out = GaugeMetricFamily("rag_db_pool_checked_out", "Connections currently checked out of the pool", labels=["pool"])
+        size = GaugeMetricFamily("rag_db_pool_size", "Pool size (without overflow)", labels=["pool"])
+        timeouts = CounterMetricFamily("rag_db_pool_checkout_timeouts", "Checkouts that timed out waiting for a connection", labels=["pool"])
+        for pool, stats in get_pool_stats().items():
+            checked_out.add_metric([pool], stats.get("checked_out", 0))
+            size.add_metric([pool], stats.get("size", 0))
+            timeouts.add_metric([pool], stats.get("timeouts", 0))
+        return [checked_out, size, timeouts]
+
+REGISTRY.register(PoolCollector())
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics (text exposition format)"""
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/profiles")
+async def profiles_endpoint():
+    """Profiles captured by the request profiler, newest first (download with GET /profiles/{id})"""
+    if request_profiler is None:
+        return {"status": "success", "enabled": False, "profiles": []}
+
+    return {
+        "status": "success",
+        "enabled": True,
+        "profiles": await asyncio.to_thread(request_profiler.store.list)
+    }
+
+@app.get("/profiles/{profile_id}")
+async def profile_download_endpoint(profile_id: str):
+    """One captured profile in the collapsed-stack format (flamegraph.pl, speedscope, inferno)"""
+    path = request_profiler.store.collapsed_path(profile_id) if request_profiler is not None else None
+    if path is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "message": f"Profile {profile_id} not found",
+                "status": "error"
+            }
+        )
+
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
+
+@app.get("/discordFilterStats")
+async def discord_filter_stats_endpoint():
+    """Messages the pre-embedding filter kept out of the vector store and the embedding work saved"""
+    try:
+        if database is None:
+            raise HTTPException(
+                status_code=503,
+                detail={
+                    "message": "Database not initialized",
+                    "status": "error"
+                }
+            )
+
+        return {
+            "status": "success",
+            **await database.get_discord_filter_stats()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Discord filter stats endpoint error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"Failed to retrieve filter stats: {e}",
+                "status": "error"
+            }
+        )
+
+@app.post("/notionWebhook")
+async def notion_webhook_endpoint(request: Request):
+    """Receive Notion webhook events and queue the affected pages for re-indexing"""
+    body = await request.body()
+    try:
+        event = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail={"message": "Invalid JSON payload", "status": "error"})
+
+    secret = _get_webhook_secret()
+    if isinstance(event, dict) and "verification_token" in event and not secret:
+        # one-time subscription handshake: the token is needed to verify the subscription and sign events
+        print(f"Received Notion webhook verification token: {event['verification_token']} (set NOTION_WEBHOOK_SECRET to it)")
+        return {"status": "success"}
+
+    if not secret or notion_webhook_queue is None:
+        raise HTTPException(status_code=503, detail={"message": "Notion webhooks are not enabled", "status": "error"})
+
+    if not verify_signature(body, request.headers.get("X-Notion-Signature"), secret):
+        raise HTTPException(status_code=401, detail={"message": "Invalid signature", "status": "error"})
+
+    change = page_change(event) if isinstance(event, dict) else None
+    if change is None:
+        return {"status": "ignored"}
+
+    page_id, deleted = change
+    notion_webhook_queue.enqueue(page_id, deleted=deleted)
+    return {"status": "queued", "pageId": page_id}
+
+@app.get("/notionWebhookStats")
+async def notion_webhook_stats_endpoint():
+    """Counters of the webhook debounce queue"""
+    return {
+        "status": "success",
+        "enabled": notion_webhook_queue is not None,
+        "queue": notion_webhook_queue.snapshot() if notion_webhook_queue is not None else None
+    }
+
 # Query endpoint
 @app.post("/query")
 async def query_endpoint(request: QueryRequest):
@@ -172,22 +392,41 @@ async def query_endpoint(request: QueryRequest):
             enabled_sources.append(SourceType.DISCORD)
         if request.enable_notion:
             enabled_sources.append(SourceType.NOTION)
-        llm_response_tuple = await database.llm_response(
-            query=request.query,
-            server_id=request.serverId,
-            enabled_sources=enabled_sources,
-        )
+        server = server_label(request.serverId)
+        sampled = should_sample(get_trace_sample_rate())
+        # profiled requests are traced so their profile carries the stage timings
+        trace = QueryTrace() if request.debug or sampled or current_capture.get() is not None else None
+        tag_profile(serverId=request.serverId)
+        try:
+            with QUERIES_IN_FLIGHT.labels(server_id=server).track_inprogress(), QUERY_SECONDS.labels(server_id=server).time():
+                llm_response_tuple = await database.llm_response(
+                    query=request.query,
+                    server_id=request.serverId,
+                    enabled_sources=enabled_sources,
+                    search_profile=request.search_profile,
+                    trace=trace,
+                )
+        except Exception:
+            QUERY_ERRORS.labels(server_id=server).inc()
+            raise
+        finally:
+            if trace is not None:
+                tag_profile(trace=trace.to_dict())
 
-        print(llm_response_tuple)
-        
         response_text, sources = llm_response_tuple
-        
-        return {
+
+        result = {
             "query": request.query,
             "response": response_text,
             "sources": sources,
             "status": "success"
         }
+        if request.debug:
+            result["trace"] = trace.to_dict()
+        elif sampled:
+            # sampled traces are only logged
+            print(f"Query trace (server {request.serverId}): {json.dumps(trace.to_dict())}")
+        return result
             
     except Exception as e:
         print(f"Query error: {e}")
@@ -249,8 +488,7 @@ async def update_message_endpoint(old_message: MessageJson, new_message: Message
             }
         )
     try:
-        database.delete_discord_message(old_message.metadata.messageId)
-        database.store_discord_message(new_message)
+        database.update_discord_message(new_message)
         return {
             "message": f"Successfully updated message with ID {old_message.metadata.messageId}",
             "status": "success"
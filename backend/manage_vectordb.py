@@ -0,0 +1,186 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+from RAG.consistency import delete_duplicate_vectors, delete_notion_pages, delete_orphan_vectors, diff_discord_stores, find_stale_notion_pages
+from RAG.database import get_connection_string
+from RAG.hnsw import HNSWBuildParams, VectorStorage, get_build_params, get_embed_dim, get_index_options, index_name_for, rebuild_hnsw_index
+from RAG.sync_state import ensure_sync_state_table
+
+# Maintenance commands for the vector database.
+# Runs against Postgres directly so the embedding/reranker models are never loaded.
+
+VECTOR_TABLES = {
+    "discord": "data_discord_embeddings",
+    "notion": "data_notion_embeddings",
+}
+
+
+def _selected_tables(table: str) -> list[str]:
+    if table == "all":
+        return list(VECTOR_TABLES.values())
+    return [VECTOR_TABLES[table]]
+
+
+def reindex_command(args) -> None:
+    """Rebuild HNSW indexes with new build parameters"""
+    embed_dim = args.embed_dim if args.embed_dim is not None else get_embed_dim()
+    defaults = get_build_params(embed_dim)
+    index_dim = args.index_dim if args.index_dim is not None else defaults.index_dim
+    params = HNSWBuildParams(
+        m=args.m if args.m is not None else defaults.m,
+        ef_construction=args.ef_construction if args.ef_construction is not None else defaults.ef_construction,
+        storage=VectorStorage(args.storage) if args.storage is not None else defaults.storage,
+        index_dim=index_dim if index_dim and index_dim < embed_dim else None,
+    )
+
+    engine = create_engine(get_connection_string())
+    try:
+        for table_name in _selected_tables(args.table):
+            index_name = index_name_for(table_name, params)
+            print(f"🔄 {index_name}: {get_index_options(engine, index_name)} -> m={params.m}, ef_construction={params.ef_construction}")
+            rebuild_hnsw_index(engine, table_name, params, embed_dim=embed_dim, maintenance_work_mem=args.maintenance_work_mem)
+            print(f"✅ {index_name}: {get_index_options(engine, index_name)}")
+    finally:
+        engine.dispose()
+
+
+def check_consistency_command(args) -> None:
+    """Diff discord_text against the Discord embeddings by message id"""
+    engine = create_engine(get_connection_string())
+    try:
+        report = diff_discord_stores(engine, sample_size=args.sample_size)
+        for check, result in report.items():
+            icon = "✅" if result["count"] == 0 else "⚠️"
+            print(f"{icon} {check}: {result['count']}")
+            if result["sample"]:
+                print(f"   e.g. {', '.join(result['sample'])}")
+
+        if args.repair:
+            print(f"🧹 Deleted {delete_orphan_vectors(engine)} orphaned embedding rows")
+            print(f"🧹 Deleted {delete_duplicate_vectors(engine)} duplicated embedding rows")
+    finally:
+        engine.dispose()
+
+    if args.reembed_missing and report["missing_vectors"]["count"]:
+        # loads the embedding model
+        from RAG.vectordb import vector_db_instance
+        repaired = vector_db_instance.check_discord_consistency(repair=True)
+        print(f"✅ Re-embedded {repaired['reembedded_messages']} messages and rebuilt {repaired['rebuilt_windows']} conversation windows")
+
+
+def rebuild_discord_windows_command(args) -> None:
+    """Regroup stored Discord messages into conversation windows and embed them"""
+    # loads the embedding model
+    from RAG.vectordb import vector_db_instance
+
+    if vector_db_instance.discord_index_mode != "window":
+        print("⚠️ DISCORD_INDEX_MODE is not window; new messages would still be embedded one by one")
+
+    report = vector_db_instance.rebuild_discord_windows(server_id=args.server_id)
+    print(f"✅ {report['messages']} messages in {report['channels']} channels now form {report['windows']} windows")
+
+
+def reconcile_notion_command(args) -> None:
+    """Delete embeddings of Notion pages that were deleted or archived in the workspace"""
+    from notion.notion_exporter import NotionExporter
+
+    exporter = NotionExporter(timer_file_path=os.getenv("NOTION_TIMER_FILE", "notion_last_export.txt"))
+    live_page_ids = exporter.list_live_page_ids()
+    if live_page_ids is None:
+        print("⚠️ The workspace listing did not complete; refusing to delete anything")
+        return
+    if not live_page_ids:
+        print("⚠️ The workspace listing returned no pages; refusing to delete anything")
+        return
+
+    engine = create_engine(get_connection_string())
+    try:
+        with engine.begin() as conn:
+            ensure_sync_state_table(conn)
+        stale_page_ids = find_stale_notion_pages(engine, live_page_ids)
+        print(f"📄 {len(live_page_ids)} live pages, {len(stale_page_ids)} stale pages in the vector table")
+        if stale_page_ids:
+            print(f"   e.g. {', '.join(stale_page_ids[:args.sample_size])}")
+
+        if stale_page_ids and not args.dry_run:
+            deleted_rows = delete_notion_pages(engine, stale_page_ids, batch_size=args.batch_size)
+            print(f"🧹 Deleted {deleted_rows} embedding rows of {len(stale_page_ids)} pages")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector database maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reindex_parser = subparsers.add_parser("reindex", help="Rebuild HNSW indexes with new build parameters")
+    reindex_parser.add_argument(
+        "--table",
+        choices=["all", *VECTOR_TABLES.keys()],
+        default="all",
+        help="Which vector table to reindex (default: all)"
+    )
+    reindex_parser.add_argument("--m", type=int, default=None, help="HNSW m (default: HNSW_M or 16)")
+    reindex_parser.add_argument(
+        "--ef-construction",
+        type=int,
+        default=None,
+        help="HNSW ef_construction (default: HNSW_EF_CONSTRUCTION or 64)"
+    )
+    reindex_parser.add_argument(
+        "--storage",
+        choices=[storage.value for storage in VectorStorage],
+        default=None,
+        help="Index storage layout (default: VECTOR_STORAGE or float32). Indexes of other layouts are dropped"
+    )
+    reindex_parser.add_argument("--embed-dim", type=int, default=None, help="Full embedding dimension (default: EMBED_DIM or 1024)")
+    reindex_parser.add_argument(
+        "--index-dim",
+        type=int,
+        default=None,
+        help="Matryoshka prefix length to index (default: EMBED_INDEX_DIM or all dimensions)"
+    )
+    reindex_parser.add_argument(
+        "--maintenance-work-mem",
+        default=None,
+        help="maintenance_work_mem for the build, e.g. 1GB (larger values build faster)"
+    )
+    reindex_parser.set_defaults(func=reindex_command)
+
+    consistency_parser = subparsers.add_parser(
+        "check-consistency",
+        help="Diff discord_text against the Discord embeddings by message id"
+    )
+    consistency_parser.add_argument("--sample-size", type=int, default=20, help="Message ids to print per check (default: 20)")
+    consistency_parser.add_argument("--repair", action="store_true", help="Delete orphaned and duplicated embedding rows")
+    consistency_parser.add_argument(
+        "--reembed-missing",
+        action="store_true",
+        help="Also embed messages that have no embedding rows (implies --repair, loads the embedding model)"
+    )
+    consistency_parser.set_defaults(func=check_consistency_command)
+
+    windows_parser = subparsers.add_parser(
+        "rebuild-discord-windows",
+        help="Replace per-message Discord embeddings with conversation windows (loads the embedding model)"
+    )
+    windows_parser.add_argument("--server-id", default=None, help="Only rebuild this server's channels (default: all)")
+    windows_parser.set_defaults(func=rebuild_discord_windows_command)
+
+    reconcile_parser = subparsers.add_parser(
+        "reconcile-notion",
+        help="Delete embeddings of Notion pages that were deleted or archived"
+    )
+    reconcile_parser.add_argument("--dry-run", action="store_true", help="Only report stale pages")
+    reconcile_parser.add_argument("--batch-size", type=int, default=500, help="Pages deleted per statement (default: 500)")
+    reconcile_parser.add_argument("--sample-size", type=int, default=20, help="Page ids to print (default: 20)")
+    reconcile_parser.set_defaults(func=reconcile_notion_command)
+
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    args.func(args)
@@ -9,6 +9,12 @@ class SourceType(Enum):
     NOTION = "notion"
 
 
+class SearchProfile(Enum):
+    FAST = "fast"
+    BALANCED = "balanced"
+    ACCURATE = "accurate"
+
+
 class MessageData(BaseModel):
     senderNickname: Optional[str]
     senderUsername: str
@@ -35,6 +41,8 @@ class QueryRequest(BaseModel):
     serverId: str
     enable_discord: bool
     enable_notion: bool
+    search_profile: Optional[SearchProfile] = None  # defaults to HNSW_SEARCH_PROFILE
+    debug: Optional[bool] = False  # return a timing trace of the request
 
 
 class FormattedDiscordSource(BaseModel):
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from RAG.config import get_int_env
+
+# Persistent cache of /blocks/{id}/children responses.
+# An entry is keyed by the block's id and the last_edited_time of the page it belongs to. A block's
+# own last_edited_time cannot be used: editing a nested block (a table_row cell, a toggle's contents)
+# does not always update its parent's, which would then keep serving the old children. Any edit
+# updates the page's, so an edited page misses everywhere and is refetched, and re-exports of an
+# unchanged page (retries, webhook redeliveries, a reset watermark) are served from disk.
+# Notion reports last_edited_time rounded down to the minute, so two edits within one minute share
+# a key: a page is only cached once its edit minute is over, and exports while it is still running
+# (typically webhook re-exports right after an edit) always go to the API.
+# Only the direct children are stored; the tree is reassembled level by level.
+
+ENTRY_SUFFIX = ".json"
+# resolution of Notion's last_edited_time, plus a margin for clock skew
+EDIT_TIME_SETTLE_SECONDS = 90
+
+
+def edit_time_settled(last_edited_time: str | None) -> bool:
+    """Whether no further edit can share `last_edited_time`, i.e. its minute is over"""
+    if not last_edited_time:
+        return False
+    try:
+        edited_at = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return False
+    return time.time() - edited_at >= EDIT_TIME_SETTLE_SECONDS
+
+
+class BlockCache:
+    """On-disk children cache with LRU (by file mtime) size-based eviction"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: int | None = None
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _safe(value: str) -> str:
+        return re.sub(r"[^A-Za-z0-9._-]", "_", value)
+
+    def _block_dir(self, block_id: str) -> str:
+        return os.path.join(self.cache_dir, self._safe(block_id))
+
+    def _entry_path(self, block_id: str, last_edited_time: str) -> str:
+        return os.path.join(self._block_dir(block_id), f"{self._safe(last_edited_time)}{ENTRY_SUFFIX}")
+
+    def get(self, block_id: str, last_edited_time: str | None) -> List[Dict[str, Any]] | None:
+        """Return the children of a block cached under its page's `last_edited_time`, or None on a miss"""
+        if not edit_time_settled(last_edited_time):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        path = self._entry_path(block_id, last_edited_time)
+        try:
+            with open(path, "r") as f:
+                children = json.load(f)
+            # mark as recently used for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return children
+
+    def put(self, block_id: str, last_edited_time: str | None, children: List[Dict[str, Any]]) -> None:
+        """Store the children of a block under its page's `last_edited_time`, replacing older versions"""
+        if not edit_time_settled(last_edited_time):
+            return
+
+        block_dir = self._block_dir(block_id)
+        path = self._entry_path(block_id, last_edited_time)
+        payload = json.dumps(children, separators=(",", ":"))
+        freed = 0
+        try:
+            os.makedirs(block_dir, exist_ok=True)
+            # superseded versions can never hit again; another thread's .tmp file is left alone
+            for name in os.listdir(block_dir):
+                stale_path = os.path.join(block_dir, name)
+                if name.endswith(ENTRY_SUFFIX) and stale_path != path:
+                    try:
+                        size = os.path.getsize(stale_path)
+                        os.remove(stale_path)
+                    except FileNotFoundError:
+                        # removed by a concurrent put or evict
+                        continue
+                    freed += size
+
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write Notion block cache entry for {block_id}: {e}")
+            return
+
+        with self._lock:
+            self.writes += 1
+            if self._size is not None:
+                self._size += len(payload) - freed
+            over_budget = self._current_size() > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+    def _current_size(self) -> int:
+        # caller holds self._lock
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        return self._size
+
+    def _entries(self) -> List[tuple[float, str, int]]:
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                # in-progress writes are not entries yet
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache is at 90% of max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            size = sum(entry_size for _, _, entry_size in entries)
+            target = int(self.max_bytes * 0.9)
+            for _, path, entry_size in entries:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                    os.rmdir(os.path.dirname(path))
+                except OSError:
+                    # the block directory still holds another entry
+                    pass
+                size -= entry_size
+                self.evictions += 1
+            self._size = size
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+_block_cache: BlockCache | None = None
+_block_cache_lock = threading.Lock()
+
+
+def get_block_cache() -> BlockCache | None:
+    """Return the process-wide cache in NOTION_CACHE_DIR (default notion_cache), or None if disabled.
+
+    Set NOTION_CACHE_DIR to an empty string to disable caching; NOTION_CACHE_MAX_MB bounds its size.
+    """
+    global _block_cache
+    cache_dir = os.getenv("NOTION_CACHE_DIR", "notion_cache")
+    if not cache_dir:
+        return None
+
+    with _block_cache_lock:
+        if _block_cache is None or _block_cache.cache_dir != cache_dir:
+            max_bytes = max(get_int_env("NOTION_CACHE_MAX_MB", 512), 1) * 1024 * 1024
+            _block_cache = BlockCache(cache_dir, max_bytes)
+        return _block_cache
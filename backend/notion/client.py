@@ -0,0 +1,200 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from RAG.config import get_float_env, get_int_env
+from RAG.metrics import NOTION_API_REQUESTS, NOTION_API_SECONDS
+from .rate_limiter import TokenBucket, get_block_workers, get_notion_workers, get_rate_limiter
+
+# One pooled HTTP client for every Notion API call in the process: keep-alive connections (HTTP/2
+# when the optional `h2` package is installed), auth/version headers, timeouts, the shared rate
+# limiter and the retry policy live here instead of in each exporter method.
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+NOTION_BASE_URL = "https://api.notion.com/v1"
+NOTION_VERSION = "2025-09-03"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_ID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}")
+
+
+def endpoint_for(method: str, path: str) -> str:
+    """Group requests by endpoint, e.g. `GET /blocks/{id}/children`"""
+    return f"{method.upper()} {_ID_PATTERN.sub('{id}', path.split('?', 1)[0])}"
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    """Parse Retry-After (delta-seconds or HTTP date)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with full jitter, capped at 30s"""
+    return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+
+class EndpointStats:
+    """Thread-safe request counts and latencies per endpoint"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._window = window
+        self._endpoints: dict[str, dict] = {}
+
+    def record(self, endpoint: str, seconds: float, status_code: int | None) -> None:
+        NOTION_API_REQUESTS.labels(endpoint=endpoint, status=str(status_code) if status_code is not None else "error").inc()
+        NOTION_API_SECONDS.labels(endpoint=endpoint).observe(seconds)
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                "requests": 0,
+                "errors": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "recent": deque(maxlen=self._window),
+            })
+            stats["requests"] += 1
+            if status_code is None or status_code >= 400:
+                stats["errors"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["recent"].append(seconds)
+
+    def snapshot(self) -> dict[str, dict[str, int | float]]:
+        with self._lock:
+            result = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                recent = sorted(stats["recent"])
+                result[endpoint] = {
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "avg_ms": round(stats["total_seconds"] / stats["requests"] * 1000, 1),
+                    "p50_ms": round(recent[len(recent) // 2] * 1000, 1),
+                    "p95_ms": round(recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000, 1),
+                    "max_ms": round(stats["max_seconds"] * 1000, 1),
+                }
+            return result
+
+
+class NotionClient:
+    """Thread-safe Notion API client shared by NotionExporter and NotionPageExporter"""
+
+    def __init__(
+        self,
+        token: str | None = None,
+        limiter: TokenBucket | None = None,
+        timeout: float | None = None,
+        max_retries: int | None = None,
+        max_connections: int | None = None,
+    ):
+        self.limiter = limiter or get_rate_limiter()
+        self.max_retries = max_retries if max_retries is not None else get_int_env("NOTION_MAX_RETRIES", 5)
+        self.stats = EndpointStats()
+
+        timeout = timeout if timeout is not None else get_float_env("NOTION_TIMEOUT_SECONDS", 30.0)
+        # enough connections for every page and block worker to keep one alive
+        max_connections = max_connections or max(get_notion_workers() + get_block_workers(), 4)
+        self._client = httpx.Client(
+            base_url=NOTION_BASE_URL,
+            headers={
+                "accept": "application/json",
+                "authorization": f"Bearer {token if token is not None else os.getenv('NOTION_TOKEN')}",
+                "Notion-Version": NOTION_VERSION,
+            },
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=HTTP2_AVAILABLE,
+        )
+
+    def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a rate-limited request to the Notion API.
+
+        429 responses pause the shared limiter for Retry-After seconds; 5xx responses and transport
+        errors are retried with exponential backoff. Other error statuses (400, 401, 403, 404, 409)
+        are raised at once, and after `max_retries` the last error is raised, so a partial export is
+        never mistaken for a complete one.
+        """
+        endpoint = endpoint_for(method, path)
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self._client.request(method, path, **kwargs)
+            except httpx.TransportError:
+                self.stats.record(endpoint, time.perf_counter() - start, None)
+                if attempt >= self.max_retries:
+                    raise
+                self.limiter.record_retry()
+                time.sleep(_backoff_seconds(attempt))
+                attempt += 1
+                continue
+
+            self.stats.record(endpoint, time.perf_counter() - start, response.status_code)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response
+            if attempt >= self.max_retries:
+                response.raise_for_status()
+
+            self.limiter.record_retry()
+            delay = _retry_after_seconds(response)
+            if response.status_code == 429:
+                # back off every worker, not just this one
+                self.limiter.pause(delay if delay is not None else _backoff_seconds(attempt))
+            else:
+                time.sleep(delay if delay is not None else _backoff_seconds(attempt))
+            attempt += 1
+
+    def get(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("POST", path, **kwargs)
+
+    def endpoint_stats(self) -> dict[str, dict[str, int | float]]:
+        return self.stats.snapshot()
+
+    def format_endpoint_stats(self) -> str:
+        lines = [f"{'endpoint':<32}{'requests':>9}{'errors':>8}{'avg ms':>9}{'p95 ms':>9}"]
+        for endpoint, stats in self.endpoint_stats().items():
+            lines.append(f"{endpoint:<32}{stats['requests']:>9}{stats['errors']:>8}{stats['avg_ms']:>9.1f}{stats['p95_ms']:>9.1f}")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        self._client.close()
+
+
+_client: NotionClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_notion_client() -> NotionClient:
+    """Return the process-wide Notion client"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NotionClient()
+        return _client
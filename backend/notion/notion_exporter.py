@@ -1,20 +1,30 @@
 import uuid
 from dotenv import load_dotenv
-import requests, os, json
+import os, json, time
+
+from typing import Any, Callable
 
 from models import NotionPageJson
-from .notion_page_exporter import NotionPageExporter
+from RAG.config import get_int_env
+from RAG.sync_state import NotionSyncState
+from .notion_page_exporter import NotionPageExporter, NotionPageStream
+from .client import get_notion_client
+from .rate_limiter import get_notion_workers, get_rate_limiter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
 from tqdm import tqdm
 
 class NotionExporter:
-    def __init__(self, timer_file_path="notion_last_export.txt"):
+    def __init__(self, timer_file_path="notion_last_export.txt", workers: int | None = None):
         
-        self.NOTION_TOKEN = os.getenv("NOTION_TOKEN")
-        self.BASE_URL = "https://api.notion.com/v1"
+        self.client = get_notion_client()
         self.NOTION_PAGE_EXPORTER = NotionPageExporter()
         self.timer_file_path = timer_file_path
         self.most_recent_timestamp = self.load_timestamp()
+        # pages fetched concurrently; all workers share the Notion rate limiter
+        self.workers = workers if workers is not None else get_notion_workers()
+        # set by a full listing (see get_changed_page_ids)
+        self.live_page_ids: set[str] | None = None
     
     def save_timestamp(self, timestamp):
         # save to file
@@ -34,51 +44,196 @@ class NotionExporter:
         except FileNotFoundError:
             return "1970-01-01T00:00:00.000Z"
 
-    def list_workspace_pages(self):
+    def _listing_stats_path(self) -> str:
+        return f"{os.path.splitext(self.timer_file_path)[0]}.listing.json"
+
+    def _load_listing_stats(self) -> dict:
+        try:
+            with open(self._listing_stats_path(), "r") as f:
+                stats = json.load(f)
+            return stats if isinstance(stats, dict) else {}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def load_workspace_size(self) -> int | None:
+        """Number of /search results seen by the last full listing (used to estimate saved calls)"""
+        try:
+            return int(self._load_listing_stats()["workspace_size"])
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    def load_last_full_listing(self) -> str | None:
+        """Timestamp of the last full workspace listing, if one was recorded"""
+        listed_at = self._load_listing_stats().get("listed_at")
+        return listed_at if isinstance(listed_at, str) else None
+
+    def save_workspace_size(self, workspace_size: int) -> None:
+        try:
+            with open(self._listing_stats_path(), "w") as f:
+                json.dump({"workspace_size": workspace_size, "listed_at": self.get_timestamp()}, f)
+        except OSError as e:
+            print(f"Could not save Notion listing stats: {e}")
+
+    def reconcile_due(self, interval_hours: float) -> bool:
+        """Whether the last full listing is older than `interval_hours` (<= 0 disables reconciliation)"""
+        if interval_hours <= 0:
+            return False
+
+        last_listing = self.load_last_full_listing()
+        if last_listing is None:
+            return True
+
+        try:
+            listed_at = datetime.datetime.fromisoformat(last_listing.replace("Z", "+00:00"))
+        except ValueError:
+            return True
+        age = datetime.datetime.now(tz=datetime.timezone.utc) - listed_at
+        return age >= datetime.timedelta(hours=interval_hours)
+
+    def list_workspace_pages(self, stop_before: str | None = None):
+        """List /search results, newest edit first.
+
+        With `stop_before`, pagination stops at the first result edited at or before that timestamp:
+        results are sorted by last_edited_time descending, so everything after it is older too.
+        Call counts are kept in `self.listing_stats`; its `complete` flag is only set when every
+        page of a listing without `stop_before` was read, which is what reconciliation relies on.
+        """
 
         page_list = []
+        calls = 0
+        stopped_early = False
+        complete = False
 
-        search_url = f"{self.BASE_URL}/search"
-        
-        headers = {
-            "accept": "application/json", 
-            "content-type": "application/json", 
-            "authorization": f"Bearer {self.NOTION_TOKEN}", 
-            "Notion-Version": "2025-09-03"
-        }
         sort = {
             "direction": "descending",
             "timestamp": "last_edited_time"
         }
         payload = { "page_size": 100, "sort": sort }
 
-        response = requests.post(
-            url=search_url,
-            json=payload,
-            headers=headers,
-        ).json()
-        page_list.extend(response.get("results", []))
-
-        while response.get("has_more", False):
-            response = requests.post(
-                url=search_url,
-                json={**payload, "start_cursor": response.get("next_cursor")},
-                headers=headers,
-            ).json()
-            page_list.extend(response.get("results", []))
+        response = {}
+        while True:
+            request_payload = payload if calls == 0 else {**payload, "start_cursor": response["next_cursor"]}
+            response = self.client.post("/search", json=request_payload).json()
+            calls += 1
+
+            results = response.get("results")
+            if results is None:
+                print(f"Notion search returned no results list after {calls} calls; the listing is incomplete")
+                break
+
+            for result in results:
+                if stop_before is not None and result.get("last_edited_time", "") <= stop_before:
+                    stopped_early = True
+                    break
+                page_list.append(result)
 
+            if stopped_early:
+                break
+            if not response.get("has_more", False):
+                complete = stop_before is None
+                break
+            if not response.get("next_cursor"):
+                print(f"Notion search reported more results without a cursor after {calls} calls; the listing is incomplete")
+                break
+
+        self.listing_stats = {"calls": calls, "results": len(page_list), "stopped_early": stopped_early, "complete": complete}
         return page_list
+
+    def _report_listing(self) -> None:
+        """Print how many /search calls the watermark saved compared to a full listing"""
+        stats = self.listing_stats
+        if stats["complete"]:
+            self.save_workspace_size(stats["results"])
+            print(f"Listed {stats['results']} Notion results in {stats['calls']} search calls (full listing)")
+            return
+        if not stats["stopped_early"]:
+            print(f"Listed {stats['results']} Notion results in {stats['calls']} search calls (incomplete listing)")
+            return
+
+        workspace_size = self.load_workspace_size()
+        if workspace_size is None:
+            saved = "unknown until the next full listing"
+        else:
+            full_listing_calls = max(-(-workspace_size // 100), 1)
+            saved = f"~{max(full_listing_calls - stats['calls'], 0)} of ~{full_listing_calls}"
+        print(
+            f"Listed {stats['results']} changed Notion results in {stats['calls']} search calls, "
+            f"stopped at watermark {self.most_recent_timestamp} (calls saved: {saved})"
+        )
     
-    def get_pages(self, show_progress: bool = False) -> list[NotionPageJson]:
-        page_list = self.list_workspace_pages()
-        export_list: list[NotionPageJson] = []
-        progress = tqdm(page_list, desc="Fetching Notion pages", unit="page") if show_progress else None
-        iterator = progress if progress is not None else page_list
+    def get_pages(self, show_progress: bool = False, full_listing: bool = False) -> list[NotionPageJson]:
+        return self.fetch_pages(self.get_changed_page_ids(full_listing=full_listing), show_progress=show_progress)
+
+    def index_pages(
+        self,
+        store_page_stream: Callable[[NotionPageStream], Any],
+        show_progress: bool = False,
+        full_listing: bool = False,
+        sync_state: NotionSyncState | None = None,
+    ) -> int:
+        """Stream every changed page into `store_page_stream` (e.g. VectorDB.store_notion_page_stream).
 
-        for page in iterator:
-            if page["object"] == "page":
+        Pages are rendered section by section while they are consumed, so indexing starts before a
+        page's last block is fetched and no page is materialized as a NotionPageJson. Returns the
+        number of pages for which the store reported something written.
+
+        With `sync_state`, work is decided per page (see get_changed_page_ids) and a page that fails
+        is recorded as failed and retried next run instead of aborting the import.
+        """
+        return self.index_page_ids(
+            self.get_changed_page_ids(full_listing=full_listing, sync_state=sync_state),
+            store_page_stream,
+            show_progress=show_progress,
+            on_failure=sync_state.mark_failed if sync_state is not None else None,
+        )
+
+    def index_page_ids(
+        self,
+        page_ids: list[str],
+        store_page_stream: Callable[[NotionPageStream], Any],
+        show_progress: bool = False,
+        skip_failures: bool = False,
+        on_failure: Callable[[str, Exception], Any] | None = None,
+    ) -> int:
+        """Stream the given pages into `store_page_stream`.
+
+        With `skip_failures` or `on_failure`, a page that cannot be exported (e.g. deleted since it
+        was queued) is logged, reported to `on_failure` and skipped instead of aborting the remaining pages.
+        """
+        def index_page(page_id: str) -> Any:
+            try:
+                return store_page_stream(self.NOTION_PAGE_EXPORTER.stream_page(page_id))
+            except Exception as exc:
+                if not skip_failures and on_failure is None:
+                    raise
+                print(f"Skipping Notion page {page_id}: {exc}")
+                if on_failure is not None:
+                    on_failure(page_id, exc)
+                return None
+
+        results = self._run_pages(page_ids, index_page, "Indexing Notion pages", show_progress)
+        # empty pages are skipped by the store and report nothing written
+        return sum(1 for result in results if result)
+
+    def get_changed_page_ids(self, full_listing: bool = False, sync_state: NotionSyncState | None = None) -> list[str]:
+        """Ids of pages edited after the watermark, newest first.
+
+        With `full_listing` the whole workspace is listed instead of stopping at the watermark, and
+        the ids of every live page are kept in `self.live_page_ids` for reconciliation. They stay
+        None when the listing did not complete, so a truncated listing never deletes pages.
+
+        With `sync_state`, listed pages already synced at their current edit time are dropped and
+        pages whose last sync failed are added back (up to NOTION_SYNC_MAX_ATTEMPTS failures).
+        """
+        page_list = self.list_workspace_pages(stop_before=None if full_listing else self.most_recent_timestamp)
+        self._report_listing()
+        self.live_page_ids = self._live_page_ids(page_list) if full_listing and self.listing_stats["complete"] else None
+        changed_pages = []
+
+        for page in page_list:
+            if page["object"] == "page" and not page.get("archived") and not page.get("in_trash"):
                 if page["last_edited_time"] > self.most_recent_timestamp:
-                    export_list.append(self.NOTION_PAGE_EXPORTER.parse_page(page["id"]))
+                    changed_pages.append(page)
                 else:
                     # Get the title text from the first title element when available
                     title_property = page.get("properties", {}).get("title", {})
@@ -90,17 +245,125 @@ class NotionExporter:
                                 break
                     first_element = title_elements[0] if title_elements else {}
                     title_text = first_element.get("plain_text") or first_element.get("text", {}).get("content", "Untitled")
-                    message = f"skipping {title_text}: {page['last_edited_time']} < {self.most_recent_timestamp}"
-                    if progress is not None:
-                        progress.write(message)
-                    else:
-                        print(message)
+                    print(f"skipping {title_text}: {page['last_edited_time']} < {self.most_recent_timestamp}")
+
+        if sync_state is None:
+            return [page["id"] for page in changed_pages]
+
+        page_ids = sync_state.pages_to_sync({page["id"]: page["last_edited_time"] for page in changed_pages})
+        queued = set(page_ids)
+        retries = [
+            page_id
+            for page_id in sync_state.failed_page_ids(max_attempts=max(get_int_env("NOTION_SYNC_MAX_ATTEMPTS", 5), 1))
+            if page_id not in queued and (self.live_page_ids is None or page_id in self.live_page_ids)
+        ]
+        print(
+            f"{len(changed_pages) - len(page_ids)} changed Notion pages already synced, "
+            f"{len(page_ids)} to export, {len(retries)} failed pages to retry"
+        )
+        return page_ids + retries
+
+    def list_live_page_ids(self) -> set[str] | None:
+        """Ids of every page in the workspace that is not archived or in the trash (full listing),
+        or None when the listing did not complete"""
+        page_list = self.list_workspace_pages()
+        self._report_listing()
+        if not self.listing_stats["complete"]:
+            return None
+        return self._live_page_ids(page_list)
+
+    @staticmethod
+    def _live_page_ids(page_list: list[dict]) -> set[str]:
+        return {
+            page["id"]
+            for page in page_list
+            if page.get("object") == "page" and not page.get("archived") and not page.get("in_trash")
+        }
+
+    @staticmethod
+    def _limiter_delta(before: dict[str, int | float]) -> dict[str, int | float]:
+        """Limiter counters accumulated since `before`"""
+        now = get_rate_limiter().snapshot()
+        return {key: now[key] - before[key] for key in now}
+
+    def fetch_pages(self, page_ids: list[str], show_progress: bool = False) -> list[NotionPageJson]:
+        """Parse pages concurrently on `self.workers` threads, keeping the order of `page_ids`"""
+        return self._run_pages(page_ids, self.NOTION_PAGE_EXPORTER.parse_page, "Fetching Notion pages", show_progress)
+
+    def export_pages(self, page_ids: list[str], on_page: Callable[[NotionPageJson], Any], show_progress: bool = False) -> None:
+        """Parse pages concurrently and hand each one to `on_page` as soon as it is done.
 
-        if progress is not None:
-            progress.close()
+        `on_page` runs on the calling thread while the workers keep exporting, and pages are not
+        kept after it returns. An exception from `on_page` stops the export.
+        """
+        self._run_pages(page_ids, self.NOTION_PAGE_EXPORTER.parse_page, "Exporting Notion pages", show_progress, on_result=on_page)
 
-        return export_list
+    def _run_pages(
+        self,
+        page_ids: list[str],
+        handle_page: Callable[[str], Any],
+        description: str,
+        show_progress: bool = False,
+        on_result: Callable[[Any], Any] | None = None,
+    ) -> list:
+        """Run `handle_page` for every page id on `self.workers` threads; results keep the order of `page_ids`.
+
+        With `on_result`, each result is passed to it in completion order instead of being collected.
+        """
+        if not page_ids:
+            return []
+
+        limiter = get_rate_limiter()
+        before = limiter.snapshot()
+        block_cache = self.NOTION_PAGE_EXPORTER.block_cache
+        cache_before = block_cache.snapshot() if block_cache is not None else None
+        results: list[Any] = [None] * len(page_ids)
+        progress = tqdm(total=len(page_ids), desc=description, unit="page") if show_progress else None
+        start = time.perf_counter()
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notion-export")
+        try:
+            futures = {
+                executor.submit(handle_page, page_id): position
+                for position, page_id in enumerate(page_ids)
+            }
+            for future in as_completed(futures):
+                if on_result is not None:
+                    on_result(future.result())
+                else:
+                    results[futures[future]] = future.result()
+                if progress is not None:
+                    stats = self._limiter_delta(before)
+                    progress.update(1)
+                    progress.set_postfix(
+                        req_s=f"{stats['requests'] / (time.perf_counter() - start):.1f}",
+                        throttled=stats["throttled"],
+                        retries=stats["retries"],
+                    )
+        finally:
+            # stop queued pages after a failure instead of fetching the rest
+            executor.shutdown(wait=True, cancel_futures=True)
+            if progress is not None:
+                progress.close()
 
+        elapsed = time.perf_counter() - start
+        stats = self._limiter_delta(before)
+        print(
+            f"Processed {len(page_ids)} Notion pages in {elapsed:.1f}s "
+            f"({len(page_ids) / elapsed:.2f} pages/s, {stats['requests']} requests, "
+            f"{stats['throttled']} throttled, {stats['retries']} retries, {self.workers} workers)"
+        )
+        print(self.client.format_endpoint_stats())
+        if block_cache is not None:
+            cache_now = block_cache.snapshot()
+            cache_stats = {key: cache_now[key] - cache_before[key] for key in cache_now}
+            lookups = cache_stats["hits"] + cache_stats["misses"]
+            hit_rate = cache_stats["hits"] / lookups * 100 if lookups else 0.0
+            print(
+                f"Notion block cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                f"({hit_rate:.1f}% hit rate), {cache_stats['evictions']} evictions"
+            )
+        return results
 
 
 # test method
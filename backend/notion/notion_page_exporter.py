@@ -1,29 +1,71 @@
 from dotenv import load_dotenv
-import requests, os, json
-from typing import Dict, List, Any
+import json
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple
 from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from models import NotionPageData, NotionPageJson, NotionPageMetadata
+from .block_cache import get_block_cache
+from .client import get_notion_client
+from .rate_limiter import get_block_workers
+
+# subpages and databases are exported as pages of their own, so their children are not inlined
+NON_EXPANDED_BLOCK_TYPES = {'child_page', 'child_database'}
+
+# block types that render their own children (nested list items, table rows)
+SELF_RENDERED_BLOCK_TYPES = {'bulleted_list_item', 'numbered_list_item', 'table'}
+
+_block_executor: ThreadPoolExecutor | None = None
+_block_executor_lock = threading.Lock()
+
+
+def get_block_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool children requests run on (NOTION_BLOCK_WORKERS threads)"""
+    global _block_executor
+    with _block_executor_lock:
+        if _block_executor is None:
+            _block_executor = ThreadPoolExecutor(max_workers=get_block_workers(), thread_name_prefix="notion-blocks")
+        return _block_executor
+
+
+class NotionPageStream(NamedTuple):
+    """Page metadata plus a lazy generator of markdown sections (one per top-level block)"""
+    metadata: NotionPageMetadata
+    title: str
+    author: str
+    sections: Iterator[str]
+    # renders the sections again, from the block cache once `sections` was consumed (None without a cache)
+    replay: Callable[[], Iterator[str]] | None = None
 
 class NotionPageExporter:
     def __init__(self):
         
         load_dotenv() # todo see if this can be removed
-        self.NOTION_TOKEN = os.getenv("NOTION_TOKEN")
-        self.BASE_URL = "https://api.notion.com/v1"
+        self.client = get_notion_client()
+        # shared by every exporter in the process, so it bounds in-flight children requests across
+        # all pages and runs; the rate limiter bounds the request rate
+        self.block_executor = get_block_executor()
+        # children listings of unchanged blocks are read from disk (None when NOTION_CACHE_DIR is empty)
+        self.block_cache = get_block_cache()
 
     def parse_page(self, page_id: str) -> NotionPageJson:
         """Parse a Notion page and return its content as NotionPageJson"""
-        blocks = self.get_page_blocks(page_id)
-        page_metadata_raw = self.get_page_metadata(page_id)
-        # print(blocks)
-        markdown_content = []
+        page_stream = self.stream_page(page_id)
+        page_text = '\n\n'.join(page_stream.sections)
+
+        # Create data and metadata objects
+        page_data = NotionPageData(
+            title=page_stream.title,
+            content=page_text,
+            author=page_stream.author
+        )
         
-        for block in blocks.get('results', []):
-            block_markdown = self.parse_block(block)
-            if block_markdown:
-                markdown_content.append(block_markdown)
+        return NotionPageJson(data=page_data, metadata=page_stream.metadata)
 
-        page_text = '\n\n'.join(markdown_content)
+    def stream_page(self, page_id: str) -> NotionPageStream:
+        """Fetch a page's metadata and return it with a lazy generator of its markdown sections"""
+        # metadata first: its last_edited_time keys every cached listing of the page
+        page_metadata_raw = self.get_page_metadata(page_id)
         
         # Extract page information
         title = self._extract_page_title(page_metadata_raw)
@@ -33,13 +75,6 @@ class NotionPageExporter:
         last_edited_time = self._extract_last_edited_time(page_metadata_raw)
         url = page_metadata_raw.get('url')
         
-        # Create data and metadata objects
-        page_data = NotionPageData(
-            title=title,
-            content=page_text,
-            author=author
-        )
-        
         page_metadata = NotionPageMetadata(
             pageId=page_id,
             authorId=author_id,
@@ -47,31 +82,134 @@ class NotionPageExporter:
             lastEditedTime=last_edited_time,
             url=url
         )
-        
-        return NotionPageJson(data=page_data, metadata=page_metadata)
+
+        return NotionPageStream(
+            metadata=page_metadata,
+            title=title,
+            author=author,
+            sections=self.iter_page_sections(page_id, page_metadata_raw.get('last_edited_time')),
+            replay=(
+                (lambda: self.iter_page_sections(page_id, page_metadata_raw.get('last_edited_time')))
+                if self.block_cache is not None else None
+            ),
+        )
+
+    def iter_page_sections(self, page_id: str, last_edited_time: str | None = None) -> Iterator[str]:
+        """Yield the page's markdown one top-level block at a time.
+
+        Top-level blocks are fetched one API page (100 blocks) at a time and their subtrees are
+        expanded before the next page is requested, so only one batch is held in memory.
+        `last_edited_time` is the page's; it versions every cached listing of the page.
+        """
+        for batch in self._iter_children_batches(page_id, last_edited_time):
+            self._expand_blocks(batch, last_edited_time)
+            for block in batch:
+                block_markdown = self.parse_block(block)
+                if block_markdown:
+                    yield block_markdown
     
-    def get_page_blocks(self, page_id: str) -> Dict[str, Any]:
-        """Get all blocks from a Notion page"""
-        blocks_url = f"{self.BASE_URL}/blocks/{page_id}/children"
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {self.NOTION_TOKEN}",
-            "Notion-Version": "2025-09-03"
-        }
-        
-        response = requests.get(url=blocks_url, headers=headers)
-        return response.json()
+    def get_page_blocks(self, page_id: str, last_edited_time: str | None = None) -> Dict[str, Any]:
+        """Get all blocks from a Notion page, with every nested subtree attached as `children`"""
+        return {"object": "list", "results": self.fetch_block_tree(page_id, last_edited_time)}
+
+    def fetch_block_tree(self, block_id: str, last_edited_time: str | None = None) -> List[Dict]:
+        """Fetch the complete block tree below a block.
+
+        Children are expanded level by level; all blocks of a level that have children are fetched
+        concurrently on `block_executor`, and each child list follows `next_cursor` to the end.
+        Listings cached under (block id, `last_edited_time` of the page) are not fetched again.
+        """
+        blocks = self._get_cached_children(block_id, last_edited_time)
+        self._expand_blocks(blocks, last_edited_time)
+        return blocks
+
+    def _expand_blocks(self, blocks: List[Dict], page_edited_time: str | None = None) -> None:
+        """Attach the complete subtree of every block as `children`, one level at a time.
+
+        Nested listings are cached under the page's last_edited_time, not the parent block's: editing
+        a nested block (a table cell, a toggle's contents) does not always touch its parent's.
+        """
+        pending = [block for block in blocks if self._should_expand(block)]
+
+        while pending:
+            futures = [
+                (block, self.block_executor.submit(self._get_cached_children, block['id'], page_edited_time))
+                for block in pending
+            ]
+            pending = []
+            for block, future in futures:
+                block['children'] = future.result()
+                pending.extend(child for child in block['children'] if self._should_expand(child))
+
+    def _iter_children_batches(self, block_id: str, last_edited_time: str | None) -> Iterator[List[Dict]]:
+        """Yield a block's children one API page at a time, from the block cache when possible"""
+        cached = self.block_cache.get(block_id, last_edited_time) if self.block_cache is not None else None
+        if cached is not None:
+            for start in range(0, len(cached), 100):
+                yield cached[start:start + 100]
+            return
+
+        # shallow copies: callers attach `children` to the yielded blocks, the cache keeps only this level
+        listing = []
+        for batch in self._iter_children_pages(block_id):
+            if self.block_cache is not None:
+                listing.extend(dict(block) for block in batch)
+            yield batch
+
+        if self.block_cache is not None:
+            self.block_cache.put(block_id, last_edited_time, listing)
+
+    def _get_cached_children(self, block_id: str, last_edited_time: str | None) -> List[Dict]:
+        """Children of a block as of the page's `last_edited_time`, from the block cache when possible"""
+        if self.block_cache is None:
+            return self._list_children(block_id)
+
+        children = self.block_cache.get(block_id, last_edited_time)
+        if children is None:
+            children = self._list_children(block_id)
+            self.block_cache.put(block_id, last_edited_time, children)
+        return children
+
+    def _list_children(self, block_id: str) -> List[Dict]:
+        """Get every child of a block, following next_cursor until has_more is false"""
+        children = []
+        for batch in self._iter_children_pages(block_id):
+            children.extend(batch)
+        return children
+
+    def _iter_children_pages(self, block_id: str) -> Iterator[List[Dict]]:
+        """Yield each page of /blocks/{id}/children as it arrives.
+
+        Error statuses are raised by the client; a response without a `results` list or a cursor
+        to continue from raises too, so a failed listing never reads as a block with no children.
+        """
+        params = {"page_size": 100}
+
+        while True:
+            data = self.client.get(f"/blocks/{block_id}/children", params=params).json()
+            if not isinstance(data.get('results'), list):
+                raise ValueError(f"Notion returned no children listing for block {block_id}: {data}")
+            yield data['results']
+            if not data.get('has_more'):
+                return
+            if not data.get('next_cursor'):
+                raise ValueError(f"Notion listed more children of block {block_id} without a cursor")
+            params = {"page_size": 100, "start_cursor": data['next_cursor']}
+
+    def _should_expand(self, block: Dict) -> bool:
+        return bool(block.get('has_children')) and block.get('type') not in NON_EXPANDED_BLOCK_TYPES
+
+    def _get_children(self, block: Dict) -> List[Dict]:
+        """Children prefetched by fetch_block_tree, or fetched now for a standalone block"""
+        if 'children' in block:
+            return block['children']
+        if not self._should_expand(block):
+            return []
+        return self._list_children(block.get('id'))
     
     def get_page_metadata(self, page_id: str) -> Dict[str, Any]:
         """Get page metadata from Notion API"""
-        page_url = f"{self.BASE_URL}/pages/{page_id}"
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {self.NOTION_TOKEN}",
-            "Notion-Version": "2025-09-03"
-        }
-        
-        response = requests.get(url=page_url, headers=headers)
+        response = self.client.get(f"/pages/{page_id}")
         return response.json()
     
     def _extract_page_title(self, page_metadata: Dict[str, Any]) -> str:
@@ -120,7 +258,21 @@ class NotionPageExporter:
         return datetime.now()
     
     def parse_block(self, block: Dict[str, Any]) -> str:
-        """Convert a Notion block to markdown"""
+        """Convert a Notion block (and its children) to markdown"""
+        block_markdown = self._parse_block_content(block)
+        if block.get('type') in SELF_RENDERED_BLOCK_TYPES or not self._should_expand(block):
+            return block_markdown
+
+        # toggles, callouts, columns, synced blocks, ...: children follow their parent
+        parts = [block_markdown] if block_markdown else []
+        for child in self._get_children(block):
+            child_markdown = self.parse_block(child)
+            if child_markdown:
+                parts.append(child_markdown)
+        return '\n\n'.join(parts)
+
+    def _parse_block_content(self, block: Dict[str, Any]) -> str:
+        """Convert a single Notion block to markdown"""
         block_type = block.get('type')
         
         if not block_type:
@@ -157,7 +309,7 @@ class NotionPageExporter:
     
     def _parse_rich_text(self, rich_text: List[Dict]) -> str:
         """Parse Notion rich text to markdown"""
-        result = ""
+        parts = []
         for text_obj in rich_text:
             text = text_obj.get('plain_text', '')
             annotations = text_obj.get('annotations', {})
@@ -176,9 +328,9 @@ class NotionPageExporter:
             if text_obj.get('href'):
                 text = f"[{text}]({text_obj['href']})"
             
-            result += text
+            parts.append(text)
         
-        return result
+        return ''.join(parts)
     
     def _parse_paragraph(self, block: Dict) -> str:
         """Parse paragraph block"""
@@ -192,18 +344,6 @@ class NotionPageExporter:
         heading_text = self._parse_rich_text(rich_text)
         return f"{'#' * level} {heading_text}"
     
-    def _get_block_children(self, block_id: str) -> List[Dict]:
-        """Get children of a block"""
-        blocks_url = f"{self.BASE_URL}/blocks/{block_id}/children"
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {self.NOTION_TOKEN}",
-            "Notion-Version": "2025-09-03"
-        }
-        response = requests.get(url=blocks_url, headers=headers)
-        data = response.json()
-        return data.get('results', [])
-
     def _parse_bulleted_list_item(self, block: Dict, indent_level: int = 0) -> str:
         """Parse bulleted list item with support for nested items"""
         rich_text = block.get('bulleted_list_item', {}).get('rich_text', [])
@@ -214,15 +354,19 @@ class NotionPageExporter:
         result = f"{indent}- {item_text}"
         
         # Check for nested items (children)
-        if block.get('has_children', False):
-            children = self._get_block_children(block.get('id'))
-            for child in children:
-                if child.get('type') == 'bulleted_list_item':
-                    child_markdown = self._parse_bulleted_list_item(child, indent_level + 1)
-                    result += "\n" + child_markdown
-                elif child.get('type') == 'numbered_list_item':
-                    child_markdown = self._parse_numbered_list_item(child, indent_level + 1)
-                    result += "\n" + child_markdown
+        for child in self._get_children(block):
+            if child.get('type') == 'bulleted_list_item':
+                child_markdown = self._parse_bulleted_list_item(child, indent_level + 1)
+                result += "\n" + child_markdown
+            elif child.get('type') == 'numbered_list_item':
+                child_markdown = self._parse_numbered_list_item(child, indent_level + 1)
+                result += "\n" + child_markdown
+            else:
+                # other content nested under a list item is indented below it
+                child_markdown = self.parse_block(child)
+                if child_markdown:
+                    child_indent = "  " * (indent_level + 1)
+                    result += "\n" + "\n".join(child_indent + line for line in child_markdown.split("\n"))
         
         return result
     
@@ -236,15 +380,19 @@ class NotionPageExporter:
         result = f"{indent}1. {item_text}"
         
         # Check for nested items (children)
-        if block.get('has_children', False):
-            children = self._get_block_children(block.get('id'))
-            for child in children:
-                if child.get('type') == 'bulleted_list_item':
-                    child_markdown = self._parse_bulleted_list_item(child, indent_level + 1)
-                    result += "\n" + child_markdown
-                elif child.get('type') == 'numbered_list_item':
-                    child_markdown = self._parse_numbered_list_item(child, indent_level + 1)
-                    result += "\n" + child_markdown
+        for child in self._get_children(block):
+            if child.get('type') == 'bulleted_list_item':
+                child_markdown = self._parse_bulleted_list_item(child, indent_level + 1)
+                result += "\n" + child_markdown
+            elif child.get('type') == 'numbered_list_item':
+                child_markdown = self._parse_numbered_list_item(child, indent_level + 1)
+                result += "\n" + child_markdown
+            else:
+                # other content nested under a list item is indented below it
+                child_markdown = self.parse_block(child)
+                if child_markdown:
+                    child_indent = "  " * (indent_level + 1)
+                    result += "\n" + "\n".join(child_indent + line for line in child_markdown.split("\n"))
         
         return result
     
@@ -298,8 +446,8 @@ class NotionPageExporter:
         if not table_id:
             return "[Table parsing error: no table ID]"
         
-        # Get table rows
-        table_rows = self._get_table_rows(table_id)
+        # Get table rows (prefetched by fetch_block_tree when available)
+        table_rows = block['children'] if 'children' in block else self._get_table_rows(table_id)
         if not table_rows:
             return "[Empty table]"
         
@@ -322,19 +470,7 @@ class NotionPageExporter:
     
     def _get_table_rows(self, table_id: str) -> List[Dict]:
         """Get all rows from a table"""
-        blocks_url = f"{self.BASE_URL}/blocks/{table_id}/children"
-        headers = {
-            "accept": "application/json",
-            "authorization": f"Bearer {self.NOTION_TOKEN}",
-            "Notion-Version": "2025-09-03"
-        }
-        
-        try:
-            response = requests.get(url=blocks_url, headers=headers)
-            data = response.json()
-            return data.get('results', [])
-        except Exception:
-            return []
+        return self._list_children(table_id)
     
     def _parse_table_row(self, block: Dict) -> str:
         """Parse table row block"""
@@ -363,15 +499,9 @@ class NotionPageExporter:
         return ""
 
     def list_workspace_pages(self) -> json:
-        search_url = f"{self.BASE_URL}/search"
         payload = { "page_size": 100 }
-        headers = {"accept": "application/json", "content-type": "application/json", "authorization": f"Bearer {self.NOTION_TOKEN}", "Notion-Version": "2025-09-03"}
 
-        response = requests.post(
-            url=search_url,
-            json=payload,
-            headers=headers,
-        )
+        response = self.client.post("/search", json=payload)
         return response.json()
 
 # test method
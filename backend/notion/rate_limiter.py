@@ -0,0 +1,93 @@
+import threading
+import time
+
+from RAG.config import get_float_env, get_int_env
+
+# Notion allows an average of ~3 requests per second per integration and answers bursts above
+# that with 429 + Retry-After. Every Notion call in the process goes through one token bucket
+# (see NotionClient.request) so concurrent page fetches share that budget instead of each worker
+# tripping the limit.
+
+
+def get_notion_workers() -> int:
+    """Return how many Notion pages to fetch concurrently (NOTION_WORKERS)"""
+    return max(get_int_env("NOTION_WORKERS", 4), 1)
+
+
+def get_block_workers() -> int:
+    """Return how many block-children requests may be in flight at once (NOTION_BLOCK_WORKERS)"""
+    return max(get_int_env("NOTION_BLOCK_WORKERS", 4), 1)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `acquire` blocks until a request may be sent"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self) -> float:
+        """Take one token, sleeping while the bucket is empty or paused; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.requests += 1
+                    self.wait_seconds += waited
+                    return waited
+                else:
+                    delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens to every worker for `seconds` (used on 429)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self.throttled += 1
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self) -> dict[str, int | float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+_limiter: TokenBucket | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucket:
+    """Return the process-wide Notion limiter (NOTION_REQUESTS_PER_SECOND, default 3)"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenBucket(rate=get_float_env("NOTION_REQUESTS_PER_SECOND", 3.0))
+        return _limiter
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import hmac
+import time
+from typing import Any, Awaitable, Callable
+
+# Notion webhook events carry ids, not content: an event only tells us which page to re-export.
+# Notion sends several events while a page is being edited, so events are debounced per page and
+# a page is processed once it has been quiet for `debounce_seconds` (or after `max_delay_seconds`
+# for pages that never go quiet). Batches run under `lock`, which the polling import also holds for
+# its whole run, so a poll's listing snapshot and reconciliation never interleave with webhook writes.
+
+# events after which the page must be re-exported
+PAGE_UPSERT_EVENTS = {
+    "page.created",
+    "page.content_updated",
+    "page.properties_updated",
+    "page.moved",
+    "page.undeleted",
+}
+# events after which the page's documents must be removed
+PAGE_DELETE_EVENTS = {"page.deleted"}
+
+
+def verify_signature(body: bytes, signature: str | None, verification_token: str) -> bool:
+    """Check X-Notion-Signature (`sha256=<hex HMAC of the raw body keyed by the verification token>`)"""
+    if not signature:
+        return False
+
+    expected = "sha256=" + hmac.new(verification_token.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def page_change(event: dict[str, Any]) -> tuple[str, bool] | None:
+    """Return (page id, deleted) for a page event, or None for events that do not affect the index"""
+    entity = event.get("entity") or {}
+    if entity.get("type") != "page" or not entity.get("id"):
+        return None
+
+    event_type = event.get("type")
+    if event_type in PAGE_DELETE_EVENTS:
+        return entity["id"], True
+    if event_type in PAGE_UPSERT_EVENTS:
+        return entity["id"], False
+    return None
+
+
+class PageChangeQueue:
+    """Per-page debounce queue drained by `run` on the event loop"""
+
+    def __init__(self, debounce_seconds: float = 30.0, max_delay_seconds: float = 300.0, lock: asyncio.Lock | None = None):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max(max_delay_seconds, debounce_seconds)
+        self.lock = lock or asyncio.Lock()
+        # page id -> [first event time, last event time, deleted]
+        self._pending: dict[str, list] = {}
+        self._wakeup = asyncio.Event()
+
+        self.received = 0
+        self.coalesced = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.failed_batches = 0
+
+    def enqueue(self, page_id: str, deleted: bool = False) -> None:
+        """Record a change; the latest event decides whether the page is re-exported or removed"""
+        now = time.monotonic()
+        self.received += 1
+        pending = self._pending.get(page_id)
+        if pending is None:
+            self._pending[page_id] = [now, now, deleted]
+        else:
+            self.coalesced += 1
+            pending[1] = now
+            pending[2] = deleted
+        self._wakeup.set()
+
+    def _due_at(self, pending: list) -> float:
+        first_seen, last_seen, _ = pending
+        return min(last_seen + self.debounce_seconds, first_seen + self.max_delay_seconds)
+
+    def pop_due(self, now: float | None = None) -> tuple[list[str], list[str]]:
+        """Remove and return (page ids to re-export, page ids to delete) whose debounce has expired"""
+        now = time.monotonic() if now is None else now
+        upserts, deletes = [], []
+        for page_id, pending in list(self._pending.items()):
+            if self._due_at(pending) <= now:
+                del self._pending[page_id]
+                (deletes if pending[2] else upserts).append(page_id)
+        return upserts, deletes
+
+    def _next_due_in(self) -> float | None:
+        if not self._pending:
+            return None
+        return max(min(self._due_at(pending) for pending in self._pending.values()) - time.monotonic(), 0.0)
+
+    async def run(self, process: Callable[[list[str], list[str]], Awaitable[None]]) -> None:
+        """Hand due pages to `process(upserts, deletes)` until cancelled"""
+        while True:
+            self._wakeup.clear()
+            timeout = self._next_due_in()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            async with self.lock:
+                # popped once the lock is held: events that arrived while a poll ran join this batch
+                upserts, deletes = self.pop_due()
+                if not upserts and not deletes:
+                    continue
+                try:
+                    await process(upserts, deletes)
+                    self.upserted += len(upserts)
+                    self.deleted += len(deletes)
+                except Exception as exc:
+                    # the polling safety net picks the pages up later
+                    self.failed_batches += 1
+                    print(f"Error processing Notion webhook batch ({len(upserts)} updated, {len(deletes)} deleted pages): {exc}")
+
+    def snapshot(self) -> dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "upserted": self.upserted,
+            "deleted": self.deleted,
+            "failed_batches": self.failed_batches,
+        }
@@ -0,0 +1,83 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import requests
+from dotenv import load_dotenv
+
+# Local stand-in for Notion: posts recorded webhook payloads to the RAG API, signed the way Notion
+# signs them, so /notionWebhook and the debounce queue can be exercised without a public endpoint.
+
+
+def load_events(path: str) -> list[dict]:
+    """Read events from a JSON array or a JSON-lines file"""
+    with open(path, "r") as f:
+        content = f.read().strip()
+
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def sign(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def replay_events(events: list[dict], api_url: str, secret: str, delay: float = 0.0) -> int:
+    """Post every event and return how many were accepted"""
+    endpoint = f"{api_url}/notionWebhook"
+    accepted = 0
+    for i, event in enumerate(events, 1):
+        body = json.dumps(event).encode()
+        response = requests.post(
+            endpoint,
+            data=body,
+            headers={"Content-Type": "application/json", "X-Notion-Signature": sign(body, secret)},
+            timeout=30
+        )
+        entity = event.get("entity", {})
+        print(f"  {i}. {event.get('type')} {entity.get('type')} {entity.get('id')} -> {response.status_code} {response.text}")
+        if response.status_code == 200:
+            accepted += 1
+        if delay:
+            time.sleep(delay)
+    return accepted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded Notion webhook events against the RAG API")
+    parser.add_argument(
+        "events",
+        nargs="?",
+        default="notion/sample_events/webhook_events.json",
+        help="JSON array or JSON-lines file of webhook payloads (default: notion/sample_events/webhook_events.json)"
+    )
+    parser.add_argument(
+        "--api-url",
+        default="http://localhost:7007",
+        help="Base URL of the RAG API server (default: http://localhost:7007)"
+    )
+    parser.add_argument("--secret", default=None, help="Signing secret (default: NOTION_WEBHOOK_SECRET)")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait between events (default: 0)")
+    parser.add_argument("--repeat", type=int, default=1, help="Send the whole file this many times to simulate bursts (default: 1)")
+
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    secret = args.secret or os.getenv("NOTION_WEBHOOK_SECRET")
+    if not secret:
+        print("❌ No signing secret: pass --secret or set NOTION_WEBHOOK_SECRET")
+        exit(1)
+
+    events = load_events(args.events) * max(args.repeat, 1)
+    print(f"🔄 Replaying {len(events)} Notion webhook events to {args.api_url}")
+    try:
+        accepted = replay_events(events, args.api_url, secret, delay=args.delay)
+    except requests.exceptions.ConnectionError:
+        print(f"❌ Could not connect to API at {args.api_url}")
+        exit(1)
+    print(f"✅ {accepted} of {len(events)} events accepted")
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+from typing import Callable, NamedTuple
+
+import pytest
+
+from models import MessageData, MessageJson, MessageMetadata
+
+START = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class SampleTexts(NamedTuple):
+    original: str
+    # the original with trailing punctuation: a near-duplicate
+    near_copy: str
+    unrelated: str
+
+
+def whitespace_tokens(text_value: str) -> list[str]:
+    return text_value.split()
+
+
+@pytest.fixture
+def words() -> Callable[[str], list[str]]:
+    """Tokenizer counting one token per whitespace-separated word, so budgets are easy to follow"""
+    return whitespace_tokens
+
+
+@pytest.fixture
+def samples() -> SampleTexts:
+    return SampleTexts(
+        original="The deploy failed because the database migration timed out on the staging cluster",
+        near_copy="The deploy failed because the database migration timed out on the staging cluster!!",
+        unrelated="Does anyone know where the design review notes for the onboarding flow are kept",
+    )
+
+
+@pytest.fixture
+def make_message() -> Callable[..., MessageJson]:
+    """Build a Discord message `seconds` after a fixed start time"""
+
+    def make(message_id: str, content: str, seconds: float = 0, channel_id: str = "channel", sender: str = "alice") -> MessageJson:
+        return MessageJson(
+            data=MessageData(senderNickname=None, senderUsername=sender, channelName="general", content=content),
+            metadata=MessageMetadata(
+                messageId=message_id,
+                channelId=channel_id,
+                senderId=sender,
+                serverId="server",
+                dateTime=START + timedelta(seconds=seconds),
+            ),
+        )
+
+    return make
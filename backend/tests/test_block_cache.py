@@ -0,0 +1,197 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import notion.block_cache as block_cache_module
+import notion.notion_page_exporter as page_exporter_module
+from notion.block_cache import EDIT_TIME_SETTLE_SECONDS, BlockCache
+from notion.notion_page_exporter import NotionPageExporter
+
+
+def _paragraph(block_id: str, text_value: str, edited: str = "2024-01-01T00:00:00.000Z") -> dict:
+    return {
+        "id": block_id,
+        "type": "paragraph",
+        "has_children": False,
+        "last_edited_time": edited,
+        "paragraph": {"rich_text": [{"plain_text": text_value}]},
+    }
+
+
+def _toggle(block_id: str, edited: str = "2024-01-01T00:00:00.000Z") -> dict:
+    return {
+        "id": block_id,
+        "type": "toggle",
+        "has_children": True,
+        "last_edited_time": edited,
+        "toggle": {"rich_text": [{"plain_text": "Details"}]},
+    }
+
+
+class FakeResponse:
+    def __init__(self, payload: dict):
+        self.payload = payload
+
+    def json(self) -> dict:
+        return self.payload
+
+
+class FakeNotionClient:
+    """Serves /blocks/{id}/children from a dict (a dict value is returned as the body) and counts the calls"""
+
+    def __init__(self, children: dict[str, list[dict] | dict]):
+        self.children = children
+        self.calls: list[str] = []
+
+    def get(self, path: str, params: dict | None = None) -> FakeResponse:
+        self.calls.append(path)
+        children = self.children[path.split("/")[2]]
+        if isinstance(children, dict):
+            # an error body
+            return FakeResponse(children)
+        return FakeResponse({"results": [dict(block) for block in children], "has_more": False})
+
+
+@pytest.fixture
+def cache(tmp_path) -> BlockCache:
+    return BlockCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+
+
+@pytest.fixture
+def exporter(monkeypatch, cache):
+    client = FakeNotionClient({
+        "page": [_paragraph("intro", "Intro"), _toggle("toggle")],
+        "toggle": [_paragraph("nested", "Old answer")],
+    })
+    monkeypatch.setattr(page_exporter_module, "get_notion_client", lambda: client)
+    monkeypatch.setattr(page_exporter_module, "get_block_cache", lambda: cache)
+    return NotionPageExporter()
+
+
+def test_get_misses_until_put(cache):
+    assert cache.get("block", "2024-01-01T00:00:00.000Z") is None
+
+    cache.put("block", "2024-01-01T00:00:00.000Z", [{"id": "child"}])
+
+    assert cache.get("block", "2024-01-01T00:00:00.000Z") == [{"id": "child"}]
+    assert cache.snapshot() == {"hits": 1, "misses": 1, "writes": 1, "evictions": 0}
+
+
+def test_entries_without_timestamp_are_not_cached(cache):
+    cache.put("block", None, [{"id": "child"}])
+
+    assert cache.get("block", None) is None
+    assert cache.snapshot()["writes"] == 0
+
+
+def test_put_replaces_older_versions(cache):
+    cache.put("block", "2024-01-01T00:00:00.000Z", [{"id": "old"}])
+    cache.put("block", "2024-01-02T00:00:00.000Z", [{"id": "new"}])
+
+    assert cache.get("block", "2024-01-01T00:00:00.000Z") is None
+    assert cache.get("block", "2024-01-02T00:00:00.000Z") == [{"id": "new"}]
+
+
+def test_put_keeps_in_progress_writes(cache):
+    cache.put("block", "2024-01-01T00:00:00.000Z", [{"id": "old"}])
+    # another thread's write of a newer version, not yet renamed into place
+    in_progress = os.path.join(cache._block_dir("block"), "2024-01-03T00_00_00.000Z.json.1234.tmp")
+    with open(in_progress, "w") as f:
+        f.write("[]")
+
+    cache.put("block", "2024-01-02T00:00:00.000Z", [{"id": "new"}])
+
+    assert os.path.exists(in_progress)
+
+
+def test_evict_removes_least_recently_used_first(tmp_path):
+    cache = BlockCache(str(tmp_path / "cache"), max_bytes=10_000)
+    payload = [{"text": "x" * 1000}]
+    for index, block_id in enumerate(["a", "b", "c"]):
+        cache.put(block_id, "2024-01-01T00:00:00.000Z", payload)
+        os.utime(cache._entry_path(block_id, "2024-01-01T00:00:00.000Z"), (1000 + index, 1000 + index))
+    # reading "a" marks it as recently used
+    cache.get("a", "2024-01-01T00:00:00.000Z")
+
+    cache.max_bytes = 1500
+    cache.evict()
+
+    assert cache.get("b", "2024-01-01T00:00:00.000Z") is None
+    assert cache.get("c", "2024-01-01T00:00:00.000Z") is None
+    assert cache.get("a", "2024-01-01T00:00:00.000Z") == payload
+    assert cache.snapshot()["evictions"] == 2
+
+
+def test_evict_ignores_in_progress_writes(tmp_path):
+    cache = BlockCache(str(tmp_path / "cache"), max_bytes=10_000)
+    cache.put("a", "2024-01-01T00:00:00.000Z", [{"text": "x" * 1000}])
+    in_progress = os.path.join(cache._block_dir("a"), "2024-01-02T00_00_00.000Z.json.1234.tmp")
+    with open(in_progress, "w") as f:
+        f.write("x" * 5000)
+
+    cache.max_bytes = 100
+    cache.evict()
+
+    assert os.path.exists(in_progress)
+
+
+def test_unchanged_page_is_served_from_cache(exporter):
+    sections = list(exporter.iter_page_sections("page", "2024-01-01T00:00:00.000Z"))
+    calls = len(exporter.client.calls)
+
+    assert list(exporter.iter_page_sections("page", "2024-01-01T00:00:00.000Z")) == sections
+    assert len(exporter.client.calls) == calls
+
+
+def test_nested_edit_is_refetched_when_parent_timestamp_is_unchanged(exporter):
+    first = "\n\n".join(exporter.iter_page_sections("page", "2024-01-01T00:00:00.000Z"))
+    # the nested block changes; the toggle's own last_edited_time does not, the page's does
+    exporter.client.children["toggle"] = [_paragraph("nested", "New answer", edited="2024-01-02T00:00:00.000Z")]
+
+    second = "\n\n".join(exporter.iter_page_sections("page", "2024-01-02T00:00:00.000Z"))
+
+    assert "Old answer" in first
+    assert "New answer" in second and "Old answer" not in second
+
+
+def test_failed_listing_raises_and_is_not_cached(exporter):
+    exporter.client.children["toggle"] = {"object": "error", "status": 502}
+
+    with pytest.raises(ValueError):
+        list(exporter.iter_page_sections("page", "2024-01-01T00:00:00.000Z"))
+    assert exporter.block_cache.get("toggle", "2024-01-01T00:00:00.000Z") is None
+
+
+def test_page_edited_within_the_last_minute_is_not_cached(cache, monkeypatch):
+    edited = "2024-01-01T00:00:00.000Z"
+    edited_at = datetime.fromisoformat(edited.replace("Z", "+00:00")).timestamp()
+    monkeypatch.setattr(block_cache_module.time, "time", lambda: edited_at + 30)
+
+    cache.put("block", edited, [{"id": "child"}])
+
+    assert cache.snapshot()["writes"] == 0
+    # a second edit in the same minute keeps the timestamp; the cache must not answer for it
+    monkeypatch.setattr(block_cache_module.time, "time", lambda: edited_at + EDIT_TIME_SETTLE_SECONDS)
+    cache.put("block", edited, [{"id": "child"}, {"id": "added"}])
+    assert cache.get("block", edited) == [{"id": "child"}, {"id": "added"}]
+
+
+def test_second_edit_in_the_same_minute_is_refetched(exporter, monkeypatch):
+    edited = "2024-01-01T00:00:00.000Z"
+    edited_at = datetime.fromisoformat(edited.replace("Z", "+00:00")).timestamp()
+    monkeypatch.setattr(block_cache_module.time, "time", lambda: edited_at + 20)
+    first = "\n\n".join(exporter.iter_page_sections("page", edited))
+    exporter.client.children["toggle"] = [_paragraph("nested", "New answer")]
+
+    second = "\n\n".join(exporter.iter_page_sections("page", edited))
+
+    assert "Old answer" in first
+    assert "New answer" in second
+
+
+def test_unparsable_edit_time_is_not_cached(cache):
+    cache.put("block", "yesterday", [{"id": "child"}])
+
+    assert cache.get("block", "yesterday") is None
+    assert cache.snapshot()["writes"] == 0
@@ -0,0 +1,114 @@
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from RAG.context_packer import ELLIPSIS, ContextPacker, split_passage
+from RAG.minhash import MinHasher
+
+HEADER = "Title: Deploy guide\nAuthor: Sam\nContent: "
+
+
+def _node(text_value: str, score: float = 1.0) -> NodeWithScore:
+    return NodeWithScore(node=TextNode(text=text_value), score=score)
+
+
+@pytest.fixture
+def make_packer(words):
+    """Build a packer with every limit disabled except those passed"""
+
+    def make(**kwargs) -> ContextPacker:
+        settings = {"max_tokens": 0, "passage_tokens": 0, "duplicate_threshold": 1.1, "min_passage_tokens": 1}
+        return ContextPacker(words, **{**settings, **kwargs})
+
+    return make
+
+
+def test_split_passage_keeps_the_header():
+    assert split_passage(HEADER + "Body text") == (HEADER, "Body text")
+    assert split_passage("No header here") == ("", "No header here")
+
+
+def test_disabled_limits_keep_every_passage_verbatim(make_packer, samples):
+    nodes = [_node(samples.original), _node(samples.original), _node(samples.unrelated)]
+
+    packed = make_packer().pack("deploy", nodes)
+
+    assert packed.nodes == nodes
+    assert packed.passages == [samples.original, samples.original, samples.unrelated]
+    assert packed.saved_tokens == 0
+
+
+def test_passage_exactly_filling_the_budget_is_kept_whole(make_packer):
+    exact = " ".join(f"word{index}" for index in range(10))
+    nodes = [_node(exact), _node("one more passage")]
+
+    packed = make_packer(max_tokens=10).pack("word", nodes)
+
+    assert packed.passages == [exact]
+    assert packed.truncated == 0
+    assert packed.dropped_over_budget == 1
+    assert packed.tokens_after == 10
+
+
+def test_near_duplicate_is_dropped_and_its_source_removed(make_packer, samples):
+    nodes = [
+        _node(HEADER + samples.original),
+        _node("Title: Other page\nContent: " + samples.near_copy),
+        _node(HEADER + samples.unrelated),
+    ]
+
+    packed = make_packer(duplicate_threshold=0.9).pack("deploy", nodes)
+
+    assert packed.nodes == [nodes[0], nodes[2]]
+    assert packed.dropped_duplicates == 1
+    assert "Source 2:\n" + HEADER + samples.unrelated in packed.context_str()
+
+
+def test_duplicate_threshold_is_inclusive(make_packer, samples):
+    minhasher = MinHasher()
+    similarity = minhasher.similarity(minhasher.signature(samples.original), minhasher.signature(samples.near_copy))
+    nodes = [_node(samples.original), _node(samples.near_copy)]
+
+    assert make_packer(duplicate_threshold=similarity, minhasher=minhasher).pack("deploy", nodes).dropped_duplicates == 1
+    assert make_packer(duplicate_threshold=similarity + 0.01, minhasher=minhasher).pack("deploy", nodes).dropped_duplicates == 0
+
+
+def test_long_passage_is_cut_around_the_query_match(make_packer):
+    body = "Intro sentence one here. Unrelated filler two here. The rollback command is documented below. Closing sentence four here. Final sentence five here."
+    packer = make_packer(passage_tokens=15)
+
+    truncated = packer.truncate("how do I rollback", HEADER + body, 15)
+
+    assert truncated.startswith(HEADER + ELLIPSIS)
+    assert "The rollback command is documented below." in truncated
+    assert truncated.endswith(ELLIPSIS)
+    assert "Intro" not in truncated
+    assert packer.count(truncated) <= 15
+
+
+def test_truncation_is_counted_in_the_stats(make_packer):
+    body = " ".join(f"Sentence number {index} about deploys." for index in range(20))
+    node = _node(HEADER + body)
+
+    packed = make_packer(passage_tokens=30).pack("deploys", [node])
+
+    assert packed.truncated == 1
+    assert packed.tokens_after <= 30
+    assert packed.stats()["saved_tokens"] == packed.tokens_before - packed.tokens_after > 0
+
+
+def test_remainder_below_min_passage_tokens_drops_the_passage(make_packer):
+    first = " ".join(f"word{index}" for index in range(8))
+    second = " ".join(f"other{index}" for index in range(8))
+
+    dropped = make_packer(max_tokens=12, min_passage_tokens=5).pack("word", [_node(first), _node(second)])
+    cut = make_packer(max_tokens=12, min_passage_tokens=4).pack("word", [_node(first), _node(second)])
+
+    assert dropped.passages == [first]
+    assert dropped.dropped_over_budget == 1
+    assert len(cut.passages) == 2
+    assert cut.truncated == 1
+
+
+@pytest.mark.parametrize("max_tokens", [1, 3])
+def test_budget_smaller_than_the_header_keeps_only_the_header(max_tokens, make_packer, samples):
+    assert make_packer().truncate("deploy", HEADER + samples.original, max_tokens) == HEADER
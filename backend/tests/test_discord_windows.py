@@ -0,0 +1,79 @@
+import pytest
+
+from RAG.discord_windows import WindowAssigner, build_window_document, message_line
+
+
+@pytest.fixture
+def assigner(words) -> WindowAssigner:
+    # message lines are "[date time] alice: <content>": 3 words + the content + 1 for the newline
+    return WindowAssigner(gap_seconds=600, max_tokens=20, tokenizer=words)
+
+
+def _ids(windows: dict) -> dict[str, list[str]]:
+    return {window_id: [message.metadata.messageId for message in members] for window_id, members in windows.items()}
+
+
+def test_messages_within_the_gap_share_a_window(assigner, make_message):
+    messages = [make_message("1", "hi"), make_message("2", "hello", 60), make_message("3", "yo", 600)]
+
+    assert _ids(assigner.assign(messages)) == {"1": ["1", "2", "3"]}
+
+
+def test_a_pause_longer_than_the_gap_starts_a_new_window(assigner, make_message):
+    messages = [make_message("1", "hi"), make_message("2", "hello", 60), make_message("3", "later", 661)]
+
+    assert _ids(assigner.assign(messages)) == {"1": ["1", "2"], "3": ["3"]}
+
+
+def test_window_closes_when_the_budget_is_exactly_full(assigner, make_message):
+    # 5 + 7 + 8 = 20 tokens fill the budget exactly; the next message opens a new window
+    messages = [
+        make_message("1", "one"),
+        make_message("2", "two more words", 1),
+        make_message("3", "three more words here", 2),
+        make_message("4", "four", 3),
+    ]
+    assert [assigner.count_tokens(message) for message in messages] == [5, 7, 8, 5]
+
+    assert _ids(assigner.assign(messages)) == {"1": ["1", "2", "3"], "4": ["4"]}
+
+
+def test_messages_are_grouped_in_time_order(assigner, make_message):
+    messages = [make_message("2", "second", 30), make_message("1", "first"), make_message("3", "third", 5000)]
+
+    assert _ids(assigner.assign(messages)) == {"1": ["1", "2"], "3": ["3"]}
+
+
+def test_new_messages_extend_the_open_window(assigner, make_message):
+    open_window = [make_message("1", "hi"), make_message("2", "hello", 60)]
+
+    windows = assigner.assign([make_message("3", "yo", 120)], open_window=open_window, open_window_id="1")
+
+    assert _ids(windows) == {"1": ["1", "2", "3"]}
+
+
+def test_open_window_is_not_returned_when_nothing_joins_it(assigner, make_message):
+    open_window = [make_message("1", "hi")]
+
+    windows = assigner.assign([make_message("2", "much later", 5000)], open_window=open_window, open_window_id="1")
+
+    assert _ids(windows) == {"2": ["2"]}
+
+
+def test_backfilled_message_never_joins_the_open_window(assigner, make_message):
+    open_window = [make_message("2", "hello", 60)]
+
+    windows = assigner.assign([make_message("1", "older", 30)], open_window=open_window, open_window_id="2")
+
+    assert _ids(windows) == {"1": ["1"]}
+
+
+def test_window_document_lists_its_members(make_message):
+    messages = [make_message("1", "hi"), make_message("2", "hello", 60)]
+
+    document = build_window_document("1", messages)
+
+    assert document.text == "Channel: general\n" + "\n".join(message_line(message) for message in messages)
+    assert document.metadata["messageIds"] == ["1", "2"]
+    assert document.metadata["windowId"] == "1"
+    assert "messageIds" in document.excluded_embed_metadata_keys
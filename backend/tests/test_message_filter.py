@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+from RAG.message_filter import FILTER_NEAR_DUPLICATE, FILTER_NO_TEXT, FILTER_TOO_SHORT, MessageFilter, message_words
+from RAG.minhash import MinHasher, normalize_text
+
+
+@pytest.fixture
+def minhasher() -> MinHasher:
+    return MinHasher(num_perm=128)
+
+
+def test_normalize_text_ignores_case_and_whitespace():
+    assert normalize_text("  Hello\n\tWORLD  ") == "hello world"
+
+
+def test_formatting_changes_give_the_same_signature(minhasher, samples):
+    assert np.array_equal(minhasher.signature(samples.original), minhasher.signature(samples.original.upper().replace(" ", "\n ")))
+
+
+def test_same_seed_gives_comparable_signatures(samples):
+    assert np.array_equal(MinHasher(seed=7).signature(samples.original), MinHasher(seed=7).signature(samples.original))
+
+
+def test_similarity_separates_near_copies_from_unrelated_text(minhasher, samples):
+    original = minhasher.signature(samples.original)
+
+    assert minhasher.similarity(original, minhasher.signature(samples.near_copy)) > 0.8
+    assert minhasher.similarity(original, minhasher.signature(samples.unrelated)) < 0.2
+
+
+def test_max_similarity_is_the_best_row(minhasher, samples):
+    signature = minhasher.signature(samples.original)
+    others = np.stack([minhasher.signature(samples.unrelated), signature])
+
+    assert minhasher.max_similarity(signature, others) == 1.0
+    assert minhasher.max_similarity(signature, np.empty((0, minhasher.num_perm), dtype=np.uint64)) == 0.0
+
+
+def test_message_words_skip_links_and_markup():
+    assert message_words("<@123> see https://example.com/a?b=1 <:party:456> 🎉 ok") == ["see", "ok"]
+
+
+def test_messages_without_text_are_filtered(make_message, words):
+    message_filter = MessageFilter(words)
+
+    assert message_filter.check(make_message("1", "🎉🎉")) == FILTER_NO_TEXT
+    assert message_filter.check(make_message("2", "https://example.com/page")) == FILTER_NO_TEXT
+    assert message_filter.check(make_message("3", "<@123> <#456>")) == FILTER_NO_TEXT
+
+
+def test_messages_below_min_tokens_are_filtered(make_message, words):
+    message_filter = MessageFilter(words, min_tokens=3)
+
+    assert message_filter.check(make_message("1", "sounds good")) == FILTER_TOO_SHORT
+    assert message_filter.check(make_message("2", "sounds good to me")) is None
+
+
+def test_near_duplicate_in_the_same_channel_is_filtered(make_message, words, samples):
+    message_filter = MessageFilter(words)
+
+    assert message_filter.check(make_message("1", samples.original)) is None
+    assert message_filter.check(make_message("2", samples.near_copy)) == FILTER_NEAR_DUPLICATE
+    assert message_filter.check(make_message("3", samples.near_copy, channel_id="other")) is None
+    assert message_filter.check(make_message("4", samples.unrelated)) is None
+
+
+def test_duplicate_threshold_is_inclusive(minhasher, make_message, words, samples):
+    similarity = minhasher.similarity(minhasher.signature(samples.original), minhasher.signature(samples.near_copy))
+    at_threshold = MessageFilter(words, duplicate_threshold=similarity, minhasher=minhasher)
+    above_threshold = MessageFilter(words, duplicate_threshold=similarity + 0.01, minhasher=minhasher)
+
+    for message_filter in (at_threshold, above_threshold):
+        message_filter.check(make_message("1", samples.original))
+
+    assert at_threshold.check(make_message("2", samples.near_copy)) == FILTER_NEAR_DUPLICATE
+    assert above_threshold.check(make_message("2", samples.near_copy)) is None
+
+
+def test_threshold_above_one_disables_dedupe(make_message, words, samples):
+    message_filter = MessageFilter(words, duplicate_threshold=1.1)
+
+    assert message_filter.check(make_message("1", samples.original)) is None
+    assert message_filter.check(make_message("2", samples.original)) is None
+
+
+def test_edits_are_not_matched_against_history(make_message, words, samples):
+    message_filter = MessageFilter(words)
+    message_filter.check(make_message("1", samples.original))
+
+    assert message_filter.check(make_message("1", samples.near_copy), check_duplicates=False) is None
+
+
+def test_history_keeps_only_the_latest_messages(make_message, words, samples):
+    message_filter = MessageFilter(words, history_size=1)
+    message_filter.check(make_message("1", samples.original))
+    message_filter.check(make_message("2", samples.unrelated))
+
+    assert message_filter.check(make_message("3", samples.original)) is None
+
+
+def test_snapshot_counts_filtered_messages_and_tokens(make_message, words, samples):
+    message_filter = MessageFilter(words)
+    message_filter.check(make_message("1", samples.original))
+    message_filter.check(make_message("2", samples.original))
+    message_filter.check(make_message("3", "ok"))
+
+    assert message_filter.snapshot() == {
+        "checked": 3,
+        "embedded": 1,
+        "filtered": {FILTER_NEAR_DUPLICATE: 1, FILTER_TOO_SHORT: 1},
+        "saved_embeddings": 2,
+        "saved_tokens": len(samples.original.split()) + 1,
+    }
@@ -0,0 +1,67 @@
+import httpx
+import pytest
+
+import notion.client as client_module
+from notion.client import NOTION_BASE_URL, NotionClient, endpoint_for
+from notion.rate_limiter import TokenBucket
+
+PAGE_ID = "0123456789abcdef0123456789abcdef"
+
+
+def _client(handler, max_retries: int = 2) -> NotionClient:
+    client = NotionClient(token="secret", limiter=TokenBucket(rate=1000.0), max_retries=max_retries, max_connections=1)
+    client._client = httpx.Client(base_url=NOTION_BASE_URL, transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(client_module.time, "sleep", lambda seconds: None)
+
+
+def test_endpoint_groups_ids():
+    assert endpoint_for("get", f"/blocks/{PAGE_ID}/children?page_size=100") == "GET /blocks/{id}/children"
+
+
+def test_success_is_returned():
+    client = _client(lambda request: httpx.Response(200, json={"results": [{"id": "block"}], "has_more": False}))
+
+    assert client.get(f"/blocks/{PAGE_ID}/children").json()["results"] == [{"id": "block"}]
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 409])
+def test_client_errors_raise_without_retrying(status):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(status, json={"object": "error", "status": status})
+
+    client = _client(handler)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        client.get(f"/blocks/{PAGE_ID}/children")
+    assert len(requests) == 1
+    assert client.endpoint_stats()["GET /blocks/{id}/children"]["errors"] == 1
+
+
+def test_server_errors_are_retried():
+    statuses = iter([503, 502, 200])
+    client = _client(lambda request: httpx.Response(next(statuses), json={"results": []}))
+
+    assert client.get("/search").status_code == 200
+    assert client.limiter.snapshot()["retries"] == 2
+
+
+def test_server_error_is_raised_after_the_last_retry():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(500)
+
+    client = _client(handler, max_retries=2)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        client.post("/search", json={})
+    assert len(requests) == 3
@@ -0,0 +1,100 @@
+import httpx
+import pytest
+
+import notion.notion_exporter as exporter_module
+import notion.notion_page_exporter as page_exporter_module
+from notion.notion_exporter import NotionExporter
+
+
+def _page(page_id: str, edited: str) -> dict:
+    return {"object": "page", "id": page_id, "last_edited_time": edited, "properties": {}}
+
+
+class FakeResponse:
+    def __init__(self, payload: dict):
+        self.payload = payload
+
+    def json(self) -> dict:
+        return self.payload
+
+
+class FakeSearchClient:
+    """Serves /search from a list of result pages; an exception in the list is raised instead"""
+
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.calls: list[dict] = []
+
+    def post(self, path: str, json: dict | None = None) -> FakeResponse:
+        self.calls.append(json)
+        response = self.responses[len(self.calls) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(response)
+
+
+@pytest.fixture
+def make_exporter(monkeypatch, tmp_path):
+    def make(responses: list) -> NotionExporter:
+        client = FakeSearchClient(responses)
+        monkeypatch.setattr(exporter_module, "get_notion_client", lambda: client)
+        monkeypatch.setattr(page_exporter_module, "get_notion_client", lambda: client)
+        monkeypatch.setattr(page_exporter_module, "get_block_cache", lambda: None)
+        return NotionExporter(timer_file_path=str(tmp_path / "notion_last_export.txt"))
+
+    return make
+
+
+FIRST_PAGE = {"results": [_page("page-3", "2024-01-03T00:00:00.000Z")], "has_more": True, "next_cursor": "cursor-1"}
+LAST_PAGE = {"results": [_page("page-2", "2024-01-02T00:00:00.000Z"), _page("page-1", "2024-01-01T00:00:00.000Z")], "has_more": False}
+
+
+def test_full_listing_follows_cursors_and_is_complete(make_exporter):
+    exporter = make_exporter([FIRST_PAGE, LAST_PAGE])
+
+    assert exporter.list_live_page_ids() == {"page-1", "page-2", "page-3"}
+    assert exporter.client.calls[1]["start_cursor"] == "cursor-1"
+    assert exporter.listing_stats["complete"]
+    assert exporter.load_last_full_listing() is not None
+
+
+def test_watermark_listing_is_never_complete(make_exporter):
+    exporter = make_exporter([FIRST_PAGE, LAST_PAGE])
+
+    pages = exporter.list_workspace_pages(stop_before="2024-01-01T12:00:00.000Z")
+
+    assert [page["id"] for page in pages] == ["page-3", "page-2"]
+    assert exporter.listing_stats["stopped_early"]
+    assert not exporter.listing_stats["complete"]
+
+
+def test_listing_without_results_is_incomplete(make_exporter):
+    exporter = make_exporter([FIRST_PAGE, {"object": "error", "status": 400}])
+
+    assert exporter.list_live_page_ids() is None
+    assert exporter.load_last_full_listing() is None
+
+
+def test_listing_without_a_cursor_is_incomplete(make_exporter):
+    exporter = make_exporter([{**FIRST_PAGE, "next_cursor": None}])
+
+    assert exporter.list_live_page_ids() is None
+
+
+def test_failed_search_call_aborts_the_listing(make_exporter):
+    request = httpx.Request("POST", "https://api.notion.com/v1/search")
+    error = httpx.HTTPStatusError("400 Bad Request", request=request, response=httpx.Response(400, request=request))
+    exporter = make_exporter([FIRST_PAGE, error])
+
+    with pytest.raises(httpx.HTTPStatusError):
+        exporter.get_changed_page_ids(full_listing=True)
+    assert exporter.live_page_ids is None
+
+
+def test_incomplete_full_listing_leaves_nothing_to_reconcile(make_exporter):
+    exporter = make_exporter([FIRST_PAGE, {**LAST_PAGE, "has_more": True, "next_cursor": None}])
+
+    page_ids = exporter.get_changed_page_ids(full_listing=True)
+
+    assert page_ids == ["page-3", "page-2", "page-1"]
+    assert exporter.live_page_ids is None
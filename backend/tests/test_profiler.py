@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import RAG.profiler as profiler_module
+from RAG.profiler import Capture, ProfileStore, RequestProfiler, StackSampler
+
+
+def _capture(started: float) -> Capture:
+    capture = Capture("/query", task=None, loop=None, loop_thread_id=0)
+    capture.started = started
+    capture.stacks.update({"main;handler;[waiting]": 3, "main;handler": 1})
+    return capture
+
+
+def _save(store: ProfileStore, capture: Capture, mtime: float) -> None:
+    store.save(capture, {"id": capture.id, "started": capture.started})
+    # saves within one test share an mtime otherwise; eviction orders by it
+    os.utime(os.path.join(store.directory, f"{capture.id}.json"), (mtime, mtime))
+
+
+@pytest.fixture
+def store(tmp_path) -> ProfileStore:
+    return ProfileStore(str(tmp_path / "profiles"), max_profiles=2)
+
+
+def test_saved_profile_is_in_collapsed_format(store):
+    capture = _capture(started=1000)
+    _save(store, capture, mtime=1000)
+
+    with open(store.collapsed_path(capture.id)) as f:
+        assert f.read() == "main;handler;[waiting] 3\nmain;handler 1\n"
+    assert store.list() == [{"id": capture.id, "started": 1000}]
+
+
+def test_oldest_profiles_are_evicted_first(store):
+    captures = [_capture(started=1000 + index) for index in range(4)]
+    for index, capture in enumerate(captures):
+        _save(store, capture, mtime=1000 + index)
+
+    assert [profile["id"] for profile in store.list()] == [captures[3].id, captures[2].id]
+    assert store.collapsed_path(captures[0].id) is None
+    assert store.collapsed_path(captures[1].id) is None
+    assert sorted(os.listdir(store.directory)) == sorted(
+        f"{capture.id}.{extension}" for capture in captures[2:] for extension in ("json", "collapsed")
+    )
+
+
+def test_list_is_newest_first_and_skips_unreadable_files(store):
+    older, newer = _capture(started=2000), _capture(started=1000)
+    # saved in the opposite order of their start times
+    _save(store, older, mtime=1000)
+    _save(store, newer, mtime=1001)
+    with open(os.path.join(store.directory, "broken.json"), "w") as f:
+        f.write("{")
+
+    assert [profile["id"] for profile in store.list()] == [older.id, newer.id]
+
+
+@pytest.mark.parametrize("profile_id", [
+    "../../etc/passwd",
+    "0" * 31,
+    "0" * 33,
+    "A" * 32,
+    "0" * 31 + "/",
+    "",
+])
+def test_collapsed_path_rejects_invalid_ids(store, profile_id):
+    assert store.collapsed_path(profile_id) is None
+
+
+def test_collapsed_path_of_a_missing_profile_is_none(store):
+    assert store.collapsed_path("0" * 32) is None
+
+
+def test_slow_requests_are_always_kept(store, monkeypatch):
+    profiler = RequestProfiler(["/query"], sample_rate=0.0, slow_seconds=2.0, sampler=StackSampler(0.01), store=store)
+    monkeypatch.setattr(profiler_module.random, "random", lambda: 0.0)
+
+    assert profiler.keep_reason(2.0) == "slow"
+    assert profiler.keep_reason(1.9) is None
+
+
+def test_fast_requests_are_kept_at_the_sample_rate(store, monkeypatch):
+    profiler = RequestProfiler(["/query"], sample_rate=0.25, slow_seconds=2.0, sampler=StackSampler(0.01), store=store)
+
+    monkeypatch.setattr(profiler_module.random, "random", lambda: 0.24)
+    assert profiler.keep_reason(0.1) == "sampled"
+    monkeypatch.setattr(profiler_module.random, "random", lambda: 0.25)
+    assert profiler.keep_reason(0.1) is None
@@ -0,0 +1,90 @@
+import pytest
+
+import notion.rate_limiter as rate_limiter_module
+from notion.rate_limiter import TokenBucket
+
+
+class FakeClock:
+    """Stands in for time.monotonic/time.sleep: sleeping advances the clock instantly"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter_module.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_full_bucket_allows_a_burst_of_capacity(clock):
+    bucket = TokenBucket(rate=3.0)
+
+    waits = [bucket.acquire() for _ in range(3)]
+
+    assert waits == [0.0, 0.0, 0.0]
+    assert clock.sleeps == []
+
+
+def test_drained_bucket_waits_for_one_token(clock):
+    bucket = TokenBucket(rate=4.0, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+
+    waited = bucket.acquire()
+
+    assert waited == pytest.approx(0.25)
+    assert bucket.snapshot()["wait_seconds"] == pytest.approx(0.25)
+
+
+def test_drained_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+
+    # long enough to refill far more than the capacity
+    clock.now += 60
+
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_pause_blocks_every_caller_until_it_ends(clock):
+    bucket = TokenBucket(rate=3.0)
+    bucket.pause(5.0)
+
+    waited = bucket.acquire()
+
+    assert waited == pytest.approx(5.0)
+    assert bucket.snapshot()["throttled"] == 1
+
+
+def test_overlapping_pauses_keep_the_later_end(clock):
+    bucket = TokenBucket(rate=10.0)
+    bucket.pause(5.0)
+    bucket.pause(1.0)
+
+    assert bucket.acquire() == pytest.approx(5.0)
+
+
+def test_snapshot_counts_requests_and_retries(clock):
+    bucket = TokenBucket(rate=3.0)
+    bucket.acquire()
+    bucket.record_retry()
+
+    assert bucket.snapshot() == {"requests": 1, "throttled": 0, "retries": 1, "wait_seconds": 0.0}
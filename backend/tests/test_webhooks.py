@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import hmac
+
+from notion.webhooks import PageChangeQueue, page_change, verify_signature
+
+TOKEN = "secret_verification_token"
+
+
+def _sign(body: bytes, token: str = TOKEN) -> str:
+    return "sha256=" + hmac.new(token.encode(), body, hashlib.sha256).hexdigest()
+
+
+def _event(event_type: str, entity_type: str = "page", entity_id: str = "page-1") -> dict:
+    return {"type": event_type, "entity": {"type": entity_type, "id": entity_id}}
+
+
+def test_signature_of_the_raw_body_is_accepted():
+    body = b'{"type": "page.content_updated"}'
+
+    assert verify_signature(body, _sign(body), TOKEN)
+
+
+def test_bad_signatures_are_rejected():
+    body = b'{"type": "page.content_updated"}'
+
+    assert not verify_signature(body, None, TOKEN)
+    assert not verify_signature(body, "", TOKEN)
+    assert not verify_signature(body, _sign(body, token="other_token"), TOKEN)
+    assert not verify_signature(body + b" ", _sign(body), TOKEN)
+    assert not verify_signature(body, _sign(body).removeprefix("sha256="), TOKEN)
+
+
+def test_page_change_classifies_events():
+    assert page_change(_event("page.content_updated")) == ("page-1", False)
+    assert page_change(_event("page.created")) == ("page-1", False)
+    assert page_change(_event("page.deleted")) == ("page-1", True)
+
+
+def test_page_change_ignores_other_events():
+    assert page_change(_event("comment.created")) is None
+    assert page_change(_event("database.content_updated", entity_type="database")) is None
+    assert page_change({"type": "page.content_updated", "entity": {"type": "page"}}) is None
+    assert page_change({"type": "page.content_updated"}) is None
+
+
+def test_page_is_due_after_the_debounce():
+    queue = PageChangeQueue(debounce_seconds=30, max_delay_seconds=300)
+    queue.enqueue("page-1")
+    start = queue._pending["page-1"][0]
+
+    assert queue.pop_due(now=start + 29) == ([], [])
+    assert queue.pop_due(now=start + 30) == (["page-1"], [])
+    assert queue.pop_due(now=start + 60) == ([], [])
+
+
+def test_new_events_restart_the_debounce():
+    queue = PageChangeQueue(debounce_seconds=30, max_delay_seconds=300)
+    queue.enqueue("page-1")
+    queue._pending["page-1"][1] += 20
+    last_seen = queue._pending["page-1"][1]
+
+    assert queue.pop_due(now=last_seen + 29) == ([], [])
+    assert queue.pop_due(now=last_seen + 30) == (["page-1"], [])
+
+
+def test_busy_page_is_due_at_the_max_delay():
+    queue = PageChangeQueue(debounce_seconds=30, max_delay_seconds=300)
+    queue.enqueue("page-1")
+    first_seen = queue._pending["page-1"][0]
+    # an event every 10 seconds never lets the debounce expire
+    queue._pending["page-1"][1] = first_seen + 290
+
+    assert queue.pop_due(now=first_seen + 299) == ([], [])
+    assert queue.pop_due(now=first_seen + 300) == (["page-1"], [])
+
+
+def test_max_delay_is_at_least_the_debounce():
+    queue = PageChangeQueue(debounce_seconds=60, max_delay_seconds=10)
+
+    assert queue.max_delay_seconds == 60
+
+
+def test_latest_event_decides_between_upsert_and_delete():
+    queue = PageChangeQueue(debounce_seconds=0, max_delay_seconds=0)
+    queue.enqueue("edited-then-deleted")
+    queue.enqueue("edited-then-deleted", deleted=True)
+    queue.enqueue("deleted-then-restored", deleted=True)
+    queue.enqueue("deleted-then-restored")
+
+    assert queue.pop_due(now=queue._pending["edited-then-deleted"][1] + 1) == (["deleted-then-restored"], ["edited-then-deleted"])
+    assert queue.snapshot()["received"] == 4
+    assert queue.snapshot()["coalesced"] == 2
+
+
+def test_batches_wait_for_a_concurrent_poll():
+    async def scenario() -> list[tuple[str, float]]:
+        lock = asyncio.Lock()
+        queue = PageChangeQueue(debounce_seconds=0.01, max_delay_seconds=0.05, lock=lock)
+        timeline: list[tuple[str, float]] = []
+        loop = asyncio.get_running_loop()
+
+        async def process(upserts: list[str], deletes: list[str]) -> None:
+            timeline.append(("batch start " + ",".join(sorted(upserts + deletes)), loop.time()))
+            await asyncio.sleep(0.02)
+            timeline.append(("batch end", loop.time()))
+
+        async def poll() -> None:
+            async with lock:
+                timeline.append(("poll start", loop.time()))
+                # pages changed while the poll is listing and indexing
+                queue.enqueue("page-1")
+                await asyncio.sleep(0.05)
+                queue.enqueue("page-2")
+                await asyncio.sleep(0.05)
+                timeline.append(("poll end", loop.time()))
+
+        consumer = asyncio.create_task(queue.run(process))
+        await poll()
+        # give the queue time to drain after the poll released the lock
+        await asyncio.sleep(0.1)
+        consumer.cancel()
+        try:
+            await consumer
+        except asyncio.CancelledError:
+            pass
+        return timeline
+
+    timeline = asyncio.run(scenario())
+    events = [event for event, _ in timeline]
+
+    assert events == ["poll start", "poll end", "batch start page-1,page-2", "batch end"]
+    poll_end = dict(timeline)["poll end"]
+    assert all(at >= poll_end for event, at in timeline if event.startswith("batch"))
+
+
+def test_failed_batch_is_counted_and_the_queue_keeps_running():
+    async def scenario() -> PageChangeQueue:
+        queue = PageChangeQueue(debounce_seconds=0.01, max_delay_seconds=0.01)
+        processed: list[list[str]] = []
+
+        async def process(upserts: list[str], deletes: list[str]) -> None:
+            processed.append(upserts)
+            if len(processed) == 1:
+                raise RuntimeError("database unavailable")
+
+        consumer = asyncio.create_task(queue.run(process))
+        queue.enqueue("page-1")
+        await asyncio.sleep(0.05)
+        queue.enqueue("page-2")
+        await asyncio.sleep(0.05)
+        consumer.cancel()
+        try:
+            await consumer
+        except asyncio.CancelledError:
+            pass
+        assert processed == [["page-1"], ["page-2"]]
+        return queue
+
+    snapshot = asyncio.run(scenario()).snapshot()
+
+    assert snapshot["failed_batches"] == 1
+    assert snapshot["upserted"] == 1